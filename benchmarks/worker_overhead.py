@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the per-test overhead of dispatching a job to a freshly spawned
+process, as was done before tests were executed by a pool of workers, versus
+dispatching it to a persistent worker within a `WorkerPool`.
+
+Usage:
+
+    $ python benchmarks/worker_overhead.py [num_jobs]
+"""
+from multiprocessing import Process, Queue
+import statistics
+import sys
+
+from darjeeling.util import Stopwatch
+
+from darjeeling_ardupilot.executor import WorkerPool
+
+
+def noop() -> bool:
+    return True
+
+
+def runner(q: Queue) -> None:
+    # defined at module level so that it can be pickled by the 'spawn' start
+    # method, which is the default on macOS and Windows
+    q.put_nowait(noop())
+
+
+def run_in_fresh_process() -> bool:
+    q: Queue = Queue()
+    p = Process(target=runner, daemon=True, args=(q,))
+    p.start()
+    # the result is read before joining, since a process that has put data
+    # on a queue does not exit until that data has been consumed
+    result = q.get(timeout=30.0)
+    p.join()
+    return result
+
+
+def measure(fn, num_jobs: int):
+    durations = []
+    for _ in range(num_jobs):
+        timer = Stopwatch()
+        timer.start()
+        assert fn()
+        timer.stop()
+        durations.append(timer.duration)
+    return durations
+
+
+def report(name: str, durations) -> None:
+    mean = statistics.mean(durations) * 1000
+    median = statistics.median(durations) * 1000
+    print(f"{name}: mean {mean:.3f} ms, median {median:.3f} ms "
+          f"per job [{len(durations)} jobs]")
+
+
+def main() -> None:
+    num_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    report("fresh process", measure(run_in_fresh_process, num_jobs))
+
+    pool = WorkerPool(size=1)
+    try:
+        # the first job pays the cost of spawning the worker
+        pool.run(noop, 10.0)
+        report("worker pool", measure(lambda: pool.run(noop, 10.0), num_jobs))
+    finally:
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,4 +4,9 @@ logger.disable('darjeeling_ardupilot')
 
 from .core import Monitor, MonitorStatus  # noqa
 from . import util  # noqa
-from .plugin import StartTest, StartTestSuite, StartTestSuiteConfig  # noqa
+from .trajectory import Trajectory, TrajectoryMonitor  # noqa
+from .similarity import SimilarityMonitor  # noqa
+from .online import OnlineMonitor, OnlineOracle  # noqa
+from .corridor import CorridorMonitor  # noqa
+from .plugin import (StartTest, StartTestSuite, StartTestSuiteConfig,  # noqa
+                     StartTestSuiteOutcome)
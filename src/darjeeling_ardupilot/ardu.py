@@ -3,15 +3,19 @@
 This module provides interfaces and data structures for interacting with
 ArduPilot via Dronekit and MAVLink.
 """
-__all__ = ('Mission', 'SITL')
+__all__ = ('Mission', 'MissionAborted', 'SITL', 'SITLReadiness')
 
-from typing import Union, Sequence, Tuple, Optional, Iterator, FrozenSet
+from typing import (Any, Dict, List, Union, Sequence, Tuple, Optional,
+                    Iterator, FrozenSet)
 import os
-import time
 import math
 import contextlib
+import functools
+import hashlib
 import signal
+import struct
 import subprocess
+import threading
 import pkg_resources
 
 from darjeeling import ProgramContainer as DarjeelingContainer
@@ -20,9 +24,32 @@ from darjeeling.util import Stopwatch
 import attr
 import dronekit
 
+from .clock import SimClock
+from .core import Verdict
+from .router import Endpoint, MAVLinkRouter
+from .timing import PhaseTimer
+from .util import wait_till_open, wait_for_heartbeat
+from .upload import (GLOBAL_FRAMES, MissionDownloader, MissionUploader,
+                     to_int_coordinate)
+from .wpl import read_wpl
+
 BIN_MAVPROXY = \
     pkg_resources.resource_filename(__name__, 'data/mavproxy')
 
+# frame, command, param1, param2, param3, param4, x, y, z
+_COMMAND = struct.Struct('<BH7d')
+
+_FLOAT32 = struct.Struct('<f')
+
+# the vehicle reports integer frames using their floating-point equivalents
+_FRAME_EQUIVALENTS = {5: 0, 6: 3, 11: 10}
+
+# the vehicle-reported checksums of missions that have been uploaded by this
+# process, indexed by the digests of those missions. since each worker is a
+# separate process, each worker only knows the checksums of the missions that
+# it uploaded itself; other missions are compared item by item.
+_MISSION_CHECKSUMS: Dict[bytes, int] = {}
+
 
 def distance_metres(x: dronekit.LocationGlobal,
                     y: dronekit.LocationGlobal
@@ -41,6 +68,39 @@ def distance_metres(x: dronekit.LocationGlobal,
     return math.sqrt((d_lat*d_lat) + (d_lon*d_lon)) * 1.113195e5
 
 
+@contextlib.contextmanager
+def notify_on(connection: dronekit.Vehicle,
+              *message_types: str
+              ) -> Iterator[threading.Condition]:
+    """Provides a condition variable that is notified whenever a message of
+    one of the given types is received from the vehicle.
+
+    Since DroneKit updates the state of the vehicle before calling any
+    listeners that are attached afterwards, that state is up to date when
+    a waiter is woken.
+    """
+    condition = threading.Condition()
+
+    def listener(other, name, message) -> None:
+        with condition:
+            condition.notify_all()
+
+    for message_type in message_types:
+        connection.add_message_listener(message_type, listener)
+    try:
+        yield condition
+    finally:
+        for message_type in message_types:
+            connection.remove_message_listener(message_type, listener)
+
+
+class MissionAborted(Exception):
+    """Raised when a mission is ended early by a verdict."""
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"mission aborted: {reason}")
+        self.reason = reason
+
+
 @attr.s(frozen=True, slots=True)
 class Mission(Sequence[dronekit.Command]):
     """Represents a WPL mission."""
@@ -51,6 +111,7 @@ class Mission(Sequence[dronekit.Command]):
         attr.ib(init=False, repr=False, eq=False, hash=False)
     waypoints: FrozenSet[int] = \
         attr.ib(init=False, repr=False, eq=False, hash=False)
+    digest: bytes = attr.ib(init=False, repr=False, eq=False, hash=False)
 
     def __attrs_post_init__(self) -> None:
         cmd_home = self.commands[0]
@@ -62,6 +123,12 @@ class Mission(Sequence[dronekit.Command]):
                            (home_lat, home_lon, home_alt, home_heading))
         object.__setattr__(self, 'waypoints',
                            frozenset(i for i in range(len(self.commands))))
+        digest = hashlib.blake2b(digest_size=16)
+        for c in self.commands:
+            digest.update(_COMMAND.pack(c.frame, c.command, c.param1,
+                                        c.param2, c.param3, c.param4,
+                                        c.x, c.y, c.z))
+        object.__setattr__(self, 'digest', digest.digest())
 
     @commands.validator
     def validate_commands(self, attr, value):
@@ -69,29 +136,39 @@ class Mission(Sequence[dronekit.Command]):
             raise ValueError("mission must have at least one command")
 
     @classmethod
-    def from_file(cls, filename: str) -> 'Mission':
-        logger.debug(f"loading mission file: {filename}")
-        with open(filename, 'r') as f:
-            lines = [l.strip() for l in f]
+    def from_file(cls, filename: str, *, sidecar: bool = True) -> 'Mission':
+        """Loads a mission from a given WPL file.
+
+        Parameters
+        ----------
+        filename: str
+            The path to the WPL file.
+        sidecar: bool
+            If :code:`True`, the parsed mission is cached in a binary sidecar
+            file next to the WPL file.
+        """
         filename = os.path.abspath(filename)
-        return Mission(filename=filename,
-                       commands=[cls.line_to_command(l) for l in lines[1:]])
+        stat = os.stat(filename)
+        return cls._from_file(filename,
+                              stat.st_mtime_ns,
+                              stat.st_size,
+                              sidecar)
 
     @staticmethod
-    def line_to_command(s: str) -> dronekit.Command:
-        """Parses a WPL line to a Dronekit command."""
-        logger.debug(f"parsing command string: {s}")
-        args = s.split()
-        arg_index = int(args[0])
-        arg_currentwp = 0
-        arg_frame = int(args[2])
-        arg_cmd = int(args[3])
-        arg_autocontinue = 0  # not supported by dronekit
-        (p1, p2, p3, p4, x, y, z) = [float(x) for x in args[4:11]]
-        cmd = dronekit.Command(
-            0, 0, 0, arg_frame, arg_cmd, arg_currentwp, arg_autocontinue,
-            p1, p2, p3, p4, x, y, z)
-        return cmd
+    @functools.lru_cache(maxsize=128)
+    def _from_file(filename: str,
+                   mtime_ns: int,
+                   size: int,
+                   sidecar: bool
+                   ) -> 'Mission':
+        """Loads a mission from a WPL file that has a given modification time
+        and size. Missions are cached in memory since they are immutable."""
+        logger.debug(f"loading mission file: {filename}")
+        command = dronekit.Command
+        commands = [command(0, 0, 0, frame, cmd, 0, 0, p1, p2, p3, p4, x, y, z)
+                    for (frame, cmd, p1, p2, p3, p4, x, y, z)
+                    in read_wpl(filename, sidecar=sidecar)]
+        return Mission(filename=filename, commands=commands)
 
     def __getitem__(self, index: Union[int, slice]) -> dronekit.Command:
         """Retrieves the i-th command from this mission."""
@@ -101,13 +178,87 @@ class Mission(Sequence[dronekit.Command]):
         """Returns the number of commands in this mission."""
         return len(self.commands)
 
+    def matches(self, items: Sequence[Any]) -> bool:
+        """Determines whether the items of a mission that was downloaded
+        from a vehicle as MISSION_ITEM_INT messages, excluding its home
+        location, are the same as the items of this mission.
+
+        Items are compared exactly, as they would be sent by
+        :class:`MissionUploader`: latitudes and longitudes are compared as
+        integers in units of 1e-7 degrees, and all other fields are compared
+        as single-precision floats. Items in frames that are not global are
+        never considered to be the same. Since the vehicle may store some
+        fields with less precision, a mission may fail to match itself, in
+        which case it is simply uploaded again.
+        """
+        commands = self.commands[1:]
+        if len(items) != len(commands):
+            return False
+        for item, command in zip(items, commands):
+            if command.frame not in GLOBAL_FRAMES:
+                return False
+            frame = _FRAME_EQUIVALENTS.get(command.frame, command.frame)
+            if item.command != command.command or item.frame != frame:
+                return False
+            if item.x != to_int_coordinate(command.x) \
+                    or item.y != to_int_coordinate(command.y):
+                return False
+            for name in ('param1', 'param2', 'param3', 'param4', 'z'):
+                value, = _FLOAT32.unpack(_FLOAT32.pack(getattr(command, name)))
+                if getattr(item, name) != value:
+                    return False
+        return True
+
+    def is_loaded_on(self,
+                     connection: dronekit.Vehicle,
+                     *,
+                     timeout: float = 30.0
+                     ) -> bool:
+        """Determines whether a given vehicle already stores this mission.
+
+        The number of items and the checksum of the stored mission are
+        requested first, and the mission is not stored if the number of items
+        differs. If the vehicle reports a checksum, and this process has
+        previously uploaded this mission, the checksums are compared.
+        Otherwise, the stored items are downloaded and compared to the items
+        of this mission.
+
+        Since each SITL is only used by a single test, a vehicle only stores
+        a mission before it is uploaded if a previous SITL with the same
+        instance number saved that mission to the EEPROM in its directory
+        (see :attr:`SITL.directory`), which the next SITL loads at boot.
+
+        Raises
+        ------
+        TimeoutError
+            If the stored mission could not be downloaded before the timeout.
+        """
+        checksum = _MISSION_CHECKSUMS.get(self.digest)
+
+        def fetch_items(count: int, opaque_id: int) -> bool:
+            return count == len(self) \
+                and not (opaque_id and checksum is not None)
+
+        downloaded = MissionDownloader(connection).download(
+            timeout=timeout, fetch_items=fetch_items)
+        if downloaded.count != len(self):
+            return False
+        if downloaded.opaque_id and checksum is not None:
+            return downloaded.opaque_id == checksum
+        return self.matches(downloaded.items[1:])
+
     def issue(self,
               connection: dronekit.Vehicle,
               *,
-              timeout: float = 30.0
+              timeout: float = 30.0,
+              phases: Optional[PhaseTimer] = None
               ) -> None:
         """Issues this mission to a given vehicle.
 
+        The mission is only uploaded if the vehicle does not already store
+        it (e.g., because a previous test flew it with the same SITL instance
+        number, and the EEPROM of that instance was kept).
+
         Parameters
         ----------
         connection: dronekit.Vehicle
@@ -115,6 +266,10 @@ class Mission(Sequence[dronekit.Command]):
         timeout: float
             A timeout that is enforced on the process of preparing the vehicle
             and issuing this mission.
+        phases: PhaseTimer, optional
+            A timer that records the time taken to wait for the vehicle to
+            become armable, to determine its home location, to arm it, and to
+            upload this mission.
 
         Raises
         ------
@@ -124,48 +279,61 @@ class Mission(Sequence[dronekit.Command]):
         """
         timer = Stopwatch()
         timer.start()
+        if phases is None:
+            phases = PhaseTimer()
+        phases.mark()
 
         def time_left() -> float:
             return max(0.0, timeout - timer.duration)
 
         logger.debug("waiting for vehicle to be armable")
-        while not connection.is_armable:
-            if timer.duration > timeout:
-                raise TimeoutError
-            time.sleep(0.05)
+        with notify_on(connection,
+                       'HEARTBEAT',
+                       'GPS_RAW_INT',
+                       'EKF_STATUS_REPORT') as condition:
+            with condition:
+                if not condition.wait_for(lambda: connection.is_armable,
+                                          time_left()):
+                    raise TimeoutError
+        phases.lap('armable')
 
         # set home location
         logger.debug("waiting for home location")
-        while not connection.home_location:
-            if timer.duration > timeout:
-                raise TimeoutError
-            vcmds = connection.commands
-            vcmds.download()
-            try:
-                vcmds.wait_ready(timeout=time_left())
-            except dronekit.TimeoutError:
-                raise TimeoutError
-            time.sleep(0.1)
+        with notify_on(connection, 'HOME_POSITION') as condition:
+            while not connection.home_location:
+                if timer.duration > timeout:
+                    raise TimeoutError
+                vcmds = connection.commands
+                vcmds.download()
+                try:
+                    vcmds.wait_ready(timeout=time_left())
+                except dronekit.TimeoutError:
+                    raise TimeoutError
+                if not connection.home_location:
+                    with condition:
+                        condition.wait(min(1.0, time_left()))
         logger.debug(f'determined home location: {connection.home_location}')
+        phases.lap('home')
 
         logger.debug("attempting to arm vehicle")
-        connection.armed = True
-        while not connection.armed:
-            if timer.duration > timeout:
-                raise TimeoutError
-            time.sleep(0.05)
+        with notify_on(connection, 'HEARTBEAT') as condition:
+            connection.armed = True
+            with condition:
+                if not condition.wait_for(lambda: connection.armed,
+                                          time_left()):
+                    raise TimeoutError
         logger.debug("armed vehicle")
+        phases.lap('arm')
 
         # upload mission
-        vcmds = connection.commands
-        vcmds.clear()
-        for command in self:
-            vcmds.add(command)
-        vcmds.upload()
-        try:
-            vcmds.wait_ready(timeout=time_left())
-        except dronekit.TimeoutError:
-            raise TimeoutError
+        if self.is_loaded_on(connection, timeout=time_left()):
+            logger.debug("vehicle already stores mission: skipping upload")
+        else:
+            report = MissionUploader(connection).upload(self.commands,
+                                                        timeout=time_left())
+            if report.opaque_id:
+                _MISSION_CHECKSUMS[self.digest] = report.opaque_id
+        phases.lap('upload')
 
         # start mission
         logger.debug("switching to AUTO mode")
@@ -180,10 +348,17 @@ class Mission(Sequence[dronekit.Command]):
                 *,
                 timeout_setup: float = 90.0,
                 timeout_mission: float = 120.0,
-                timeout_heartbeat: float = 5.0
+                timeout_heartbeat: float = 5.0,
+                clock: Optional[SimClock] = None,
+                verdict: Optional[Verdict] = None,
+                phases: Optional[PhaseTimer] = None
                 ) -> None:
         """Executes this mission on a given vehicle.
 
+        Rather than polling the state of the vehicle, execution blocks until
+        a relevant MAVLink message (MISSION_CURRENT, MISSION_ITEM_REACHED, or
+        HEARTBEAT) is received or until a timeout would occur.
+
         Parameters
         ----------
         connection: dronekit.Vehicle
@@ -192,58 +367,158 @@ class Mission(Sequence[dronekit.Command]):
             The timeout to enforce during mission setup.
         timeout_mission: float
             The timeout to enforce during the execution of the mission itself
-            (i.e., after setup has been performed).
+            (i.e., after setup has been performed). If a clock is provided,
+            this timeout is measured in simulated seconds; otherwise, it is
+            measured in wall-clock seconds.
+        clock: SimClock, optional
+            A clock that tracks the simulated time of the vehicle.
+        verdict: Verdict, optional
+            A verdict that, once issued, ends the mission immediately.
+        phases: PhaseTimer, optional
+            A timer that records the time taken by each phase of mission
+            setup, followed by the time taken by the flight itself.
+
+        Raises
+        ------
+        TimeoutError
+            If the mission did not finish before the timeout.
+        MissionAborted
+            If the mission was ended early by a verdict.
         """
-        self.issue(connection, timeout=timeout_setup)
+        if phases is None:
+            phases = PhaseTimer()
+        self.issue(connection, timeout=timeout_setup, phases=phases)
 
         timer = Stopwatch()
         timer.start()
-        has_started = False
-        command_num = 0
+        time_sim_start: Optional[float] = None
+
+        def mission_duration() -> float:
+            nonlocal time_sim_start
+            if not clock:
+                return timer.duration
+            if not clock.started:
+                return 0.0
+            if time_sim_start is None:
+                time_sim_start = clock.time
+            return clock.time - time_sim_start
+
+        def wall_time_until(duration: float) -> float:
+            """Estimates the wall-clock time until a given mission duration
+            will have elapsed."""
+            speedup = (clock.achieved_speedup if clock else None) or 1.0
+            return (duration - mission_duration()) / speedup
+        condition = threading.Condition()
+        progress = {'command': 0, 'started': False, 'finished': False}
 
         def listener_statustext(other, name, message):
             logger.debug(f'STATUSTEXT: {message.text}')
 
-        logger.debug('attaching STATUSTEXT listener')
-        connection.add_message_listener('STATUSTEXT', listener_statustext)
-        logger.debug('attached STATUSTEXT listener')
+        # the command pointer rolls back to zero upon mission completion
+        def listener_mission_current(other, name, message):
+            with condition:
+                progress['command'] = message.seq
+                if message.seq != 0:
+                    progress['started'] = True
+                elif progress['started']:
+                    progress['finished'] = True
+                condition.notify_all()
+
+        def listener_wake(other, name, message):
+            with condition:
+                condition.notify_all()
+
+        def listener_verdict(reason: str) -> None:
+            with condition:
+                condition.notify_all()
 
         def distance_to_home():
             return distance_metres(connection.home_location,
                                    connection.location.global_frame)
 
-        while True:
-            command_last = command_num
-            command_num = connection.commands.next
-            has_started |= command_num != 0
-
-            # if we've reached the next WP, print a summary of the copter state
-            if command_num != command_last:
-                logger.debug(f"NEXT WP: {command_num}")
-                logger.debug(f"HOME: {connection.home_location}")
-                logger.debug(f"MODE: {connection.mode.name}")
-                logger.debug(f"LOCATION: {connection.location.global_frame}")
-                logger.debug("DISTANCE TO HOME: "
-                             f"{distance_to_home():.2f} metres")
-
-            # the command pointer rolls back to zero upon mission completion
-            if has_started and command_num == 0:
-                break
+        listeners = [('STATUSTEXT', listener_statustext),
+                     ('MISSION_CURRENT', listener_mission_current),
+                     ('MISSION_ITEM_REACHED', listener_wake),
+                     ('HEARTBEAT', listener_wake)]
+        logger.debug('attaching mission listeners')
+        for message_type, listener in listeners:
+            connection.add_message_listener(message_type, listener)
+        logger.debug('attached mission listeners')
+        unsubscribe_verdict = \
+            verdict.subscribe(listener_verdict) if verdict else None
 
-            if connection.last_heartbeat > timeout_heartbeat:
-                logger.debug("vehicle failed liveness check")
-                break
-
-            if timer.duration > timeout_mission:
-                logger.debug("timeout occurred during mission execution.")
-                raise TimeoutError("mission did not complete before timeout")
-
-            time.sleep(0.05)
+        try:
+            command_num = 0
+            with condition:
+                while True:
+                    command_last = command_num
+                    command_num = progress['command']
+
+                    # if we've reached the next WP, print a summary of the
+                    # copter state
+                    if command_num != command_last:
+                        logger.debug(f"NEXT WP: {command_num}")
+                        logger.debug(f"HOME: {connection.home_location}")
+                        logger.debug(f"MODE: {connection.mode.name}")
+                        logger.debug("LOCATION: "
+                                     f"{connection.location.global_frame}")
+                        logger.debug("DISTANCE TO HOME: "
+                                     f"{distance_to_home():.2f} metres")
+
+                    if progress['finished']:
+                        break
+
+                    if verdict and verdict.reason is not None:
+                        raise MissionAborted(verdict.reason)
+
+                    time_since_heartbeat = connection.last_heartbeat
+                    if time_since_heartbeat > timeout_heartbeat:
+                        logger.debug("vehicle failed liveness check")
+                        break
+
+                    if mission_duration() > timeout_mission:
+                        logger.debug("timeout occurred during mission "
+                                     "execution.")
+                        raise TimeoutError("mission did not complete "
+                                           "before timeout")
+
+                    # sleep until the state changes or a deadline is reached
+                    time_to_deadline = min(
+                        timeout_heartbeat - time_since_heartbeat,
+                        wall_time_until(timeout_mission))
+                    condition.wait(max(0.0, time_to_deadline) + 0.001)
+        finally:
+            phases.lap('flight')
+            logger.debug('removing mission listeners')
+            if unsubscribe_verdict:
+                unsubscribe_verdict()
+            for message_type, listener in listeners:
+                connection.remove_message_listener(message_type, listener)
+            logger.debug('removed mission listeners')
+        logger.debug(f"mission terminated after {mission_duration():.3f}s "
+                     f"[wall-clock: {timer.duration:.3f}s]")
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class SITLReadiness:
+    """Reports the time taken by each phase of SITL startup.
+
+    Attributes
+    ----------
+    time_to_port: float
+        The number of seconds that elapsed between launching the SITL and its
+        MAVLink TCP port accepting connections.
+    time_to_heartbeat: float
+        The number of seconds that elapsed between the port accepting
+        connections and the first HEARTBEAT being received.
+    """
+    time_to_port: float
+    time_to_heartbeat: float
 
-        logger.debug('removing STATUSTEXT listener')
-        connection.add_message_listener('STATUSTEXT', listener_statustext)
-        logger.debug('removed STATUSTEXT listener')
-        logger.debug("mission terminated")
+    @property
+    def total(self) -> float:
+        """The total number of seconds taken for the SITL to become ready."""
+        return self.time_to_port + self.time_to_heartbeat
 
 
 @attr.s
@@ -254,16 +529,30 @@ class SITL:
     home: Tuple[float, float, float, float] = \
         attr.ib(default=(-35.363262, 149.165237, 0.000000, 0.00))
     speedup: int = attr.ib(default=1)
+    timeout_ready: float = attr.ib(default=30.0)
+    instance: int = attr.ib(default=0)
+    timeout_kill: float = attr.ib(default=0.5)
     _process: Optional[subprocess.Popen] = attr.ib(default=None, repr=False)
     binary: str = attr.ib(init=False)
+    readiness: Optional[SITLReadiness] = \
+        attr.ib(init=False, default=None, repr=False)
+    pid: Optional[int] = attr.ib(init=False, default=None)
+    teardown_latency: Optional[float] = \
+        attr.ib(init=False, default=None, repr=False)
+    _output: List[str] = attr.ib(init=False, factory=list, repr=False)
 
     def __attrs_post_init__(self) -> None:
+        self.binary = self.binary_for_model(self.model)
+
+    @staticmethod
+    def binary_for_model(model: str) -> str:
+        """Returns the path to the SITL binary for a given vehicle model."""
         binary_name = ({
             'copter': 'arducopter',
             'rover': 'ardurover',
             'plane': 'arduplane'
-        })[self.model]
-        self.binary = f'/opt/ardupilot/build/sitl/bin/{binary_name}'
+        })[model]
+        return f'/opt/ardupilot/build/sitl/bin/{binary_name}'
 
     @staticmethod
     @contextlib.contextmanager
@@ -271,18 +560,22 @@ class SITL:
                model: str,
                parameters_filename: str,
                home: Tuple[float, float, float, float],
-               ports: Tuple[int, ...],
+               endpoints: Tuple[Endpoint, ...],
                *,
-               speedup: int = 1
+               speedup: int = 1,
+               timeout_ready: float = 30.0,
+               instance: int = 0
                ) -> Iterator[Tuple[str, ...]]:
-        logger.debug("launching SITL with MAVProxy...")
+        logger.debug("launching SITL with MAVLink router...")
         with SITL(container=container,
                   model=model,
                   parameters_filename=parameters_filename,
                   home=home,
-                  speedup=speedup) as sitl:
+                  speedup=speedup,
+                  timeout_ready=timeout_ready,
+                  instance=instance) as sitl:
             logger.debug(f"started SITL: {sitl}")
-            with sitl.mavproxy(*ports) as urls:
+            with sitl.router(*endpoints) as urls:
                 yield urls
 
     @property
@@ -292,15 +585,43 @@ class SITL:
         fn_param = self.parameters_filename
         fn_script = '/opt/ardupilot/Tools/autotest/sim_vehicle.py'
         cmd = (f'{self.binary} '
+               f'-I {self.instance} '
                f'--speedup {self.speedup} '
                f'--model {self.model} '
                f'--home {arg_home} '
                f'--defaults {fn_param}')
         return cmd
 
+    @property
+    def url(self) -> str:
+        """The URL of the MAVLink TCP endpoint provided by this SITL."""
+        return f'tcp:{self.ip_address}:{self.port}'
+
+    @property
+    def port(self) -> int:
+        """The MAVLink TCP port provided by this SITL."""
+        return 5760 + 10 * self.instance
+
+    @property
+    def directory(self) -> str:
+        """The directory inside the container that this SITL runs in.
+
+        Each instance is given its own directory so that SITLs that share a
+        container do not share the same EEPROM and log files.
+        """
+        return f'/tmp/sitl.{self.instance}'
+
+    @contextlib.contextmanager
+    def router(self, *endpoints: Endpoint) -> Iterator[Tuple[str, ...]]:
+        """Launches an in-process MAVLink router that forwards the MAVLink
+        stream of this SITL to a number of local UDP ports or Unix domain
+        sockets."""
+        with MAVLinkRouter(self.ip_address, self.port, endpoints) as router:
+            yield router.urls
+
     @contextlib.contextmanager
     def mavproxy(self, *ports: int) -> Iterator[Tuple[str, ...]]:
-        url_master = f'tcp:{self.ip_address}:5760'
+        url_master = self.url
         url_sitl = f'tcp:{self.ip_address}:5501'
         urls_out = tuple(f'udp:127.0.0.1:{p}' for p in ports)
         cmd_args = [f'{BIN_MAVPROXY} --daemon --master={url_master}']
@@ -328,33 +649,134 @@ class SITL:
     def ip_address(self) -> str:
         return self._container.ip_address
 
+    def _read_pid(self) -> Optional[int]:
+        """Reads the process ID of this SITL, which is written to the start
+        of its output by the shell that it replaces."""
+        assert self._process
+        try:
+            chunk = next(iter(self._process.stream))  # type: ignore
+        except StopIteration:
+            return None
+        line, *self._output = chunk.split('\n')
+        try:
+            return int(line.strip())
+        except ValueError:
+            self._output.insert(0, line)
+            return None
+
     def open(self) -> 'SITL':
         """Launches this SITL."""
         command = self.command
         logger.debug(f'launching SITL: {command}')
-        self._process = self._container.shell.popen(command)
-        time.sleep(5)  # FIXME necessary? this is dodgy.
+        directory = self.directory
+        # the shell reports its PID, which the SITL inherits, so that this
+        # particular SITL can be killed without affecting any others
+        self._process = self._container.shell.popen(
+            f'mkdir -p {directory} && cd {directory} '
+            f'&& echo $$ && exec {command}')
+        # the SITL must not outlive a failure (e.g., a refused connection
+        # or an interrupt) since it holds on to its instance and ports
+        try:
+            self.pid = self._read_pid()
+            if self.pid is None:
+                logger.warning(f"failed to determine PID of SITL: {self}")
+            else:
+                logger.debug(f"SITL has PID: {self.pid}")
+            self.readiness = self.wait_till_ready(self.timeout_ready)
+        except BaseException:
+            logger.debug("SITL failed to become ready")
+            self.close()
+            raise
         return self
 
+    def wait_till_ready(self, timeout: float) -> SITLReadiness:
+        """Blocks until this SITL is serving MAVLink messages.
+
+        The SITL is ready once its MAVLink TCP port accepts connections and
+        it has sent its first HEARTBEAT.
+
+        Parameters
+        ----------
+        timeout: float
+            The maximum number of seconds to wait for the SITL to become
+            ready.
+
+        Returns
+        -------
+        SITLReadiness
+            A report of the time taken by each phase of startup.
+
+        Raises
+        ------
+        TimeoutError
+            If the SITL does not become ready before the timeout expires.
+        """
+        timer = Stopwatch()
+        timer.start()
+
+        def time_left() -> float:
+            return max(0.0, timeout - timer.duration)
+
+        logger.debug(f"waiting for SITL port to open: {self.url}")
+        wait_till_open(self.port, time_left(),
+                       host=self.ip_address,
+                       interval=0.05)
+        time_to_port = timer.duration
+
+        logger.debug(f"waiting for SITL heartbeat: {self.url}")
+        wait_for_heartbeat(self.url, time_left())
+        time_to_heartbeat = timer.duration - time_to_port
+
+        readiness = SITLReadiness(time_to_port=time_to_port,
+                                  time_to_heartbeat=time_to_heartbeat)
+        logger.debug(f"SITL became ready after {readiness.total:.3f}s "
+                     f"[port: {time_to_port:.3f}s, "
+                     f"heartbeat: {time_to_heartbeat:.3f}s]")
+        return readiness
+
+    @property
+    def command_kill(self) -> str:
+        """The command that should be used to kill this SITL.
+
+        The SITL is sent SIGTERM and, if it has not exited after
+        :attr:`timeout_kill` seconds, SIGKILL. Waiting takes place inside the
+        container so that killing the SITL takes a single round trip. A SITL
+        that has become a zombie is treated as having exited.
+        """
+        if self.pid is None:
+            # only kill this instance, since other SITLs may share the
+            # container
+            pattern = f"'^{self.binary} -I {self.instance} '"
+            return (f"sudo pkill -15 -f {pattern}; sleep {self.timeout_kill}; "
+                    f"sudo pkill -9 -f {pattern}; true")
+        pid = self.pid
+        polls = max(1, int(self.timeout_kill / 0.01))
+        return (f"kill -TERM {pid} 2>/dev/null || exit 0; "
+                f"for i in $(seq {polls}); do "
+                "grep -qs '^State:[[:space:]]*[^Z[:space:]]' "
+                f"/proc/{pid}/status || exit 0; sleep 0.01; done; "
+                f"kill -KILL {pid} 2>/dev/null; true")
+
     def close(self) -> None:
         """Closes this SITL."""
-        # FIXME temporary workaround for problems with .terminate
-        # self._process.terminate()
         assert self._process
-        # TODO does this need to run as root?
+        timer = Stopwatch()
+        timer.start()
         logger.debug('attempting to close SITL')
-        cmd_kill = f'sudo killall -15 {self.binary}'
-        self._container.shell.run(cmd_kill)
+        self._container.shell.run(self.command_kill)
         try:
-            retcode = self._process.wait(0.5)
+            retcode = self._process.wait(2.0)
             logger.debug(f'SITL close retcode: {retcode}')
         except subprocess.TimeoutExpired:
-            logger.debug("force killing SITL process")
+            # the SITL has been killed, but its exec session has not ended
+            logger.debug("force closing SITL exec session")
             self._process.kill()
-            logger.debug('killed SITL')
             retcode = self._process.wait()
-            logger.debug(f'SITL forcekill retcode: {retcode}')
-        out = '\n'.join(self._process.stream)  # type: ignore
+            logger.debug(f'SITL exec session retcode: {retcode}')
+        self.teardown_latency = timer.duration
+        logger.debug(f"closed SITL after {self.teardown_latency:.3f}s")
+        lines = self._output + list(self._process.stream)  # type: ignore
+        out = '\n'.join(lines)
         logger.debug(f'SITL output [{retcode}]:\n{out}')
 
     def __enter__(self) -> 'SITL':
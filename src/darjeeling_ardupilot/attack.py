@@ -1,15 +1,44 @@
 # -*- coding: utf-8 -*-
-__all__ = ('Attack',)
+__all__ = ('Attack', 'AttackPhase', 'AttackRecord', 'AttackSchedule',
+           'AttackTrigger', 'TelemetryTrigger', 'TimeTrigger',
+           'WaypointTrigger')
 
-from typing import Any, Dict, Iterator
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+import abc
 import contextlib
+import inspect
 import logging
 import threading
+import time
 
 from loguru import logger
+from pymavlink import mavutil
 import attr
 import dronekit
 
+from .hub import MAVLinkHub
+
+
+@attr.s(auto_attribs=True)
+class AttackRecord:
+    """Records when an attack was triggered during a test.
+
+    Attributes
+    ----------
+    waypoint: int, optional
+        The waypoint that was reported by the MISSION_CURRENT message that
+        triggered the attack, or :code:`None` if the attack was not triggered.
+    latency: float, optional
+        The number of seconds that elapsed between the triggering message
+        being received and the attack being sent.
+    """
+    waypoint: Optional[int] = None
+    latency: Optional[float] = None
+
+    @property
+    def triggered(self) -> bool:
+        return self.waypoint is not None
+
 
 @attr.s(frozen=True, slots=True, auto_attribs=True)
 class Attack:
@@ -24,39 +53,254 @@ class Attack:
         waypoint = d['waypoint']
         return Attack(parameter, value, waypoint)
 
-    def _send(self, connection: dronekit.Vehicle) -> None:
-        """Immediately sends this attack to the vehicle."""
-        try:
-            connection.parameters[self.parameter] = self.value
-        except dronekit.TimeoutError:
-            logger.debug("lost connection to vehicle -- unable to attack")
-            return
+    def to_phase(self) -> 'AttackPhase':
+        """Returns an attack phase that is equivalent to this attack."""
+        return AttackPhase(trigger=WaypointTrigger(self.waypoint),
+                           parameters=((self.parameter, self.value),))
+
+
+def _message_class(message_type: str) -> Any:
+    """Returns the class of a given type of MAVLink message.
+
+    Raises
+    ------
+    ValueError
+        If the MAVLink dialect has no such type of message.
+    """
+    name = f'MAVLink_{message_type.lower()}_message'
+    cls = getattr(mavutil.mavlink, name, None)
+    if cls is None:
+        raise ValueError(f"unknown type of MAVLink message: {message_type}")
+    return cls
+
+
+class AttackTrigger(abc.ABC):
+    """Determines when a phase of an attack should be launched."""
+    @property
+    @abc.abstractmethod
+    def message_types(self) -> Tuple[str, ...]:
+        """The types of MAVLink message that are used by this trigger."""
+        ...
+
+    @abc.abstractmethod
+    def is_satisfied(self, message: Any, time_start_ms: int = 0) -> bool:
+        """Determines whether a given message satisfies this trigger.
+
+        Parameters
+        ----------
+        message: Any
+            The message that was received from the vehicle.
+        time_start_ms: int
+            The boot time of the vehicle, in milliseconds, at which the
+            attack began to listen for its triggers.
+        """
+        ...
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> 'AttackTrigger':
+        if 'waypoint' in d:
+            return WaypointTrigger(d['waypoint'])
+        if 'time' in d:
+            return TimeTrigger(d['time'])
+        if 'message' in d:
+            return TelemetryTrigger.from_dict(d)
+        raise ValueError(f"unknown type of attack trigger: {d}")
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class WaypointTrigger(AttackTrigger):
+    """Triggers once the vehicle has reached a given waypoint."""
+    waypoint: int
+
+    @property
+    def message_types(self) -> Tuple[str, ...]:
+        return ('MISSION_CURRENT',)
+
+    def is_satisfied(self, message: Any, time_start_ms: int = 0) -> bool:
+        return message.seq >= self.waypoint
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class TimeTrigger(AttackTrigger):
+    """Triggers once a given number of simulated seconds have elapsed since
+    the attack began to listen for its triggers, shortly after the test
+    connected to the vehicle.
+
+    Time is not measured from the boot of the vehicle since a SITL may have
+    been running for an arbitrary amount of time before the test began
+    (e.g., if it was launched while a previous test was running).
+    """
+    seconds: float
+
+    @property
+    def message_types(self) -> Tuple[str, ...]:
+        return ('SYSTEM_TIME', 'ATTITUDE')
+
+    def is_satisfied(self, message: Any, time_start_ms: int = 0) -> bool:
+        time_elapsed_ms = message.time_boot_ms - time_start_ms
+        return time_elapsed_ms >= self.seconds * 1000
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class TelemetryTrigger(AttackTrigger):
+    """Triggers once a field of a given telemetry message is above, below,
+    or equal to a given value."""
+    message: str
+    field: str
+    comparison: str = attr.ib(
+        validator=attr.validators.in_(('above', 'below', 'equals')))
+    value: float
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> 'TelemetryTrigger':
+        comparisons = [c for c in ('above', 'below', 'equals') if c in d]
+        if len(comparisons) != 1:
+            m = ("telemetry trigger must specify exactly one of "
+                 f"'above', 'below', or 'equals': {d}")
+            raise ValueError(m)
+        comparison = comparisons[0]
+        fieldnames = _message_class(d['message']).fieldnames
+        if d['field'] not in fieldnames:
+            m = (f"unknown field of MAVLink message [{d['message']}]: "
+                 f"{d['field']}")
+            raise ValueError(m)
+        return TelemetryTrigger(message=d['message'],
+                                field=d['field'],
+                                comparison=comparison,
+                                value=d[comparison])
+
+    @property
+    def message_types(self) -> Tuple[str, ...]:
+        return (self.message,)
+
+    def is_satisfied(self, message: Any, time_start_ms: int = 0) -> bool:
+        actual = getattr(message, self.field)
+        if self.comparison == 'above':
+            return actual > self.value
+        if self.comparison == 'below':
+            return actual < self.value
+        return actual == self.value
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class AttackPhase:
+    """A single phase of an attack, which writes parameters and injects raw
+    MAVLink messages once its trigger is satisfied.
+
+    Attributes
+    ----------
+    trigger: AttackTrigger
+        Determines when this phase should be launched.
+    parameters: Tuple[Tuple[str, float], ...]
+        The name and value of each parameter that should be written.
+    messages: Tuple[Tuple[str, Tuple[Tuple[str, Any], ...]], ...]
+        The type and fields of each MAVLink message that should be sent.
+    """
+    trigger: AttackTrigger
+    parameters: Tuple[Tuple[str, float], ...] = ()
+    messages: Tuple[Tuple[str, Tuple[Tuple[str, Any], ...]], ...] = ()
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> 'AttackPhase':
+        if 'trigger' not in d:
+            raise ValueError(f"attack phase is missing 'trigger': {d}")
+        trigger = AttackTrigger.from_dict(d['trigger'])
+        parameters = tuple(d.get('parameters', {}).items())
+        messages = tuple((m['type'], tuple(m.get('fields', {}).items()))
+                         for m in d.get('mavlink', []))
+        if not parameters and not messages:
+            m = f"attack phase must write parameters or send messages: {d}"
+            raise ValueError(m)
+        # messages are encoded by the reader thread of the connection, where
+        # errors would go unnoticed, so they are checked in advance
+        for message_type, fields in messages:
+            _message_class(message_type)
+            encode = getattr(mavutil.mavlink.MAVLink,
+                             f'{message_type.lower()}_encode')
+            try:
+                inspect.signature(encode).bind(None, **dict(fields))
+            except TypeError as err:
+                m = (f"invalid fields for MAVLink message [{message_type}]: "
+                     f"{err}")
+                raise ValueError(m) from err
+        return AttackPhase(trigger, parameters, messages)
+
+    def send(self, connection: dronekit.Vehicle) -> None:
+        """Immediately sends this phase of the attack to the vehicle."""
+        for name, value in self.parameters:
+            connection.parameters.set(name, value, retries=0)
+        for message_type, fields in self.messages:
+            encode = getattr(connection.message_factory,
+                             f'{message_type.lower()}_encode')
+            connection.send_mavlink(encode(**dict(fields)))
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class AttackSchedule:
+    """An attack that consists of a sequence of phases.
+
+    Each phase is only armed once all of the phases before it have been
+    launched, allowing a single mission to exercise several stages of an
+    attack.
+    """
+    phases: Tuple[AttackPhase, ...]
+
+    @staticmethod
+    def from_dicts(ds: Sequence[Dict[str, Any]]) -> 'AttackSchedule':
+        return AttackSchedule(tuple(AttackPhase.from_dict(d) for d in ds))
 
     @contextlib.contextmanager
-    def wait_and_send(self, url_mavlink: str) -> Iterator[None]:
-        event_stop = threading.Event()
-
-        def wait_loop(connection: dronekit.Vehicle):
-            wp_trigger = self.waypoint
-            while not event_stop.wait(0.1):
-                try:
-                    wp_current = connection.commands.next
-                    if wp_current >= wp_trigger:
-                        self._send(connection)
+    def wait_and_send(self,
+                      hub: MAVLinkHub
+                      ) -> Iterator[Sequence[AttackRecord]]:
+        """Launches each phase of this attack as soon as its trigger is
+        satisfied, for as long as the context is open.
+
+        Returns
+        -------
+        Iterator[Sequence[AttackRecord]]
+            A record for each phase that is updated when that phase is
+            launched.
+        """
+        records = tuple(AttackRecord() for _ in self.phases)
+        lock = threading.Lock()
+        connection = hub.vehicle
+        # time-based triggers measure time from the first timestamped
+        # message that is received after attaching
+        state = {'next': 0, 'waypoint': 0, 'time_start_ms': -1}
+
+        def listener(message) -> None:
+            message_type = message.get_type()
+            with lock:
+                if message_type == 'MISSION_CURRENT':
+                    state['waypoint'] = message.seq
+                if state['time_start_ms'] < 0 \
+                        and hasattr(message, 'time_boot_ms'):
+                    state['time_start_ms'] = message.time_boot_ms
+                time_start_ms = max(state['time_start_ms'], 0)
+                while state['next'] < len(self.phases):
+                    index = state['next']
+                    phase = self.phases[index]
+                    trigger = phase.trigger
+                    if message_type not in trigger.message_types \
+                            or not trigger.is_satisfied(message,
+                                                        time_start_ms):
                         return
-                except dronekit.TimeoutError:
-                    logger.debug("lost connection to vehicle -- "
-                                 "unable to attack")
-                    return
+                    phase.send(connection)
+                    record = records[index]
+                    record.latency = time.time() - message._timestamp
+                    record.waypoint = state['waypoint']
+                    state['next'] += 1
+                    logger.debug(f"sent attack phase {index} at waypoint "
+                                 f"{record.waypoint} after "
+                                 f"{record.latency * 1000:.3f} ms")
 
+        message_types = {'MISSION_CURRENT'}
+        for phase in self.phases:
+            message_types.update(phase.trigger.message_types)
+        unsubscribers = [hub.subscribe(t, listener) for t in message_types]
         try:
-            with contextlib.closing(dronekit.connect(url_mavlink, heartbeat_timeout=15)) as conn:  # noqa
-                thread_loop = threading.Thread(target=wait_loop, args=(conn,))
-                try:
-                    thread_loop.start()
-                    yield
-                finally:
-                    event_stop.set()
-                    thread_loop.join()
-        except dronekit.TimeoutError:
-            logger.debug("lost connection to vehicle -- unable to attack")
+            yield records
+        finally:
+            for unsubscribe in unsubscribers:
+                unsubscribe()
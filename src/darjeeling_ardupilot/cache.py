@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a persistent cache of test outcomes that allows tests
+to be skipped for candidate patches that produce an identical SITL binary.
+"""
+__all__ = ('OutcomeCache',)
+
+from collections import OrderedDict
+from typing import Dict, Optional
+import json
+import os
+import threading
+
+from darjeeling.core import TestOutcome
+from loguru import logger
+import attr
+
+from .util import atomic_write
+
+
+@attr.s
+class OutcomeCache:
+    """A persistent, size-bounded cache of test outcomes.
+
+    Outcomes are keyed by an opaque string that should identify both the SITL
+    binary and the test that was executed. When the cache is full, the least
+    recently used outcome is evicted.
+
+    Attributes
+    ----------
+    filename: str, optional
+        The file that the cache should be persisted to. If unspecified, the
+        cache is kept in memory only.
+    capacity: int
+        The maximum number of outcomes that may be stored in the cache.
+    hits: int
+        The number of lookups that were answered by the cache.
+    misses: int
+        The number of lookups that were not answered by the cache.
+    """
+    filename: Optional[str] = attr.ib(default=None)
+    capacity: int = attr.ib(default=10000)
+    hits: int = attr.ib(init=False, default=0)
+    misses: int = attr.ib(init=False, default=0)
+    _entries: 'OrderedDict[str, Dict[str, object]]' = \
+        attr.ib(init=False, factory=OrderedDict, repr=False)
+    _lock: threading.Lock = \
+        attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    def __attrs_post_init__(self) -> None:
+        if self.filename and os.path.exists(self.filename):
+            self.load()
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups that were answered by the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[TestOutcome]:
+        """Retrieves the cached outcome for a given key, if there is one."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        logger.debug(f"outcome cache hit rate: {self.hit_rate:.2f} "
+                     f"[hits: {self.hits}, misses: {self.misses}]")
+        return TestOutcome(entry['successful'], entry['time_taken'])
+
+    def put(self, key: str, outcome: TestOutcome) -> None:
+        """Stores the outcome for a given key, and persists the cache."""
+        with self._lock:
+            self._entries[key] = {'successful': outcome.successful,
+                                  'time_taken': outcome.time_taken}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        if self.filename:
+            self.save()
+
+    def load(self) -> None:
+        """Loads the contents of the cache from disk."""
+        assert self.filename
+        logger.debug(f"loading outcome cache: {self.filename}")
+        try:
+            with open(self.filename, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            logger.exception(f"failed to load outcome cache: {self.filename}")
+            return
+        with self._lock:
+            self._entries = OrderedDict(entries)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def save(self) -> None:
+        """Atomically writes the contents of the cache to disk."""
+        assert self.filename
+        with self._lock:
+            contents = json.dumps(self._entries)
+        with atomic_write(self.filename) as f:
+            f.write(contents)
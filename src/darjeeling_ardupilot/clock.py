@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a clock that tracks the simulated time of a vehicle.
+"""
+__all__ = ('SimClock',)
+
+from typing import Any, Iterator, Optional
+from timeit import default_timer as timer
+import contextlib
+import threading
+
+from loguru import logger
+import attr
+
+from .hub import MAVLinkHub
+
+
+@attr.s
+class SimClock:
+    """Tracks the simulated time of a vehicle, as reported by the
+    :code:`time_boot_ms` field of its SYSTEM_TIME and ATTITUDE messages, and
+    the speedup that the simulation achieves relative to wall-clock time.
+    """
+    _time_boot_first: Optional[float] = \
+        attr.ib(init=False, default=None, repr=False)
+    _time_boot_last: Optional[float] = \
+        attr.ib(init=False, default=None, repr=False)
+    _time_wall_first: float = attr.ib(init=False, default=0.0, repr=False)
+    _time_wall_last: float = attr.ib(init=False, default=0.0, repr=False)
+    _lock: threading.Lock = \
+        attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    def observe(self, time_boot_ms: int) -> None:
+        """Records that the vehicle has reported a given time since boot."""
+        time_boot = time_boot_ms / 1000
+        time_wall = timer()
+        with self._lock:
+            if self._time_boot_first is None:
+                self._time_boot_first = time_boot
+                self._time_wall_first = time_wall
+            time_boot_last = self._time_boot_last
+            if time_boot_last is None or time_boot > time_boot_last:
+                self._time_boot_last = time_boot
+                self._time_wall_last = time_wall
+
+    @property
+    def time(self) -> float:
+        """The number of simulated seconds since the vehicle booted.
+
+        Raises
+        ------
+        ValueError
+            If the vehicle has not reported its time yet.
+        """
+        if self._time_boot_last is None:
+            raise ValueError("vehicle has not reported its time")
+        return self._time_boot_last
+
+    @property
+    def started(self) -> bool:
+        """Indicates whether the vehicle has reported its time."""
+        return self._time_boot_last is not None
+
+    @property
+    def achieved_speedup(self) -> Optional[float]:
+        """The ratio of simulated time to wall-clock time that has been
+        achieved since this clock began tracking the vehicle, or
+        :code:`None` if too little time has elapsed to compute it."""
+        with self._lock:
+            if self._time_boot_first is None or self._time_boot_last is None:
+                return None
+            duration_wall = self._time_wall_last - self._time_wall_first
+            duration_sim = self._time_boot_last - self._time_boot_first
+        if duration_wall <= 0.0:
+            return None
+        return duration_sim / duration_wall
+
+    @contextlib.contextmanager
+    def track(self, hub: MAVLinkHub) -> Iterator['SimClock']:
+        """Tracks the simulated time of the vehicle connected to a given hub
+        for the duration of the context."""
+        def listener(message: Any) -> None:
+            self.observe(message.time_boot_ms)
+
+        unsubscribers = [hub.subscribe('SYSTEM_TIME', listener),
+                         hub.subscribe('ATTITUDE', listener)]
+        try:
+            yield self
+        finally:
+            for unsubscribe in unsubscribers:
+                unsubscribe()
+            logger.debug(f"achieved speedup: {self.achieved_speedup}")
@@ -1,7 +1,75 @@
 # -*- coding: utf-8 -*-
-__all__ = ('MonitorStatus', 'Monitor')
+__all__ = ('MonitorStatus', 'Monitor', 'MonitorWrapper', 'Verdict')
 
+from typing import Callable, List, Optional
 import abc
+import contextlib
+import threading
+
+from loguru import logger
+import attr
+
+from .hub import MAVLinkHub
+
+
+@attr.s
+class Verdict:
+    """A terminal judgement that a monitor may issue while the mission is
+    in flight (e.g., because the vehicle has crashed), which ends the
+    mission immediately. Only the first verdict that is issued takes
+    effect."""
+    _reason: Optional[str] = attr.ib(init=False, default=None)
+    _callbacks: List[Callable[[str], None]] = \
+        attr.ib(init=False, factory=list, repr=False)
+    _lock: threading.Lock = \
+        attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    @property
+    def issued(self) -> bool:
+        """Indicates whether a verdict has been issued."""
+        return self._reason is not None
+
+    @property
+    def reason(self) -> Optional[str]:
+        """The reason for the verdict, if one has been issued."""
+        return self._reason
+
+    def issue(self, reason: str) -> None:
+        """Issues a verdict for a given reason, unless a verdict has
+        already been issued."""
+        with self._lock:
+            if self._reason is not None:
+                return
+            self._reason = reason
+            callbacks = list(self._callbacks)
+        logger.debug(f"issued verdict: {reason}")
+        for callback in callbacks:
+            callback(reason)
+
+    def subscribe(self,
+                  callback: Callable[[str], None]
+                  ) -> Callable[[], None]:
+        """Calls a given function with the reason for the verdict as soon as
+        it is issued, or immediately if it has already been issued.
+
+        Returns
+        -------
+        Callable[[], None]
+            A function that cancels the subscription when called.
+        """
+        with self._lock:
+            reason = self._reason
+            if reason is None:
+                self._callbacks.append(callback)
+        if reason is not None:
+            callback(reason)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+        return unsubscribe
 
 
 class MonitorStatus(abc.ABC):
@@ -10,6 +78,13 @@ class MonitorStatus(abc.ABC):
         """Checks the status of the monitor."""
         ...
 
+    @property
+    def fitness(self) -> Optional[float]:
+        """A score between zero and one that indicates how close the vehicle
+        came to the expected behaviour, or :code:`None` if the monitor does
+        not compute one."""
+        return None
+
 
 class Monitor(abc.ABC):
     @abc.abstractmethod
@@ -17,6 +92,29 @@ class Monitor(abc.ABC):
         """Attaches this monitor to a given vehicle."""
         ...
 
+    @property
+    def supports_shared_connection(self) -> bool:
+        """Indicates whether this monitor can be attached to a connection
+        that is shared with other clients. Monitors that cannot are attached
+        to their own connection via :meth:`attach_to` instead."""
+        return type(self).attach_to_hub is not Monitor.attach_to_hub
+
+    def attach_to_hub(self, hub: MAVLinkHub) -> None:
+        """Attaches this monitor to a connection that is shared with other
+        clients. The monitor must not open or close the hub.
+
+        Monitors that support shared connections must override this method,
+        which otherwise refuses the hub.
+        """
+        raise TypeError(f"monitor does not support shared connections: "
+                        f"{self}")
+
+    def bind_verdict(self, verdict: Verdict) -> None:
+        """Provides a verdict that this monitor may issue to end the mission
+        while it is in flight. By default, monitors only judge the mission
+        once it has finished."""
+        pass
+
     @abc.abstractmethod
     def open(self) -> None:
         """Opens this monitor."""
@@ -46,3 +144,59 @@ class Monitor(abc.ABC):
 
     def __exit__(self, exc_type, exc, exc_tb):
         self.close()
+
+
+@attr.s
+class MonitorWrapper(Monitor):
+    """Extends another monitor, which shares the connection of this monitor
+    and determines its status.
+
+    Subclasses add their own behaviour by overriding :meth:`_open`.
+    """
+    _monitor: Monitor = attr.ib()
+    _hub: Optional[MAVLinkHub] = attr.ib(init=False, default=None)
+    _owns_hub: bool = attr.ib(init=False, default=False, repr=False)
+    _exit_stack: Optional[contextlib.ExitStack] = \
+        attr.ib(init=False, default=None, repr=False)
+
+    @property
+    def status(self) -> MonitorStatus:
+        return self._monitor.status
+
+    def attach_to(self, url_mavlink: str) -> None:
+        logger.debug(f"attaching [{self}] to MAVLink [{url_mavlink}]")
+        self._hub = MAVLinkHub(url_mavlink, heartbeat_timeout=15)
+        self._owns_hub = True
+        self._monitor.attach_to_hub(self._hub)
+
+    def attach_to_hub(self, hub: MAVLinkHub) -> None:
+        logger.debug(f"attaching [{self}] to shared hub [{hub}]")
+        self._hub = hub
+        self._owns_hub = False
+        self._monitor.attach_to_hub(hub)
+
+    def bind_verdict(self, verdict: Verdict) -> None:
+        self._monitor.bind_verdict(verdict)
+
+    def _open(self, hub: MAVLinkHub, exit_stack: contextlib.ExitStack) -> None:
+        """Called when this monitor is opened, before the underlying monitor
+        is opened. Any resources that should be released when this monitor is
+        closed should be registered with the given exit stack."""
+        pass
+
+    def open(self) -> None:
+        assert self._hub
+        with contextlib.ExitStack() as exit_stack:
+            if self._owns_hub:
+                exit_stack.enter_context(self._hub)
+            self._open(self._hub, exit_stack)
+            exit_stack.enter_context(self._monitor)
+            self._exit_stack = exit_stack.pop_all()
+
+    def notify_mission_end(self) -> None:
+        self._monitor.notify_mission_end()
+
+    def close(self) -> None:
+        if self._exit_stack:
+            self._exit_stack.close()
+            self._exit_stack = None
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a monitor that checks that the vehicle stays within a
+corridor around the legs of its mission.
+
+The legs of the mission are indexed by a uniform grid whose cells are as
+wide as the corridor. Each cell lists the legs that pass within the
+corridor width of it, so checking a position sample requires a single
+dictionary lookup followed by a distance computation for each of the few
+legs that pass near that cell, regardless of the length of the mission.
+"""
+__all__ = ('Corridor', 'CorridorMonitor', 'CorridorMonitorStatus')
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import contextlib
+import math
+
+from loguru import logger
+import attr
+
+from .ardu import Mission
+from .core import MonitorStatus, MonitorWrapper, Verdict
+from .hub import MAVLinkHub
+
+EARTH_RADIUS = 6378137.0
+
+MAV_CMD_NAV_WAYPOINT = 16
+MAV_CMD_NAV_LOITER_UNLIM = 17
+MAV_CMD_NAV_LOITER_TURNS = 18
+MAV_CMD_NAV_LOITER_TIME = 19
+MAV_CMD_NAV_RETURN_TO_LAUNCH = 20
+MAV_CMD_NAV_LAND = 21
+MAV_CMD_NAV_TAKEOFF = 22
+MAV_CMD_NAV_SPLINE_WAYPOINT = 82
+
+# commands that fly to the location given by their x and y fields
+POSITIONAL_COMMANDS = frozenset({
+    MAV_CMD_NAV_WAYPOINT,
+    MAV_CMD_NAV_LOITER_UNLIM,
+    MAV_CMD_NAV_LOITER_TURNS,
+    MAV_CMD_NAV_LOITER_TIME,
+    MAV_CMD_NAV_LAND,
+    MAV_CMD_NAV_SPLINE_WAYPOINT})
+
+Point = Tuple[float, float]
+Segment = Tuple[Point, Point]
+
+
+def _to_local(origin: Tuple[float, float], lat: float, lon: float) -> Point:
+    """Computes the north and east offsets, in metres, of a location from a
+    given origin."""
+    lat_origin = math.radians(origin[0])
+    north = (math.radians(lat) - lat_origin) * EARTH_RADIUS
+    east = (math.radians(lon) - math.radians(origin[1])) \
+        * EARTH_RADIUS * math.cos(lat_origin)
+    return (north, east)
+
+
+def _distance_to_segment(p: Point, segment: Segment) -> float:
+    """Computes the distance between a point and a line segment."""
+    (ax, ay), (bx, by) = segment
+    px, py = p
+    dx, dy = bx - ax, by - ay
+    length_squared = dx * dx + dy * dy
+    if length_squared == 0.0:
+        return math.hypot(px - ax, py - ay)
+    t = ((px - ax) * dx + (py - ay) * dy) / length_squared
+    t = max(0.0, min(1.0, t))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+@attr.s(frozen=True)
+class Corridor:
+    """A corridor of a fixed width around a sequence of legs.
+
+    Positions are given by their north and east offsets, in metres, from an
+    origin.
+
+    Attributes
+    ----------
+    legs: Tuple[Segment, ...]
+        The legs of the corridor.
+    width: float
+        The greatest distance, in metres, that a position may be from the
+        nearest leg.
+    origin: Tuple[float, float]
+        The latitude and longitude, in degrees, of the origin.
+    """
+    legs: Tuple[Segment, ...] = attr.ib()
+    width: float = attr.ib()
+    origin: Tuple[float, float] = attr.ib()
+    _cells: Dict[Tuple[int, int], Tuple[int, ...]] = \
+        attr.ib(init=False, repr=False, eq=False)
+
+    def __attrs_post_init__(self) -> None:
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for index, leg in enumerate(self.legs):
+            for cell in self._cells_near(leg):
+                cells.setdefault(cell, []).append(index)
+        object.__setattr__(self, '_cells',
+                           {c: tuple(ls) for c, ls in cells.items()})
+
+    def _cells_near(self, leg: Segment) -> Iterator[Tuple[int, int]]:
+        """Finds all cells that contain a point within the width of a given
+        leg.
+
+        For each row of cells, the leg is clipped to the band of northings
+        that lie within the width of that row, and the cells in that row
+        that lie within the width of the clipped portion of the leg are
+        covered. This may cover a few cells that do not contain such a
+        point, but never misses one.
+        """
+        width = size = self.width
+        (ax, ay), (bx, by) = leg
+        row_first = math.floor((min(ax, bx) - width) / size)
+        row_last = math.floor((max(ax, bx) + width) / size)
+        for i in range(row_first, row_last + 1):
+            lo = i * size - width
+            hi = (i + 1) * size + width
+            if ax == bx:
+                t0, t1 = 0.0, 1.0
+            else:
+                t_lo = (lo - ax) / (bx - ax)
+                t_hi = (hi - ax) / (bx - ax)
+                t0 = max(0.0, min(t_lo, t_hi))
+                t1 = min(1.0, max(t_lo, t_hi))
+                if t0 > t1:
+                    continue
+            e0 = ay + t0 * (by - ay)
+            e1 = ay + t1 * (by - ay)
+            col_first = math.floor((min(e0, e1) - width) / size)
+            col_last = math.floor((max(e0, e1) + width) / size)
+            for j in range(col_first, col_last + 1):
+                yield (i, j)
+
+    @staticmethod
+    def for_mission(mission: Mission, width: float) -> 'Corridor':
+        """Constructs a corridor around the legs of a given mission.
+
+        The first leg begins at the home location of the mission. Takeoff
+        commands and landing commands without a location are flown from the
+        current location, and return-to-launch commands fly to home.
+        """
+        origin = (mission.home_location[0], mission.home_location[1])
+        home = (0.0, 0.0)
+        points = [home]
+        for command in mission.commands[1:]:
+            if command.command == MAV_CMD_NAV_RETURN_TO_LAUNCH:
+                points.append(home)
+            elif command.command in POSITIONAL_COMMANDS \
+                    and (command.x != 0.0 or command.y != 0.0):
+                points.append(_to_local(origin, command.x, command.y))
+        legs = tuple((a, b) for a, b in zip(points, points[1:]) if a != b)
+        if not legs:
+            legs = ((home, home),)
+        return Corridor(legs, width, origin)
+
+    def distance(self, lat: float, lon: float) -> Optional[float]:
+        """Computes the distance, in metres, between a given location and the
+        nearest leg of this corridor, or returns :code:`None` if the location
+        is outside of the corridor."""
+        return self.distance_local(_to_local(self.origin, lat, lon))
+
+    def distance_local(self, p: Point) -> Optional[float]:
+        """Computes the distance, in metres, between a given local position
+        and the nearest leg of this corridor, or returns :code:`None` if the
+        position is outside of the corridor."""
+        cell = (math.floor(p[0] / self.width), math.floor(p[1] / self.width))
+        indices = self._cells.get(cell)
+        if not indices:
+            return None
+        distance = min(_distance_to_segment(p, self.legs[i]) for i in indices)
+        return distance if distance <= self.width else None
+
+
+@attr.s
+class CorridorMonitorStatus(MonitorStatus):
+    """Describes whether the vehicle stayed within its corridor.
+
+    Attributes
+    ----------
+    status: MonitorStatus
+        The status of the underlying monitor.
+    violation: str, optional
+        A description of the first corridor violation, if any.
+    """
+    status: MonitorStatus = attr.ib()
+    violation: Optional[str] = attr.ib(default=None)
+
+    @property
+    def fitness(self) -> Optional[float]:
+        return self.status.fitness
+
+    def is_ok(self) -> bool:
+        return self.violation is None and self.status.is_ok()
+
+
+@attr.s
+class CorridorMonitor(MonitorWrapper):
+    """Fails the test if the vehicle strays further than a given distance
+    from the legs of its mission once the mission has started. If a verdict
+    is bound to this monitor, the mission is ended as soon as the vehicle
+    leaves its corridor.
+
+    Attributes
+    ----------
+    mission: Mission
+        The mission that is being executed.
+    width: float
+        The greatest horizontal distance, in metres, that the vehicle may be
+        from the nearest leg of its mission.
+    """
+    mission: Mission = attr.ib(kw_only=True)
+    width: float = attr.ib(default=10.0, kw_only=True)
+    _corridor: Optional[Corridor] = \
+        attr.ib(init=False, default=None, repr=False)
+    _status: Optional[CorridorMonitorStatus] = \
+        attr.ib(init=False, default=None, repr=False)
+    _verdict: Optional[Verdict] = attr.ib(init=False, default=None)
+    _started: bool = attr.ib(init=False, default=False, repr=False)
+
+    @property
+    def status(self) -> MonitorStatus:
+        if self._status is None:
+            self._status = CorridorMonitorStatus(self._monitor.status)
+        return self._status
+
+    def bind_verdict(self, verdict: Verdict) -> None:
+        self._verdict = verdict
+        super().bind_verdict(verdict)
+
+    def _check_position(self, message: Any) -> None:
+        if not self._started or (message.lat == 0 and message.lon == 0):
+            return
+        assert self._corridor
+        status = self.status
+        assert isinstance(status, CorridorMonitorStatus)
+        if status.violation:
+            return
+        lat = message.lat / 1e7
+        lon = message.lon / 1e7
+        if self._corridor.distance(lat, lon) is None:
+            status.violation = \
+                f"vehicle left corridor at ({lat:.7f}, {lon:.7f})"
+            logger.debug(status.violation)
+            if self._verdict:
+                self._verdict.issue(status.violation)
+
+    def _check_mission_current(self, message: Any) -> None:
+        if message.seq != 0:
+            self._started = True
+
+    def _open(self, hub: MAVLinkHub, exit_stack: contextlib.ExitStack) -> None:
+        if self._corridor is None:
+            self._corridor = Corridor.for_mission(self.mission, self.width)
+            logger.debug(f"built corridor with {len(self._corridor.legs)} "
+                         f"legs [width: {self.width:.1f} m]")
+        listeners = [('GLOBAL_POSITION_INT', self._check_position),
+                     ('MISSION_CURRENT', self._check_mission_current)]
+        for message_type, listener in listeners:
+            exit_stack.callback(hub.subscribe(message_type, listener))
@@ -1,81 +1,100 @@
 # -*- coding: utf-8 -*-
-from typing import Tuple, Optional
+"""
+This module is responsible for executing missions, together with their
+monitors and attacks, against a running SITL.
+"""
+__all__ = ('ExecutionReport', 'run_with_monitor', 'WorkerPool')
+
+from typing import Any, Callable, List, Mapping, Sequence, Tuple, Optional
 from contextlib import closing, ExitStack
-from multiprocessing import Process, Queue
-from queue import Empty
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+import os
+import threading
 import time
 
-from darjeeling import ProgramContainer as DarjeelingContainer
 from darjeeling.core import TestOutcome
 from darjeeling.util import Stopwatch
 from loguru import logger
-
-import darjeeling
+import attr
 import dronekit
 
-from .ardu import Mission, SITL
-from .core import Monitor
-from .attack import Attack
+from .ardu import Mission, MissionAborted
+from .core import Monitor, Verdict
+from .attack import AttackRecord, AttackSchedule
+from .clock import SimClock
+from .hub import MAVLinkHub
+from .timing import PhaseTimer
+
 
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class ExecutionReport:
+    """Describes a single execution of a mission.
 
-def run_with_monitor_in_process(*args, **kwargs) -> TestOutcome:
+    Attributes
+    ----------
     outcome: TestOutcome
-    timeout: int = kwargs['timeout']
-
-    def runner(q: Queue) -> None:
-        outcome = run_with_monitor(*args, **kwargs)
-        q.put_nowait(outcome)
-
-    q: Queue = Queue()
-    p = Process(target=runner, daemon=True, args=(q,))
-    timer = Stopwatch()
-    timer.start()
-    p.start()
-    p.join(timeout)
-    timer.stop()
-
-    if p.is_alive():
-        logger.debug("force terminating execution process")
-        p.terminate()
-        return TestOutcome(False, timer.duration)
-    try:
-        return q.get_nowait()
-    except Empty:
-        return TestOutcome(False, timer.duration)
-
-
-def run_with_monitor(container: DarjeelingContainer,
+        The outcome of the execution.
+    achieved_speedup: float, optional
+        The ratio of simulated time to wall-clock time that was achieved
+        during the execution, if it could be measured.
+    fitness: float, optional
+        The fitness score that was computed by the monitor, if any.
+    phases: Mapping[str, float]
+        The number of wall-clock seconds spent in each phase of the
+        execution (e.g., 'connect' and 'flight'), in the order in which the
+        phases occurred. Phases that were not reached are omitted.
+    timed_out: bool
+        Indicates whether the mission failed to finish before its timeout.
+    error: bool
+        Indicates whether the execution failed because of the test harness
+        rather than the vehicle (e.g., because its worker crashed or was
+        killed), in which case the outcome says nothing about the program
+        under test.
+    attack_records: Tuple[AttackRecord, ...]
+        A record of when each phase of the attack, if any, was launched,
+        including the latency of its trigger.
+    """
+    outcome: TestOutcome
+    achieved_speedup: Optional[float] = None
+    fitness: Optional[float] = None
+    phases: Mapping[str, float] = attr.ib(factory=dict)
+    timed_out: bool = False
+    error: bool = False
+    attack_records: Tuple[AttackRecord, ...] = ()
+
+
+def run_with_monitor(urls: Tuple[str, str, str],
                      mission: Mission,
-                     model: str,
-                     parameters_filename: str,
                      monitor: Monitor,
-                     attack: Optional[Attack],
-                     speedup: int,
+                     attack: Optional[AttackSchedule],
                      timeout: int,
                      timeout_heartbeat: float,
-                     ports_mavlink: Tuple[int, int, int]
-                     ) -> TestOutcome:
-    ip_address = container.ip_address
-    logger.debug(f"container: {container}")
-    logger.debug(f"container IP address: {ip_address}")
-    logger.debug(f"using model: {model}")
-    logger.debug(f"using parameters filename: {parameters_filename}")
-    logger.debug(f"using timeout: {timeout:d} seconds")
+                     shared_connection: bool = True
+                     ) -> ExecutionReport:
+    """Executes a mission on a running SITL and uses a given monitor to
+    determine the outcome of the execution.
+
+    Parameters
+    ----------
+    urls: Tuple[str, str, str]
+        The MAVLink URLs that should be used by DroneKit, the attacker, and
+        the monitor, respectively.
+    timeout: int
+        The maximum number of simulated seconds that the mission may take.
+    shared_connection: bool
+        If :code:`True`, the mission driver, attacker, and monitor share a
+        single connection to the vehicle. Otherwise, each client uses its own
+        connection.
+    """
+    logger.debug(f"using timeout: {timeout:d} simulated seconds")
     logger.debug(f"using heartbeat timeout: {timeout_heartbeat:.3f} seconds")
-    logger.debug(f"using speedup: {speedup:d}X")
+    logger.debug(f"using shared connection: {shared_connection}")
+    time_cpu_start = time.process_time()
+    phases = PhaseTimer()
 
     with ExitStack() as exit_stack:
-        shell = container.shell
-
-        # launch SITL
-        sitl_args = {'container': container,
-                     'model': model,
-                     'parameters_filename': parameters_filename,
-                     'home': mission.home_location,
-                     'speedup': speedup,
-                     'ports': ports_mavlink}
-        url_dronekit, url_attacker, url_monitor = \
-            exit_stack.enter_context(SITL.launch(**sitl_args))
+        url_dronekit, url_attacker, url_monitor = urls
         logger.debug(f"allocated DroneKit URL: {url_dronekit}")
         logger.debug(f"allocated attacker URL: {url_attacker}")
         logger.debug(f"allocated monitor URL: {url_monitor}")
@@ -85,34 +104,63 @@ def run_with_monitor(container: DarjeelingContainer,
         # timeout used when checking since the .last_heartbeat property of
         # dronekit will no longer work as soon as a heartbeat_timeout
         # exception is encountered
-        vehicle = exit_stack.enter_context(
-            closing(dronekit.connect(url_dronekit,
-                                     heartbeat_timeout=timeout_heartbeat + 5)))
+        hub = exit_stack.enter_context(
+            MAVLinkHub(url_dronekit, heartbeat_timeout=timeout_heartbeat + 5))
+        vehicle = hub.vehicle
         logger.debug(f"connected to vehicle via DroneKit: {url_dronekit}")
+        clock = exit_stack.enter_context(SimClock().track(hub))
 
         # attach the attacker
+        attack_records: Sequence[AttackRecord] = ()
         if attack:
             logger.debug(f"launching attack: {attack}")
-            exit_stack.enter_context(attack.wait_and_send(url_attacker))
+            hub_attacker: Optional[MAVLinkHub] = hub
+            if not shared_connection:
+                try:
+                    hub_attacker = exit_stack.enter_context(
+                        MAVLinkHub(url_attacker, heartbeat_timeout=15))
+                except dronekit.TimeoutError:
+                    logger.debug("lost connection to vehicle -- "
+                                 "unable to attack")
+                    hub_attacker = None
+            if hub_attacker:
+                attack_records = exit_stack.enter_context(
+                    attack.wait_and_send(hub_attacker))
 
         # attach the monitor
         logger.debug("attaching monitor to vehicle...")
-        monitor.attach_to(url_monitor)
+        verdict = Verdict()
+        monitor.bind_verdict(verdict)
+        # monitors that only implement attach_to use their own connection
+        if shared_connection and monitor.supports_shared_connection:
+            monitor.attach_to_hub(hub)
+        else:
+            monitor.attach_to(url_monitor)
         exit_stack.enter_context(monitor)
         logger.debug("attached monitor to vehicle")
+        phases.lap('connect')
 
         # execute the mission
         timer = Stopwatch()
         timer.start()
+        timed_out = False
         try:
             logger.debug("executing mission...")
             mission.execute(vehicle,
                             timeout_mission=timeout,
-                            timeout_heartbeat=timeout_heartbeat)
+                            timeout_heartbeat=timeout_heartbeat,
+                            clock=clock,
+                            verdict=verdict,
+                            phases=phases)
+        except MissionAborted as exc:
+            logger.debug(f"mission aborted after {timer.duration:.2f} "
+                         f"seconds: {exc.reason}")
+            passed = False
         except TimeoutError:
             logger.debug("mission timed out after "
                          f"{timer.duration:.2f} seconds")
             passed = False
+            timed_out = True
         # allow a small amount of time for the message to arrive
         else:
             logger.debug("reached end of mission")
@@ -122,7 +170,185 @@ def run_with_monitor(container: DarjeelingContainer,
         timer.stop()
         logger.debug(f"finished mission execution after {timer.duration:.3f}s")
 
+        time_cpu = time.process_time() - time_cpu_start
+        logger.debug(f"used {time_cpu:.3f}s of CPU time "
+                     f"[shared connection: {shared_connection}]")
+
         # determine the outcome
         outcome = TestOutcome(passed, timer.duration)
         logger.debug(f"test outcome: {outcome}")
-        return outcome
+        achieved_speedup = clock.achieved_speedup
+        phases.lap('verdict')
+        exit_stack.close()
+        phases.lap('teardown')
+        # monitors may only grade a flight that did not finish once they
+        # have been closed
+        fitness = monitor.status.fitness
+
+    # the records are no longer updated once the attacker is detached
+    for index, record in enumerate(attack_records):
+        logger.debug(f"attack phase {index} record: {record}")
+
+    return ExecutionReport(outcome,
+                           achieved_speedup,
+                           fitness,
+                           phases.durations,
+                           timed_out,
+                           attack_records=tuple(attack_records))
+
+
+def _worker_loop(connection: Connection) -> None:
+    """Executes jobs received over a given connection until it is closed."""
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        fn, kwargs = job
+        result: Any = None
+        try:
+            result = fn(**kwargs)
+        except Exception:
+            logger.exception("worker failed to execute job")
+        connection.send(result)
+
+
+@attr.s(eq=False)
+class _Worker:
+    process: Process = attr.ib()
+    connection: Connection = attr.ib(repr=False)
+
+    def close(self) -> None:
+        """Forcibly terminates this worker."""
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+@attr.s
+class WorkerPool:
+    """Maintains a pool of long-lived processes that execute tests.
+
+    Jobs are sent to idle workers over a pipe. Workers are only replaced if
+    they exceed the time limit for a job or if they crash.
+
+    Attributes
+    ----------
+    size: int
+        The maximum number of workers, and thus of tests that may execute
+        concurrently.
+    """
+    size: int = attr.ib(factory=lambda: os.cpu_count() or 1)
+    _num_workers: int = attr.ib(init=False, default=0, repr=False)
+    _idle: List[_Worker] = attr.ib(init=False, factory=list, repr=False)
+    # guards the idle workers and the number of workers, and is notified
+    # whenever a worker becomes idle or is discarded
+    _condition: threading.Condition = \
+        attr.ib(init=False, factory=threading.Condition, repr=False)
+
+    def _spawn(self) -> _Worker:
+        connection_parent, connection_child = Pipe()
+        process = Process(target=_worker_loop,
+                          args=(connection_child,),
+                          daemon=True)
+        process.start()
+        connection_child.close()
+        logger.debug(f"spawned worker process: {process.pid}")
+        return _Worker(process, connection_parent)
+
+    def _acquire(self) -> _Worker:
+        """Returns an idle worker, or spawns a new worker if the pool is not
+        full. Otherwise, blocks until a worker becomes idle or is
+        discarded."""
+        with self._condition:
+            while not self._idle and self._num_workers >= self.size:
+                self._condition.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._num_workers += 1
+        try:
+            return self._spawn()
+        except BaseException:
+            with self._condition:
+                self._num_workers -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, worker: _Worker) -> None:
+        with self._condition:
+            self._idle.append(worker)
+            self._condition.notify()
+
+    def _discard(self, worker: _Worker) -> None:
+        logger.debug(f"discarding worker process: {worker.process.pid}")
+        worker.close()
+        # allow a blocked caller to spawn a replacement
+        with self._condition:
+            self._num_workers -= 1
+            self._condition.notify()
+
+    def run(self,
+            fn: Callable[..., Any],
+            timeout: float,
+            **kwargs: Any
+            ) -> Optional[Any]:
+        """Executes a function on an idle worker.
+
+        The function and its arguments must be picklable.
+
+        Returns
+        -------
+        Optional[Any]
+            The result of the function, or :code:`None` if the worker failed
+            to produce a result within the given number of seconds.
+        """
+        worker = self._acquire()
+        healthy = False
+        try:
+            worker.connection.send((fn, kwargs))
+            if not worker.connection.poll(timeout):
+                logger.debug("force terminating worker process after "
+                             f"{timeout:.2f} seconds")
+                return None
+            result = worker.connection.recv()
+            healthy = True
+            return result
+        except (EOFError, OSError):
+            logger.debug("worker process crashed")
+            return None
+        finally:
+            if healthy:
+                self._release(worker)
+            else:
+                self._discard(worker)
+
+    def run_with_monitor(self,
+                         timeout: float,
+                         **kwargs: Any
+                         ) -> ExecutionReport:
+        """Runs :func:`run_with_monitor` on an idle worker."""
+        timer = Stopwatch()
+        timer.start()
+        report = self.run(run_with_monitor, timeout, **kwargs)
+        timer.stop()
+        if report is None:
+            # the worker either exceeded its hard time limit and was killed,
+            # or it crashed before that limit was reached
+            return ExecutionReport(TestOutcome(False, timer.duration),
+                                   timed_out=timer.duration >= timeout,
+                                   error=True)
+        return report
+
+    def close(self) -> None:
+        """Shuts down all idle workers."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._num_workers -= len(idle)
+            self._condition.notify_all()
+        for worker in idle:
+            worker.connection.send(None)
+            worker.process.join()
+            worker.connection.close()
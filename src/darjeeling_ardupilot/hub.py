@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a hub that allows a single MAVLink connection to be
+shared by the mission driver, monitors, and attacks.
+"""
+__all__ = ('MAVLinkHub',)
+
+from typing import Any, Callable, Optional
+
+from loguru import logger
+import attr
+import dronekit
+
+MessageCallback = Callable[[Any], None]
+
+
+@attr.s
+class MAVLinkHub:
+    """Provides a DroneKit connection to a vehicle that is shared between
+    several clients.
+
+    Each message is decoded once by the connection and is then dispatched,
+    by message type, to all of its subscribers. As a result, only a single
+    handshake and parameter download are performed, regardless of the number
+    of clients.
+
+    Attributes
+    ----------
+    url: str
+        The MAVLink URL of the vehicle.
+    heartbeat_timeout: float
+        The number of seconds to wait for a heartbeat when connecting.
+    """
+    url: str = attr.ib()
+    heartbeat_timeout: float = attr.ib(default=15.0)
+    _vehicle: Optional[dronekit.Vehicle] = \
+        attr.ib(init=False, default=None, repr=False)
+
+    @property
+    def vehicle(self) -> dronekit.Vehicle:
+        """The shared connection to the vehicle."""
+        assert self._vehicle, "hub is not open"
+        return self._vehicle
+
+    def subscribe(self,
+                  message_type: str,
+                  callback: MessageCallback
+                  ) -> Callable[[], None]:
+        """Calls a given function whenever a message of a given type is
+        received from the vehicle.
+
+        Parameters
+        ----------
+        message_type: str
+            The name of the MAVLink message type (e.g., 'MISSION_CURRENT'), or
+            '*' to receive all messages.
+        callback: Callable[[Any], None]
+            The function that should be called with each message. The function
+            is called from the reader thread of the connection and should
+            return quickly.
+
+        Returns
+        -------
+        Callable[[], None]
+            A function that cancels the subscription when called.
+        """
+        def listener(vehicle, name, message) -> None:
+            callback(message)
+
+        vehicle = self.vehicle
+        vehicle.add_message_listener(message_type, listener)
+
+        def unsubscribe() -> None:
+            vehicle.remove_message_listener(message_type, listener)
+
+        return unsubscribe
+
+    def open(self) -> None:
+        """Connects to the vehicle."""
+        logger.debug(f"connecting hub to vehicle: {self.url}")
+        self._vehicle = dronekit.connect(
+            self.url, heartbeat_timeout=self.heartbeat_timeout)
+        logger.debug(f"connected hub to vehicle: {self.url}")
+
+    def close(self) -> None:
+        """Closes the connection to the vehicle."""
+        if self._vehicle:
+            self._vehicle.close()
+            self._vehicle = None
+
+    def __enter__(self) -> 'MAVLinkHub':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb) -> None:
+        self.close()
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides counters, gauges, and histograms that describe the
+throughput of the test harness, and exposes them in the Prometheus text
+format, either via a text file (e.g., for the textfile collector of the node
+exporter) or via a local HTTP endpoint.
+"""
+__all__ = ('Counter', 'Gauge', 'HarnessMetrics', 'Histogram',
+           'MetricsRegistry')
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import (Callable, Dict, Iterator, List, Mapping, Optional,
+                    Sequence, Tuple)
+import bisect
+import math
+import threading
+
+from loguru import logger
+import attr
+
+from .util import atomic_write
+
+LabelValues = Tuple[str, ...]
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# suitable for durations that range from milliseconds to several minutes
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   60.0, 120.0, 300.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for v in values)
+    pairs = ','.join(f'{n}="{v}"' for n, v in zip(names, escaped))
+    return f'{{{pairs}}}'
+
+
+@attr.s(eq=False)
+class _Metric:
+    name: str = attr.ib()
+    documentation: str = attr.ib()
+    labelnames: Tuple[str, ...] = attr.ib(default=())
+    _lock: threading.Lock = \
+        attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    TYPE = 'untyped'
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"expected labels {self.labelnames} for metric "
+                             f"[{self.name}] but received {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self) -> Iterator[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.TYPE}']
+        for suffix, labels, value in self._samples():
+            lines.append(f'{self.name}{suffix}{labels} '
+                         f'{_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+@attr.s(eq=False)
+class _ValueMetric(_Metric):
+    _values: Dict[LabelValues, float] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _function: Optional[Callable[[], float]] = \
+        attr.ib(init=False, default=None, repr=False)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Computes the value of this unlabelled metric by calling a given
+        function whenever the metric is exposed."""
+        if self.labelnames:
+            raise ValueError("only unlabelled metrics may use a function")
+        self._function = function
+
+    def value(self, **labels: str) -> float:
+        """Returns the current value of this metric for a given set of
+        labels."""
+        if self._function:
+            return self._function()
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def _samples(self) -> Iterator[Tuple[str, str, float]]:
+        if self._function:
+            yield ('', '', self._function())
+            return
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0.0)]
+        for key, value in values:
+            yield ('', _format_labels(self.labelnames, key), value)
+
+
+@attr.s(eq=False)
+class Counter(_ValueMetric):
+    """A value that only ever increases (e.g., the number of tests run)."""
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("counters may only be increased")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+@attr.s(eq=False)
+class Gauge(_ValueMetric):
+    """A value that may increase or decrease (e.g., the number of active
+    SITLs)."""
+    TYPE = 'gauge'
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+@attr.s(eq=False)
+class Histogram(_Metric):
+    """Counts observations (e.g., phase durations) in cumulative buckets."""
+    buckets: Tuple[float, ...] = attr.ib(default=DEFAULT_BUCKETS)
+    # bucket counts, followed by the count and sum, for each label set
+    _values: Dict[LabelValues, List[float]] = \
+        attr.ib(init=False, factory=dict, repr=False)
+
+    TYPE = 'histogram'
+
+    @buckets.validator
+    def validate_buckets(self, attribute, value) -> None:
+        if list(value) != sorted(value):
+            raise ValueError("histogram buckets must be in ascending order")
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                values[index] += 1
+            values[-2] += 1
+            values[-1] += value
+
+    def _samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            values = sorted((k, list(v)) for k, v in self._values.items())
+        names = self.labelnames + ('le',)
+        for key, counts in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                yield ('_bucket', labels, cumulative)
+            labels = _format_labels(names, key + ('+Inf',))
+            yield ('_bucket', labels, counts[-2])
+            labels = _format_labels(self.labelnames, key)
+            yield ('_count', labels, counts[-2])
+            yield ('_sum', labels, counts[-1])
+
+
+@attr.s
+class MetricsRegistry:
+    """Maintains a collection of metrics and exposes them in the Prometheus
+    text format.
+
+    Attributes
+    ----------
+    namespace: str
+        The prefix of the name of each metric.
+    """
+    namespace: str = attr.ib(default='darjeeling_ardupilot')
+    _metrics: Dict[str, _Metric] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _lock: threading.Lock = \
+        attr.ib(init=False, factory=threading.Lock, repr=False)
+    _server: Optional[ThreadingHTTPServer] = \
+        attr.ib(init=False, default=None, repr=False)
+
+    def _register(self, metric: _Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def counter(self,
+                name: str,
+                documentation: str,
+                labelnames: Sequence[str] = ()
+                ) -> Counter:
+        metric = Counter(f'{self.namespace}_{name}',
+                         documentation,
+                         tuple(labelnames))
+        self._register(metric)
+        return metric
+
+    def gauge(self,
+              name: str,
+              documentation: str,
+              labelnames: Sequence[str] = ()
+              ) -> Gauge:
+        metric = Gauge(f'{self.namespace}_{name}',
+                       documentation,
+                       tuple(labelnames))
+        self._register(metric)
+        return metric
+
+    def histogram(self,
+                  name: str,
+                  documentation: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS
+                  ) -> Histogram:
+        metric = Histogram(f'{self.namespace}_{name}',
+                           documentation,
+                           tuple(labelnames),
+                           tuple(buckets))
+        self._register(metric)
+        return metric
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return ''.join(m.render() for m in metrics)
+
+    def write(self, filename: str) -> None:
+        """Atomically writes all metrics to a given file in the Prometheus
+        text format."""
+        contents = self.render()
+        # the file is read by other users, such as the node exporter
+        with atomic_write(filename, permissions=0o644) as f:
+            f.write(contents)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> None:
+        """Exposes all metrics via HTTP at a given local address from a
+        background thread, until :meth:`close` is called.
+
+        Calling this method while the metrics are already being served has
+        no effect. If the address is already in use (e.g., by another
+        process), a warning is logged and the metrics are not served.
+        """
+        if self._server:
+            return
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            logger.warning("failed to serve metrics: "
+                           f"address already in use [{host}:{port}]")
+            return
+        server.daemon_threads = True
+        self._server = server
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        logger.info(f"serving metrics at http://{host}:{port}/metrics")
+
+    def close(self) -> None:
+        """Stops exposing metrics via HTTP."""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+@attr.s
+class HarnessMetrics:
+    """The metrics that describe the throughput of a test suite.
+
+    Attributes
+    ----------
+    registry: MetricsRegistry
+        The registry to which the metrics belong.
+    """
+    registry: MetricsRegistry = attr.ib(factory=MetricsRegistry)
+    tests: Counter = attr.ib(init=False)
+    test_duration: Histogram = attr.ib(init=False)
+    phase_duration: Histogram = attr.ib(init=False)
+    sitl_teardown: Histogram = attr.ib(init=False)
+    active_sitls: Gauge = attr.ib(init=False)
+    warm_sitls: Gauge = attr.ib(init=False)
+    sitl_pool_hits: Counter = attr.ib(init=False)
+    sitl_pool_misses: Counter = attr.ib(init=False)
+    outcome_cache_hits: Counter = attr.ib(init=False)
+    outcome_cache_misses: Counter = attr.ib(init=False)
+    ports_in_use: Gauge = attr.ib(init=False)
+    ports_available: Gauge = attr.ib(init=False)
+    port_lease_contention: Counter = attr.ib(init=False)
+    port_lease_wait: Counter = attr.ib(init=False)
+
+    def __attrs_post_init__(self) -> None:
+        registry = self.registry
+        self.tests = registry.counter(
+            'tests_total',
+            "Tests that were executed, by result: passed, failed, timeout, "
+            "or error (i.e., the SITL or the worker failed).",
+            ('result',))
+        self.test_duration = registry.histogram(
+            'test_duration_seconds',
+            "Wall-clock duration of each test execution.")
+        self.phase_duration = registry.histogram(
+            'phase_duration_seconds',
+            "Wall-clock duration of each phase of each test execution.",
+            ('phase',))
+        self.sitl_teardown = registry.histogram(
+            'sitl_teardown_seconds',
+            "Wall-clock duration of the background teardown of each SITL.")
+        self.active_sitls = registry.gauge(
+            'active_sitls',
+            "SITLs that are being used by a test or being torn down.")
+        self.warm_sitls = registry.gauge(
+            'warm_sitls',
+            "Pre-launched SITLs that are ready to be used by a test.")
+        self.sitl_pool_hits = registry.counter(
+            'sitl_pool_hits_total',
+            "SITL acquisitions that were served by a pre-launched SITL.")
+        self.sitl_pool_misses = registry.counter(
+            'sitl_pool_misses_total',
+            "SITL acquisitions that required a SITL to be launched.")
+        self.outcome_cache_hits = registry.counter(
+            'outcome_cache_hits_total',
+            "Test outcomes that were served by the outcome cache.")
+        self.outcome_cache_misses = registry.counter(
+            'outcome_cache_misses_total',
+            "Test outcomes that were not found in the outcome cache.")
+        self.ports_in_use = registry.gauge(
+            'ports_in_use',
+            "Local UDP ports that are currently leased.")
+        self.ports_available = registry.gauge(
+            'ports_available',
+            "Local UDP ports that may be leased.")
+        self.port_lease_contention = registry.counter(
+            'port_lease_contention_total',
+            "Port leases that had to wait for ports to be released.")
+        self.port_lease_wait = registry.counter(
+            'port_lease_wait_seconds_total',
+            "Time that port leases spent waiting for ports to be released.")
+
+    def observe_test(self,
+                     result: str,
+                     duration: float,
+                     phases: Mapping[str, float]
+                     ) -> None:
+        """Records the execution of a test."""
+        self.tests.inc(result=result)
+        self.test_duration.observe(duration)
+        for phase, phase_duration in phases.items():
+            self.phase_duration.observe(phase_duration, phase=phase)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a monitor that checks the vehicle while the mission is
+in flight, and ends the mission as soon as it is clear that the test will
+fail, rather than waiting for the mission to time out.
+"""
+__all__ = ('OnlineMonitor', 'OnlineOracle')
+
+from typing import Any, Dict, Optional, Tuple
+import contextlib
+
+from loguru import logger
+from pymavlink import mavutil
+import attr
+import dronekit
+
+from .ardu import Mission, distance_metres
+from .core import MonitorWrapper, Verdict
+from .hub import MAVLinkHub
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class OnlineOracle:
+    """Describes the conditions under which a mission should be failed while
+    it is in flight.
+
+    Attributes
+    ----------
+    min_altitude: float, optional
+        The lowest altitude, in metres relative to home, that the vehicle may
+        reach before it is considered to be below ground.
+    max_altitude: float, optional
+        The highest altitude, in metres relative to home, that the vehicle may
+        reach.
+    max_distance: float, optional
+        The greatest horizontal distance, in metres, that the vehicle may
+        travel from home.
+    no_progress_seconds: float, optional
+        The number of simulated seconds after which the mission is failed if
+        the vehicle has neither moved to a new mission item nor moved by at
+        least :code:`progress_distance` metres. The vehicle is additionally
+        allowed to hold its position for as long as its current mission item
+        requires (e.g., for a LOITER_TIME or NAV_DELAY item). If unspecified,
+        progress is not checked.
+    progress_distance: float
+        The distance, in metres, that the vehicle must move to be considered
+        to have made progress.
+    """
+    min_altitude: Optional[float] = -1.0
+    max_altitude: Optional[float] = None
+    max_distance: Optional[float] = None
+    no_progress_seconds: Optional[float] = None
+    progress_distance: float = 1.0
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> 'OnlineOracle':
+        defaults = OnlineOracle()
+        return OnlineOracle(
+            min_altitude=d.get('min-altitude', defaults.min_altitude),
+            max_altitude=d.get('max-altitude', defaults.max_altitude),
+            max_distance=d.get('max-distance', defaults.max_distance),
+            no_progress_seconds=d.get('no-progress-seconds',
+                                      defaults.no_progress_seconds),
+            progress_distance=d.get('progress-distance',
+                                    defaults.progress_distance))
+
+
+def _hold_seconds(command: dronekit.Command) -> float:
+    """Returns the number of simulated seconds for which the vehicle is
+    expected to hold its position while executing a given mission item."""
+    mavlink = mavutil.mavlink
+    if command.command == mavlink.MAV_CMD_NAV_LOITER_UNLIM:
+        return float('inf')
+    if command.command in (mavlink.MAV_CMD_NAV_WAYPOINT,
+                           mavlink.MAV_CMD_NAV_LOITER_TIME):
+        return max(float(command.param1), 0.0)
+    if command.command == mavlink.MAV_CMD_NAV_DELAY:
+        # a negative delay waits until a given time of day
+        if command.param1 < 0:
+            return float('inf')
+        return float(command.param1)
+    return 0.0
+
+
+@attr.s
+class OnlineMonitor(MonitorWrapper):
+    """Issues a verdict that ends the mission as soon as the vehicle goes
+    below ground, leaves its geofence, crashes, disarms before the end of
+    the mission, or stops making progress. The outcome of missions that run
+    to completion is determined by the underlying monitor.
+
+    Checks only begin once the vehicle has armed. All listeners are called
+    from the reader thread of the connection, so no locking is needed.
+
+    Attributes
+    ----------
+    mission: Mission
+        The mission that is being executed.
+    oracle: OnlineOracle
+        The conditions under which the mission should be failed.
+    """
+    mission: Mission = attr.ib(kw_only=True)
+    oracle: OnlineOracle = attr.ib(factory=OnlineOracle, kw_only=True)
+    _verdict: Optional[Verdict] = attr.ib(init=False, default=None)
+    _armed: bool = attr.ib(init=False, default=False, repr=False)
+    _waypoint: int = attr.ib(init=False, default=0, repr=False)
+    _hold_seconds: float = attr.ib(init=False, default=0.0, repr=False)
+    _progress: Optional[Tuple[float, dronekit.LocationGlobal]] = \
+        attr.ib(init=False, default=None, repr=False)
+
+    def bind_verdict(self, verdict: Verdict) -> None:
+        self._verdict = verdict
+        super().bind_verdict(verdict)
+
+    def _fail(self, reason: str) -> None:
+        if self._verdict:
+            self._verdict.issue(reason)
+
+    def _check_position(self, message: Any) -> None:
+        if not self._armed:
+            return
+        oracle = self.oracle
+        time = message.time_boot_ms / 1000
+        altitude = message.relative_alt / 1000
+        location = dronekit.LocationGlobal(message.lat / 1e7,
+                                           message.lon / 1e7,
+                                           altitude)
+
+        if oracle.min_altitude is not None and altitude < oracle.min_altitude:
+            self._fail(f"vehicle is below ground [altitude: {altitude:.2f} m]")
+            return
+        if oracle.max_altitude is not None and altitude > oracle.max_altitude:
+            self._fail("vehicle exceeded maximum altitude "
+                       f"[altitude: {altitude:.2f} m]")
+            return
+        if oracle.max_distance is not None:
+            lat, lon = self.mission.home_location[0:2]
+            home = dronekit.LocationGlobal(lat, lon, 0.0)
+            distance = distance_metres(home, location)
+            if distance > oracle.max_distance:
+                self._fail("vehicle left geofence "
+                           f"[distance from home: {distance:.2f} m]")
+                return
+
+        if oracle.no_progress_seconds is None:
+            return
+        if self._progress is None:
+            self._progress = (time, location)
+            return
+        time_progress, location_progress = self._progress
+        moved = distance_metres(location_progress, location)
+        climbed = abs(location_progress.alt - altitude)
+        if max(moved, climbed) >= oracle.progress_distance:
+            self._progress = (time, location)
+            return
+        time_allowed = oracle.no_progress_seconds + self._hold_seconds
+        if time - time_progress > time_allowed:
+            self._fail("vehicle made no progress for "
+                       f"{time - time_progress:.1f} simulated seconds")
+
+    def _check_heartbeat(self, message: Any) -> None:
+        if message.type == mavutil.mavlink.MAV_TYPE_GCS:
+            return
+        armed = bool(message.base_mode
+                     & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
+        if armed:
+            self._armed = True
+            return
+        # the vehicle may disarm once it has landed at the end of the mission
+        if self._armed and self._waypoint < len(self.mission) - 1:
+            self._fail("vehicle disarmed before completing the mission "
+                       f"[waypoint: {self._waypoint}]")
+
+    def _check_mission_current(self, message: Any) -> None:
+        # the command pointer rolls back to zero upon mission completion
+        if message.seq == 0:
+            return
+        if message.seq != self._waypoint:
+            self._waypoint = message.seq
+            self._progress = None
+            if message.seq < len(self.mission):
+                self._hold_seconds = _hold_seconds(self.mission[message.seq])
+            else:
+                self._hold_seconds = 0.0
+
+    def _check_statustext(self, message: Any) -> None:
+        if message.text.startswith('Crash'):
+            self._fail(f"vehicle crashed: {message.text}")
+
+    def _open(self, hub: MAVLinkHub, exit_stack: contextlib.ExitStack) -> None:
+        if not self._verdict:
+            logger.warning(f"no verdict bound to monitor: {self}")
+        listeners = [('GLOBAL_POSITION_INT', self._check_position),
+                     ('HEARTBEAT', self._check_heartbeat),
+                     ('MISSION_CURRENT', self._check_mission_current),
+                     ('STATUSTEXT', self._check_statustext)]
+        for message_type, listener in listeners:
+            exit_stack.callback(hub.subscribe(message_type, listener))
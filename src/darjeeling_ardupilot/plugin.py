@@ -2,11 +2,18 @@
 """
 This module will provide a plugin for Darjeeling that adds CMT support.
 """
-__all__ = ('StartTest',)
+__all__ = ('StartTest', 'StartTestSuite', 'StartTestSuiteConfig',
+           'StartTestSuiteOutcome')
 
 from typing import (Tuple, Dict, Any, Sequence, NoReturn, Mapping, Iterator,
-                    Optional, Callable)
+                    Optional, Callable, Iterable, FrozenSet, Set)
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextlib
+import functools
+import hashlib
 import os
+import threading
 
 import attr
 import bugzoo
@@ -17,13 +24,24 @@ from darjeeling.test import TestSuite, TestSuiteConfig
 from darjeeling.util import Stopwatch
 from darjeeling.exceptions import BadConfigurationException
 from loguru import logger
+from pymavlink import mavutil
 
 from .ardu import Mission, SITL
 from .core import Monitor
-from .attack import Attack
+from .attack import Attack, AttackRecord, AttackSchedule
+from .corridor import CorridorMonitor
+from .online import OnlineMonitor, OnlineOracle
 from .simple import SimpleMonitor
-from .util import CircleIntBuffer
-from .executor import run_with_monitor_in_process
+from .similarity import SimilarityMonitor
+from .trajectory import TrajectoryMonitor
+from .pool import SITLPool
+from .router import Endpoint
+from .cache import OutcomeCache
+from .metrics import HarnessMetrics
+from .speedup import SpeedupController
+from .timing import PhaseStatistics, PhaseTimer
+from .util import InstanceAllocator, PortAllocator, unix_socket_paths
+from .executor import ExecutionReport, WorkerPool
 
 
 @attr.s(frozen=True, auto_attribs=True)
@@ -36,9 +54,9 @@ class StartTest:
         The unique name of the test case.
     parameters_filename: str
         The absolute path to the parameters file inside the container.
-    attack: Attack, optional
-        A description of the dynamic attack that should take place during the
-        test.
+    attack: AttackSchedule, optional
+        A description of the dynamic attack, which may consist of several
+        phases, that should take place during the test.
     mission: Mission
         The mission that should be executed by the vehicle.
     timeout_secs: int
@@ -46,14 +64,17 @@ class StartTest:
         mission is cancelled.
     timeout_secs_without_speedup: int
         The maximum number of seconds, when speedup is not applied, before the
-        mission is cancelled.
+        mission is cancelled. Since this timeout is enforced in simulated
+        time, it is unaffected by the speedup that is actually achieved.
     speedup: int
-        The simulator speedup that should be used during execution.
+        The simulator speedup that should be used during execution. If the
+        suite uses adaptive speedup, this is the speedup that is used until a
+        better one has been learned.
     """
     name: str
     mission: Mission
     parameters_filename: str = attr.ib()
-    attack: Optional[Attack] = attr.ib(default=None)
+    attack: Optional[AttackSchedule] = attr.ib(default=None)
     timeout_secs: int = attr.ib(default=300)
     speedup: int = attr.ib(default=1)
 
@@ -61,6 +82,19 @@ class StartTest:
     def timeout_secs_without_speedup(self) -> int:
         return self.timeout_secs * self.speedup
 
+    @property
+    def fingerprint(self) -> str:
+        """A digest of the definition of this test, excluding its name."""
+        digest = hashlib.sha256()
+        for c in self.mission:
+            fields = (c.frame, c.command, c.param1, c.param2, c.param3,
+                      c.param4, c.x, c.y, c.z)
+            digest.update(repr(fields).encode('utf-8'))
+        definition = (self.parameters_filename, self.attack,
+                      self.timeout_secs, self.speedup)
+        digest.update(repr(definition).encode('utf-8'))
+        return digest.hexdigest()
+
     @staticmethod
     def from_dict(d: Dict[str, Any], dir_: str) -> 'StartTest':
         """Loads a test description from a given dictionary.
@@ -113,11 +147,18 @@ class StartTest:
         timeout_secs = d['timeout-seconds']
 
         # fetch attack
-        attack: Optional[Attack]
-        if 'attack' in d:
-            attack = Attack.from_dict(d['attack'])
-        else:
-            attack = None
+        if 'attack' in d and 'attacks' in d:
+            err("test definition must not specify both 'attack' and "
+                "'attacks' properties")
+        attack: Optional[AttackSchedule] = None
+        try:
+            if 'attack' in d:
+                phase = Attack.from_dict(d['attack']).to_phase()
+                attack = AttackSchedule((phase,))
+            elif 'attacks' in d:
+                attack = AttackSchedule.from_dicts(d['attacks'])
+        except (KeyError, ValueError) as exc:
+            err(f"bad attack definition: {exc}")
 
         return StartTest(name=name,
                          attack=attack,
@@ -137,10 +178,88 @@ class StartTestSuiteConfig(TestSuiteConfig):
         A description of the tests within this test suite.
     model: str
         The vehicle model that should be tested.
+    warm_sitls: bool
+        If :code:`True`, the SITL for the next test will be launched in the
+        background while the current test is running.
+    shared_connection: bool
+        If :code:`True`, the mission driver, monitor, and attacker share a
+        single MAVLink connection to the vehicle.
+    outcome_cache_filename: str, optional
+        The absolute path of the file that should be used to persist test
+        outcomes across SITL binaries with identical contents. If
+        unspecified, outcomes are not cached.
+    outcome_cache_size: int
+        The maximum number of outcomes that should be cached.
+    adaptive_speedup: bool
+        If :code:`True`, the speedup of each test is chosen automatically
+        based on the speedups that its previous runs achieved.
+    adaptive_speedup_filename: str, optional
+        The absolute path of the file that should be used to persist learned
+        speedups. If unspecified, learned speedups are not persisted.
+    adaptive_speedup_max: int
+        The highest speedup that may be chosen for any test.
+    trajectory_directory: str, optional
+        The absolute path of the directory to which the trajectory of each
+        test should be written. If unspecified, trajectories are not
+        recorded.
+    reference_directory: str, optional
+        The absolute path of the directory that contains a reference
+        trajectory for each test. If specified, each flight must also stay
+        close to the reference trajectory of its test, and a fitness score is
+        reported for each test.
+    similarity_threshold: float
+        The maximum distance, in metres, between a flight and its reference
+        trajectory.
+    similarity_method: str
+        The method that is used to compare a flight against its reference
+        trajectory: either 'time' or 'dtw'.
+    online_oracle: OnlineOracle, optional
+        The conditions under which a test should be failed while its mission
+        is in flight. If unspecified, tests are only judged once their
+        mission has finished or timed out.
+    corridor_width: float, optional
+        The greatest horizontal distance, in metres, that the vehicle may
+        stray from the legs of its mission. If unspecified, the path of the
+        vehicle between waypoints is not checked.
+    port_range: Tuple[int, int]
+        The first and last local UDP ports that may be leased to the MAVLink
+        clients of each SITL. Each SITL leases three ports.
+    transport: str
+        The transport between each SITL and its MAVLink clients: either
+        'udp', which uses local UDP ports, or 'unix', which uses Unix domain
+        stream sockets and does not consume any ports. The latter requires
+        pymavlink 2.4.50 or later.
+    metrics_filename: str, optional
+        The absolute path of the file to which metrics should be written in
+        the Prometheus text format after each test. If unspecified, metrics
+        are not written to a file.
+    metrics_port: int, optional
+        The local port on which metrics should be served via HTTP in the
+        Prometheus text format. If unspecified, metrics are not served.
+    metrics_host: str
+        The address on which metrics should be served via HTTP.
     """
     NAME = 'start'
     tests: Sequence[StartTest] = attr.ib()
     model: str = attr.ib()
+    warm_sitls: bool = attr.ib(default=False)
+    shared_connection: bool = attr.ib(default=True)
+    outcome_cache_filename: Optional[str] = attr.ib(default=None)
+    outcome_cache_size: int = attr.ib(default=10000)
+    adaptive_speedup: bool = attr.ib(default=False)
+    adaptive_speedup_filename: Optional[str] = attr.ib(default=None)
+    adaptive_speedup_max: int = attr.ib(default=50)
+    trajectory_directory: Optional[str] = attr.ib(default=None)
+    reference_directory: Optional[str] = attr.ib(default=None)
+    similarity_threshold: float = attr.ib(default=10.0)
+    similarity_method: str = attr.ib(default='time')
+    online_oracle: Optional[OnlineOracle] = attr.ib(default=None)
+    corridor_width: Optional[float] = attr.ib(default=None)
+    port_range: Tuple[int, int] = attr.ib(default=(13000, 13500))
+    transport: str = attr.ib(default='udp')
+    metrics_filename: Optional[str] = attr.ib(default=None)
+    metrics_port: Optional[int] = attr.ib(default=None)
+    metrics_host: str = attr.ib(default='127.0.0.1')
 
     @classmethod
     def from_dict(cls,
@@ -165,16 +284,212 @@ class StartTestSuiteConfig(TestSuiteConfig):
             err("test suite definition is missing 'tests' section")
         tests = [StartTest.from_dict(dd, dir_) for dd in d['tests']]
 
-        return StartTestSuiteConfig(tests=tests, model=vehicle)
+        warm_sitls = d.get('warm-sitls', False)
+        if not isinstance(warm_sitls, bool):
+            err("'warm-sitls' property must be a boolean")
+
+        shared_connection = d.get('shared-connection', True)
+        if not isinstance(shared_connection, bool):
+            err("'shared-connection' property must be a boolean")
+
+        outcome_cache_filename: Optional[str] = None
+        outcome_cache_size = 10000
+        if 'outcome-cache' in d:
+            d_cache = d['outcome-cache']
+            if 'filename' not in d_cache:
+                err("'outcome-cache' section is missing 'filename' property")
+            outcome_cache_filename = d_cache['filename']
+            if not os.path.isabs(outcome_cache_filename):
+                outcome_cache_filename = \
+                    os.path.join(dir_, outcome_cache_filename)
+            outcome_cache_size = d_cache.get('size', outcome_cache_size)
+
+        adaptive_speedup = 'adaptive-speedup' in d
+        adaptive_speedup_filename: Optional[str] = None
+        adaptive_speedup_max = 50
+        if adaptive_speedup:
+            d_speedup = d['adaptive-speedup'] or {}
+            adaptive_speedup_filename = d_speedup.get('filename')
+            if adaptive_speedup_filename \
+                    and not os.path.isabs(adaptive_speedup_filename):
+                adaptive_speedup_filename = \
+                    os.path.join(dir_, adaptive_speedup_filename)
+            adaptive_speedup_max = d_speedup.get('max', adaptive_speedup_max)
+            if not isinstance(adaptive_speedup_max, int) \
+                    or adaptive_speedup_max < 1:
+                err("'adaptive-speedup.max' must be a positive integer")
+
+        trajectory_directory: Optional[str] = d.get('trajectory-directory')
+        if trajectory_directory and not os.path.isabs(trajectory_directory):
+            trajectory_directory = os.path.join(dir_, trajectory_directory)
+
+        reference_directory: Optional[str] = None
+        similarity_threshold = 10.0
+        similarity_method = 'time'
+        if 'trajectory-oracle' in d:
+            d_oracle = d['trajectory-oracle']
+            if 'references' not in d_oracle:
+                err("'trajectory-oracle' section is missing 'references' "
+                    "property")
+            reference_directory = d_oracle['references']
+            if not os.path.isabs(reference_directory):
+                reference_directory = os.path.join(dir_, reference_directory)
+            similarity_threshold = \
+                float(d_oracle.get('threshold', similarity_threshold))
+            similarity_method = d_oracle.get('method', similarity_method)
+            if similarity_method not in ('time', 'dtw'):
+                err("'trajectory-oracle.method' must be 'time' or 'dtw'")
+
+        online_oracle: Optional[OnlineOracle] = None
+        if d.get('online-oracle'):
+            d_online = d['online-oracle']
+            if d_online is True:
+                d_online = {}
+            if not isinstance(d_online, dict):
+                err("'online-oracle' property must be a boolean or a section")
+            online_oracle = OnlineOracle.from_dict(d_online)
+
+        corridor_width: Optional[float] = d.get('corridor-width')
+        if corridor_width is not None:
+            if not isinstance(corridor_width, (int, float)) \
+                    or corridor_width <= 0:
+                err("'corridor-width' property must be a positive number")
+            corridor_width = float(corridor_width)
+
+        port_range = d.get('port-range', [13000, 13500])
+        if not isinstance(port_range, list) or len(port_range) != 2 \
+                or not all(isinstance(p, int) for p in port_range) \
+                or not 0 < port_range[0] <= port_range[1] < 65536:
+            err("'port-range' property must be a list of two port numbers "
+                "in ascending order")
+
+        transport = d.get('transport', 'udp')
+        if transport not in ('udp', 'unix'):
+            err("'transport' property must be 'udp' or 'unix'")
+        # clients connect to Unix domain stream sockets via 'uds:' URLs,
+        # which older versions of pymavlink do not understand
+        if transport == 'unix' and not hasattr(mavutil, 'mavuds'):
+            err("'unix' transport requires pymavlink 2.4.50 or later, which "
+                "supports 'uds:' connections")
+
+        metrics_filename: Optional[str] = None
+        metrics_port: Optional[int] = None
+        metrics_host = '127.0.0.1'
+        if 'metrics' in d:
+            d_metrics = d['metrics'] or {}
+            metrics_filename = d_metrics.get('filename')
+            if metrics_filename and not os.path.isabs(metrics_filename):
+                metrics_filename = os.path.join(dir_, metrics_filename)
+            metrics_port = d_metrics.get('port')
+            if metrics_port is not None \
+                    and (not isinstance(metrics_port, int)
+                         or not 0 < metrics_port < 65536):
+                err("'metrics.port' property must be a port number")
+            metrics_host = d_metrics.get('host', metrics_host)
+            if not metrics_filename and metrics_port is None:
+                err("'metrics' section must specify a 'filename' or a "
+                    "'port' property")
+
+        return StartTestSuiteConfig(
+            tests=tests,
+            model=vehicle,
+            warm_sitls=warm_sitls,
+            shared_connection=shared_connection,
+            outcome_cache_filename=outcome_cache_filename,
+            outcome_cache_size=outcome_cache_size,
+            adaptive_speedup=adaptive_speedup,
+            adaptive_speedup_filename=adaptive_speedup_filename,
+            adaptive_speedup_max=adaptive_speedup_max,
+            trajectory_directory=trajectory_directory,
+            reference_directory=reference_directory,
+            similarity_threshold=similarity_threshold,
+            similarity_method=similarity_method,
+            online_oracle=online_oracle,
+            corridor_width=corridor_width,
+            port_range=(port_range[0], port_range[1]),
+            transport=transport,
+            metrics_filename=metrics_filename,
+            metrics_port=metrics_port,
+            metrics_host=metrics_host)
 
     def build(self, environment: darjeeling.Environment) -> 'StartTestSuite':
         tests = {t.name: t for t in self.tests}
+        port_pool_mavlink = PortAllocator(*self.port_range)
+        instances = InstanceAllocator()
+        sitl_pool: Optional[SITLPool] = None
+        if self.warm_sitls:
+            sitl_pool = SITLPool(port_pool_mavlink,
+                                 instances,
+                                 transport=self.transport)
+        outcome_cache: Optional[OutcomeCache] = None
+        if self.outcome_cache_filename:
+            outcome_cache = OutcomeCache(self.outcome_cache_filename,
+                                         self.outcome_cache_size)
+        speedup_controller: Optional[SpeedupController] = None
+        if self.adaptive_speedup:
+            speedup_controller = SpeedupController(
+                self.adaptive_speedup_filename,
+                maximum=self.adaptive_speedup_max)
         return StartTestSuite(tests=tests,
                               environment=environment,
-                              model=self.model)
+                              model=self.model,
+                              port_pool_mavlink=port_pool_mavlink,
+                              transport=self.transport,
+                              instances=instances,
+                              sitl_pool=sitl_pool,
+                              shared_connection=self.shared_connection,
+                              outcome_cache=outcome_cache,
+                              speedup_controller=speedup_controller,
+                              trajectory_directory=self.trajectory_directory,
+                              reference_directory=self.reference_directory,
+                              similarity_threshold=self.similarity_threshold,
+                              similarity_method=self.similarity_method,
+                              online_oracle=self.online_oracle,
+                              corridor_width=self.corridor_width,
+                              metrics_filename=self.metrics_filename,
+                              metrics_port=self.metrics_port,
+                              metrics_host=self.metrics_host)
 
 
 MonitorFactory = Callable[[StartTest, Mission], Monitor]
+Job = Tuple[DarjeelingContainer, StartTest]
+
+
+@attr.s(frozen=True, auto_attribs=True)
+class StartTestSuiteOutcome:
+    """Describes the outcome of evaluating a program against a test suite.
+
+    Attributes
+    ----------
+    outcomes: Mapping[str, TestOutcome]
+        The outcomes of the tests that were executed, indexed by name.
+    skipped: FrozenSet[str]
+        The names of the tests that were not executed since an earlier test
+        had already failed.
+    fitness: Mapping[str, float]
+        The fitness score of each executed test for which one was computed,
+        indexed by name.
+    phases: Mapping[str, Mapping[str, float]]
+        The number of seconds spent in each phase of each executed test,
+        indexed by test name and then by phase. Tests whose outcomes were
+        cached are omitted.
+    attack_records: Mapping[str, Sequence[AttackRecord]]
+        A record of each attack phase, including its trigger latency, of each
+        executed test that has an attack, indexed by test name.
+    """
+    outcomes: Mapping[str, TestOutcome]
+    skipped: FrozenSet[str] = attr.ib(default=frozenset())
+    fitness: Mapping[str, float] = attr.ib(factory=dict)
+    phases: Mapping[str, Mapping[str, float]] = attr.ib(factory=dict)
+    attack_records: Mapping[str, Sequence[AttackRecord]] = \
+        attr.ib(factory=dict)
+
+    @property
+    def successful(self) -> bool:
+        """Indicates whether every test in the suite was executed and
+        passed."""
+        return not self.skipped \
+            and all(o.successful for o in self.outcomes.values())
 
 
 @attr.s(str=False, repr=False, auto_attribs=True)
@@ -182,9 +497,68 @@ class StartTestSuite(TestSuite):
     _tests: Mapping[str, StartTest]
     _environment: darjeeling.Environment
     _model: str
-    _port_pool_mavlink: CircleIntBuffer = \
-        attr.ib(default=CircleIntBuffer(13000, 13500))
+    _port_pool_mavlink: PortAllocator = attr.ib(factory=PortAllocator)
+    _instances: InstanceAllocator = attr.ib(factory=InstanceAllocator)
+    _transport: str = attr.ib(default='udp')
     _timeout_heartbeat: float = attr.ib(default=5)
+    _timeout_ready: float = attr.ib(default=30)
+    _timeout_wall_factor: float = attr.ib(default=4.0)
+    _sitl_pool: Optional[SITLPool] = attr.ib(default=None)
+    _workers: WorkerPool = attr.ib(factory=WorkerPool)
+    _shared_connection: bool = attr.ib(default=True)
+    _outcome_cache: Optional[OutcomeCache] = attr.ib(default=None)
+    _speedup_controller: Optional[SpeedupController] = attr.ib(default=None)
+    _trajectory_directory: Optional[str] = attr.ib(default=None)
+    _reference_directory: Optional[str] = attr.ib(default=None)
+    _similarity_threshold: float = attr.ib(default=10.0)
+    _similarity_method: str = attr.ib(default='time')
+    _online_oracle: Optional[OnlineOracle] = attr.ib(default=None)
+    _corridor_width: Optional[float] = attr.ib(default=None)
+    _metrics: HarnessMetrics = attr.ib(factory=HarnessMetrics)
+    _metrics_filename: Optional[str] = attr.ib(default=None)
+    _metrics_port: Optional[int] = attr.ib(default=None)
+    _metrics_host: str = attr.ib(default='127.0.0.1')
+    _history: Dict[str, Tuple[int, int]] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _history_lock: threading.Lock = \
+        attr.ib(init=False, factory=threading.Lock, repr=False)
+    _fitness: Dict[Tuple[str, str], float] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _phases: Dict[Tuple[str, str], Mapping[str, float]] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _attack_records: Dict[Tuple[str, str], Sequence[AttackRecord]] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _phase_statistics: Dict[str, PhaseStatistics] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _teardowns: ThreadPoolExecutor = \
+        attr.ib(init=False, factory=ThreadPoolExecutor, repr=False)
+    _pending_teardowns: Dict[str, Set['futures.Future[None]']] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _active_containers: Dict[str, int] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _idle_containers: Dict[str, DarjeelingContainer] = \
+        attr.ib(init=False, factory=dict, repr=False)
+
+    def __attrs_post_init__(self) -> None:
+        metrics = self._metrics
+        ports = self._port_pool_mavlink
+        metrics.ports_in_use.set_function(lambda: ports.in_use)
+        metrics.ports_available.set_function(lambda: ports.size)
+        metrics.port_lease_contention.set_function(lambda: ports.contention)
+        metrics.port_lease_wait.set_function(lambda: ports.wait_time)
+        sitl_pool = self._sitl_pool
+        if sitl_pool:
+            metrics.warm_sitls.set_function(lambda: sitl_pool.num_warm)
+            metrics.sitl_pool_hits.set_function(lambda: sitl_pool.hits)
+            metrics.sitl_pool_misses.set_function(lambda: sitl_pool.misses)
+        outcome_cache = self._outcome_cache
+        if outcome_cache:
+            metrics.outcome_cache_hits.set_function(
+                lambda: outcome_cache.hits)
+            metrics.outcome_cache_misses.set_function(
+                lambda: outcome_cache.misses)
+        if self._metrics_port is not None:
+            metrics.registry.serve(self._metrics_port, self._metrics_host)
 
     def __getitem__(self, name: str) -> StartTest:
         return self._tests[name]
@@ -202,27 +576,452 @@ class StartTestSuite(TestSuite):
         description = ', '.join(str(self[t]) for t in self._tests)
         return f"StartTestSuite({description})"
 
+    @contextlib.contextmanager
+    def _launch_sitl(self,
+                     container: DarjeelingContainer,
+                     test: StartTest,
+                     speedup: int
+                     ) -> Iterator[Tuple[str, ...]]:
+        """Provides the MAVLink URLs of a ready SITL for a given test."""
+        sitl_args = {'container': container,
+                     'model': self._model,
+                     'parameters_filename': test.parameters_filename,
+                     'home': test.mission.home_location,
+                     'speedup': speedup}
+        if self._sitl_pool:
+            with self._sitl_pool.acquire(**sitl_args) as urls:
+                yield urls
+            return
+
+        with contextlib.ExitStack() as stack:
+            instance = stack.enter_context(
+                self._instances.lease(container.id))
+            endpoints: Tuple[Endpoint, ...]
+            if self._transport == 'unix':
+                endpoints = stack.enter_context(unix_socket_paths(3))
+            else:
+                endpoints = \
+                    stack.enter_context(self._port_pool_mavlink.lease(3))
+            urls = stack.enter_context(
+                SITL.launch(endpoints=endpoints,
+                            timeout_ready=self._timeout_ready,
+                            instance=instance,
+                            **sitl_args))
+            yield urls
+
     def _execute_with_monitor(self,
                               container: DarjeelingContainer,
                               test: StartTest,
                               monitor: Monitor,
                               speedup: int,
-                              timeout_mission: int
-                              ) -> TestOutcome:
-        timeout_overall = timeout_mission + 10
-        ip_address = container.ip_address
-        ports_mavlink = self._port_pool_mavlink.take(3)
-        kwargs = {'mission': test.mission,
-                  'container': container,
-                  'model': self._model,
-                  'parameters_filename': test.parameters_filename,
-                  'monitor': monitor,
-                  'attack': test.attack,
-                  'speedup': speedup,
-                  'timeout': timeout_mission,
-                  'timeout_heartbeat': self._timeout_heartbeat,
-                  'ports_mavlink': ports_mavlink}
-        return run_with_monitor_in_process(**kwargs)
+                              timeout_mission: int,
+                              job_next: Optional[Job] = None
+                              ) -> ExecutionReport:
+        """Executes a test using a given monitor.
+
+        Raises
+        ------
+        TimeoutError
+            If the SITL failed to become ready.
+        """
+        # allow the achieved speedup to fall below the requested speedup
+        # before the test is forcibly terminated
+        timeout_overall = \
+            timeout_mission / speedup * self._timeout_wall_factor + 10
+        phases = PhaseTimer()
+        with contextlib.ExitStack() as stack:
+            with phases.measure('boot'):
+                urls = stack.enter_context(
+                    self._launch_sitl(container, test, speedup))
+            self._metrics.active_sitls.inc()
+            stack.callback(self._metrics.active_sitls.dec)
+            # launch the SITL for the next test while this one is running
+            if self._sitl_pool and job_next:
+                container_next, test_next = job_next
+                self._sitl_pool.prelaunch(
+                    container=container_next,
+                    model=self._model,
+                    parameters_filename=test_next.parameters_filename,
+                    home=test_next.mission.home_location,
+                    speedup=self._speedup(test_next))
+            kwargs = {'urls': urls,
+                      'mission': test.mission,
+                      'monitor': monitor,
+                      'attack': test.attack,
+                      'timeout': timeout_mission,
+                      'timeout_heartbeat': self._timeout_heartbeat,
+                      'shared_connection': self._shared_connection}
+            report = self._workers.run_with_monitor(timeout_overall, **kwargs)
+            # the worker reports the phases of the execution itself, including
+            # the teardown of its connections to the vehicle
+            phases.update(report.phases)
+            # the SITL is torn down while the next test is being set up
+            future = self._teardowns.submit(self._teardown,
+                                            test,
+                                            stack.pop_all())
+            with self._history_lock:
+                pending = self._pending_teardowns.setdefault(container.id,
+                                                             set())
+                pending.add(future)
+            future.add_done_callback(
+                functools.partial(self._discard_teardown, container.id))
+
+        durations = phases.durations
+        summary = ', '.join(f'{phase}: {duration:.3f}s'
+                            for phase, duration in durations.items())
+        logger.debug(f"phase durations for test [{test.name}]: {summary}")
+        return attr.evolve(report, phases=durations)
+
+    def _teardown(self, test: StartTest, stack: contextlib.ExitStack) -> None:
+        """Destroys the SITL that was used by a given test, and releases the
+        resources that it holds."""
+        timer = Stopwatch()
+        timer.start()
+        try:
+            stack.close()
+        except Exception:
+            logger.exception("failed to tear down SITL for test "
+                             f"[{test.name}]")
+        timer.stop()
+        logger.debug(f"tore down SITL for test [{test.name}] after "
+                     f"{timer.duration:.3f}s")
+        self._metrics.sitl_teardown.observe(timer.duration)
+        with self._history_lock:
+            self._statistics(test).add({'sitl_teardown': timer.duration})
+
+    def wait_for_teardowns(self,
+                           container: Optional[DarjeelingContainer] = None
+                           ) -> None:
+        """Blocks until the SITLs that are being torn down in the background
+        have been destroyed.
+
+        Parameters
+        ----------
+        container: DarjeelingContainer, optional
+            If given, only the SITLs that belong to this container are waited
+            for. By default, the SITLs of all containers are waited for.
+        """
+        with self._history_lock:
+            if container is None:
+                pending = [f for fs in self._pending_teardowns.values()
+                           for f in fs]
+            else:
+                pending = list(self._pending_teardowns.get(container.id, ()))
+        futures.wait(pending)
+
+    def _discard_teardown(self,
+                          container_id: str,
+                          future: 'futures.Future[None]'
+                          ) -> None:
+        with self._history_lock:
+            pending = self._pending_teardowns.get(container_id)
+            if pending is not None:
+                pending.discard(future)
+                if not pending:
+                    del self._pending_teardowns[container_id]
+
+    def release_container(self, container: DarjeelingContainer) -> None:
+        """Destroys all SITLs that belong to a given container, including
+        those that were pre-launched for it, so that the container may safely
+        be destroyed."""
+        with self._history_lock:
+            self._idle_containers.pop(container.id, None)
+        self.wait_for_teardowns(container)
+        if self._sitl_pool:
+            self._sitl_pool.discard(container)
+
+    @contextlib.contextmanager
+    def _using(self,
+               container: DarjeelingContainer,
+               *,
+               release_idle: bool = False
+               ) -> Iterator[None]:
+        """Marks a given container as in use for the duration of the context.
+
+        Before the context is entered, the background teardowns of all other
+        containers that are no longer in use are waited for, since those
+        containers may be destroyed at any point once the next container is
+        used. Their pre-launched SITLs are kept, since they may still be used
+        by a later test, unless :code:`release_idle` is set.
+        """
+        with self._history_lock:
+            self._active_containers[container.id] = \
+                self._active_containers.get(container.id, 0) + 1
+            self._idle_containers.pop(container.id, None)
+            idle = list(self._idle_containers.values())
+            if release_idle:
+                self._idle_containers.clear()
+        for other in idle:
+            if release_idle:
+                self.release_container(other)
+            else:
+                self.wait_for_teardowns(other)
+        try:
+            yield
+        finally:
+            with self._history_lock:
+                self._active_containers[container.id] -= 1
+                if not self._active_containers[container.id]:
+                    del self._active_containers[container.id]
+                    self._idle_containers[container.id] = container
+
+    def _speedup(self, test: StartTest) -> int:
+        """Returns the speedup that should be used to execute a given test."""
+        if self._speedup_controller:
+            return self._speedup_controller.speedup(test.name, test.speedup)
+        return test.speedup
+
+    def trajectory_filename(self,
+                            container: DarjeelingContainer,
+                            test: StartTest
+                            ) -> Optional[str]:
+        """Returns the file that the most recent trajectory of a given test
+        inside a given container is written to, or :code:`None` if
+        trajectories are not recorded."""
+        if not self._trajectory_directory:
+            return None
+        return os.path.join(self._trajectory_directory,
+                            container.id,
+                            f'{test.name}.traj')
+
+    def fitness(self,
+                container: DarjeelingContainer,
+                test: StartTest
+                ) -> Optional[float]:
+        """Returns the fitness score of the most recent execution of a given
+        test inside a given container, or :code:`None` if no score was
+        computed."""
+        with self._history_lock:
+            return self._fitness.get((container.id, test.name))
+
+    def _record_fitness(self,
+                        container: DarjeelingContainer,
+                        test: StartTest,
+                        fitness: Optional[float]
+                        ) -> None:
+        with self._history_lock:
+            if fitness is None:
+                self._fitness.pop((container.id, test.name), None)
+            else:
+                self._fitness[(container.id, test.name)] = fitness
+
+    def phase_durations(self,
+                        container: DarjeelingContainer,
+                        test: StartTest
+                        ) -> Optional[Mapping[str, float]]:
+        """Returns the number of seconds spent in each phase of the most
+        recent execution of a given test inside a given container, or
+        :code:`None` if the test was not executed."""
+        with self._history_lock:
+            return self._phases.get((container.id, test.name))
+
+    def attack_records(self,
+                       container: DarjeelingContainer,
+                       test: StartTest
+                       ) -> Optional[Sequence[AttackRecord]]:
+        """Returns a record of each attack phase of the most recent execution
+        of a given test inside a given container, or :code:`None` if the test
+        has no attack or was not executed."""
+        with self._history_lock:
+            return self._attack_records.get((container.id, test.name))
+
+    def _record_attack_records(self,
+                               container: DarjeelingContainer,
+                               test: StartTest,
+                               records: Sequence[AttackRecord]
+                               ) -> None:
+        with self._history_lock:
+            if not records:
+                self._attack_records.pop((container.id, test.name), None)
+            else:
+                self._attack_records[(container.id, test.name)] = records
+
+    def phase_percentiles(self,
+                          test: StartTest,
+                          percentiles: Sequence[float] = (50, 90, 99)
+                          ) -> Dict[str, Dict[float, float]]:
+        """Computes percentiles of the number of seconds spent in each phase
+        across the recent executions of a given test.
+
+        Returns
+        -------
+        Dict[str, Dict[float, float]]
+            The number of seconds at each percentile, indexed by phase and
+            then by percentile.
+        """
+        with self._history_lock:
+            statistics = self._phase_statistics.get(test.name)
+            if not statistics:
+                return {}
+            return statistics.percentiles(percentiles)
+
+    def _record_phases(self,
+                       container: DarjeelingContainer,
+                       test: StartTest,
+                       phases: Optional[Mapping[str, float]]
+                       ) -> None:
+        with self._history_lock:
+            if not phases:
+                self._phases.pop((container.id, test.name), None)
+                return
+            self._phases[(container.id, test.name)] = phases
+            self._statistics(test).add(phases)
+
+    def _statistics(self, test: StartTest) -> PhaseStatistics:
+        """Returns the phase statistics of a given test. Must be called while
+        holding the history lock."""
+        statistics = self._phase_statistics.get(test.name)
+        if statistics is None:
+            statistics = PhaseStatistics()
+            self._phase_statistics[test.name] = statistics
+        return statistics
+
+    def _record(self, test: StartTest, outcome: TestOutcome) -> None:
+        """Records the outcome of a test in the failure history."""
+        with self._history_lock:
+            failures, runs = self._history.get(test.name, (0, 0))
+            if not outcome.successful:
+                failures += 1
+            self._history[test.name] = (failures, runs + 1)
+
+    def failure_likelihood(self, test: StartTest) -> float:
+        """Estimates the likelihood that a given test will fail, based on the
+        outcomes of its previous executions."""
+        with self._history_lock:
+            failures, runs = self._history.get(test.name, (0, 0))
+        return (failures + 1) / (runs + 2)
+
+    def _cache_key(self,
+                   container: DarjeelingContainer,
+                   test: StartTest,
+                   speedup: int
+                   ) -> Optional[str]:
+        """Computes the outcome cache key for a given test and container, or
+        returns :code:`None` if the key could not be computed.
+
+        Besides the SITL binary and the test itself, the key covers the
+        speedup at which the test is executed and the settings of the oracles
+        that judge its outcome.
+        """
+        binary = SITL.binary_for_model(self._model)
+        cmd = f'sha256sum {binary} {test.parameters_filename}'
+        result = container.shell.run(cmd)
+        if result.returncode != 0:
+            logger.warning(f"failed to compute digest of SITL binary: {cmd}")
+            return None
+        digest = hashlib.sha256(result.output.encode('utf-8'))
+        digest.update(self._model.encode('utf-8'))
+        digest.update(test.fingerprint.encode('utf-8'))
+        oracles = (self._online_oracle,
+                   self._corridor_width,
+                   self._reference_directory,
+                   self._similarity_threshold,
+                   self._similarity_method)
+        digest.update(repr((speedup, oracles)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _execute(self,
+                 container: DarjeelingContainer,
+                 test: StartTest,
+                 job_next: Optional[Job],
+                 *,
+                 coverage: bool = False
+                 ) -> TestOutcome:
+        # coverage can only be obtained by executing the test
+        speedup = self._speedup(test)
+        cache_key: Optional[str] = None
+        if self._outcome_cache and not coverage:
+            cache_key = self._cache_key(container, test, speedup)
+        if cache_key:
+            assert self._outcome_cache
+            cached_outcome = self._outcome_cache.get(cache_key)
+            if cached_outcome:
+                logger.debug(f"using cached outcome for test [{test.name}]: "
+                             f"{cached_outcome}")
+                self._record(test, cached_outcome)
+                self._record_fitness(container, test, None)
+                self._record_phases(container, test, None)
+                self._record_attack_records(container, test, ())
+                return cached_outcome
+
+        monitor: Monitor = SimpleMonitor(mission=test.mission)
+        if self._online_oracle:
+            monitor = OnlineMonitor(monitor,
+                                    mission=test.mission,
+                                    oracle=self._online_oracle)
+        if self._corridor_width:
+            monitor = CorridorMonitor(monitor,
+                                      mission=test.mission,
+                                      width=self._corridor_width)
+        fn_trajectory = self.trajectory_filename(container, test)
+        if self._reference_directory:
+            fn_reference = os.path.join(self._reference_directory,
+                                        f'{test.name}.traj')
+            monitor = SimilarityMonitor(monitor,
+                                        fn_trajectory,
+                                        reference_filename=fn_reference,
+                                        threshold=self._similarity_threshold,
+                                        method=self._similarity_method)
+        elif fn_trajectory:
+            monitor = TrajectoryMonitor(monitor, fn_trajectory)
+        timer = Stopwatch()
+        timer.start()
+        try:
+            report = self._execute_with_monitor(
+                container,
+                test,
+                monitor,
+                speedup=speedup,
+                timeout_mission=test.timeout_secs_without_speedup,
+                job_next=job_next)
+        except TimeoutError:
+            # infrastructure failures are not cached
+            logger.debug("SITL failed to become ready")
+            outcome = TestOutcome(False, timer.duration)
+            self._record_fitness(container, test, None)
+            self._record_phases(container, test, None)
+            self._record_attack_records(container, test, ())
+            self._metrics.observe_test('error', timer.duration, {})
+        else:
+            outcome = report.outcome
+            if report.error:
+                result = 'timeout' if report.timed_out else 'error'
+            elif outcome.successful:
+                result = 'passed'
+            elif report.timed_out:
+                result = 'timeout'
+            else:
+                result = 'failed'
+            self._metrics.observe_test(result, timer.duration, report.phases)
+            self._record_fitness(container, test, report.fitness)
+            self._record_phases(container, test, report.phases)
+            self._record_attack_records(container, test,
+                                        report.attack_records)
+            if report.error:
+                # infrastructure failures are neither cached nor learned from
+                logger.debug("test execution failed due to an "
+                             f"infrastructure error: {test.name}")
+            else:
+                if self._speedup_controller:
+                    self._speedup_controller.update(test.name,
+                                                    speedup,
+                                                    report.achieved_speedup)
+                if cache_key:
+                    assert self._outcome_cache
+                    self._outcome_cache.put(cache_key, outcome)
+        self._record(test, outcome)
+        self._write_metrics()
+        return outcome
+
+    def _write_metrics(self) -> None:
+        """Writes the current metrics to the metrics file, if any."""
+        if not self._metrics_filename:
+            return
+        try:
+            self._metrics.registry.write(self._metrics_filename)
+        except OSError:
+            logger.warning("failed to write metrics file: "
+                           f"{self._metrics_filename}")
 
     def execute(self,
                 container: DarjeelingContainer,
@@ -230,11 +1029,151 @@ class StartTestSuite(TestSuite):
                 *,
                 coverage: bool = False
                 ) -> TestOutcome:
-        """Executes a given test case inside a container."""
-        monitor = SimpleMonitor(mission=test.mission)
-        outcome = self._execute_with_monitor(container,
-                                             test,
-                                             monitor,
-                                             speedup=test.speedup,
-                                             timeout_mission=test.timeout_secs)
-        return outcome
+        """Executes a given test case inside a container.
+
+        No SITL is pre-launched, since the test that will be executed next is
+        not known.
+        """
+        with self._using(container):
+            return self._execute(container, test, None, coverage=coverage)
+
+    def evaluate(self,
+                 container: DarjeelingContainer,
+                 *,
+                 stop_on_failure: bool = True
+                 ) -> StartTestSuiteOutcome:
+        """Executes all tests in this suite inside a given container.
+
+        Tests are executed in descending order of their historical likelihood
+        of failure.
+
+        Parameters
+        ----------
+        container: DarjeelingContainer
+            The container that the tests should be executed in.
+        stop_on_failure: bool
+            If :code:`True`, no further tests are executed once a test has
+            failed, and those tests are reported as skipped.
+        """
+        # the containers of earlier evaluations are unlikely to be used again
+        with self._using(container, release_idle=True):
+            return self._evaluate(container, stop_on_failure)
+
+    def _evaluate(self,
+                  container: DarjeelingContainer,
+                  stop_on_failure: bool
+                  ) -> StartTestSuiteOutcome:
+        tests = sorted(self._tests.values(),
+                       key=self.failure_likelihood,
+                       reverse=True)
+        outcomes: Dict[str, TestOutcome] = {}
+        fitness: Dict[str, float] = {}
+        phases: Dict[str, Mapping[str, float]] = {}
+        attack_records: Dict[str, Sequence[AttackRecord]] = {}
+        for index, test in enumerate(tests):
+            tests_after = tests[index + 1:]
+            job_next = (container, tests_after[0]) if tests_after else None
+            outcome = self._execute(container, test, job_next)
+            outcomes[test.name] = outcome
+            test_fitness = self.fitness(container, test)
+            if test_fitness is not None:
+                fitness[test.name] = test_fitness
+            test_phases = self.phase_durations(container, test)
+            if test_phases is not None:
+                phases[test.name] = test_phases
+            test_attack_records = self.attack_records(container, test)
+            if test_attack_records is not None:
+                attack_records[test.name] = test_attack_records
+            if stop_on_failure and not outcome.successful:
+                skipped = frozenset(t.name for t in tests_after)
+                logger.debug(f"test [{test.name}] failed: "
+                             f"skipping remaining tests {sorted(skipped)}")
+                self.release_container(container)
+                return StartTestSuiteOutcome(outcomes, skipped, fitness,
+                                             phases, attack_records)
+        # the container may be destroyed once the suite has been evaluated
+        self.release_container(container)
+        return StartTestSuiteOutcome(outcomes,
+                                     fitness=fitness,
+                                     phases=phases,
+                                     attack_records=attack_records)
+
+    def close(self) -> None:
+        """Destroys all SITLs that belong to this suite, shuts down its
+        workers, and stops serving metrics via HTTP."""
+        with self._history_lock:
+            self._idle_containers.clear()
+        self.wait_for_teardowns()
+        if self._sitl_pool:
+            self._sitl_pool.close()
+        self._teardowns.shutdown()
+        self._workers.close()
+        self._metrics.registry.close()
+
+    def _execute_job(self, job: Job, job_next: Optional[Job]) -> TestOutcome:
+        container, test = job
+        with self._using(container):
+            return self._execute(container, test, job_next)
+
+    def execute_many(self,
+                     jobs: Iterable[Tuple[DarjeelingContainer, StartTest]],
+                     *,
+                     max_concurrency: Optional[int] = None
+                     ) -> Iterator[Tuple[DarjeelingContainer,
+                                         StartTest,
+                                         TestOutcome]]:
+        """Executes several tests concurrently.
+
+        Tests that share a container are run on separate SITL instances.
+        Since the order of the tests is known, the SITL for each test is
+        pre-launched while an earlier test is running: when a test finishes,
+        the next test to be started takes its place.
+
+        Parameters
+        ----------
+        jobs: Iterable[Tuple[DarjeelingContainer, StartTest]]
+            The tests that should be executed, and the container that each
+            should be executed in.
+        max_concurrency: int, optional
+            The maximum number of tests that may execute at the same time. By
+            default, this is equal to the size of the worker pool, which is
+            based on the number of CPUs.
+
+        Returns
+        -------
+        Iterator[Tuple[DarjeelingContainer, StartTest, TestOutcome]]
+            The outcome of each test, together with its container and test,
+            in the order in which the tests finish.
+        """
+        if max_concurrency is None:
+            max_concurrency = self._workers.size
+        logger.debug(f"executing tests with concurrency: {max_concurrency}")
+        jobs = list(jobs)
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            future_to_job = {}
+            for index, job in enumerate(jobs):
+                # the first jobs start immediately, and each later job starts
+                # once one of the jobs that are running has finished
+                index_next = index + max_concurrency
+                job_next = jobs[index_next] if index_next < len(jobs) \
+                    else None
+                future = executor.submit(self._execute_job, job, job_next)
+                future_to_job[future] = job
+            try:
+                for future in as_completed(future_to_job):
+                    container, test = future_to_job[future]
+                    yield container, test, future.result()
+            finally:
+                for future in future_to_job:
+                    future.cancel()
+                executor.shutdown()
+                # discard any SITLs that were pre-launched for cancelled jobs
+                if self._sitl_pool:
+                    containers = {c.id: c for (c, _) in jobs}
+                    for container in containers.values():
+                        self._sitl_pool.discard(container)
+                ports = self._port_pool_mavlink
+                logger.debug(f"port leases: {ports.leases} "
+                             f"[contention: {ports.contention}, "
+                             f"wait time: {ports.wait_time:.3f}s, "
+                             f"probe failures: {ports.probe_failures}]")
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a pool of pre-launched SITLs that allows tests to attach
+to an already-running simulator rather than paying its startup costs.
+"""
+__all__ = ('SITLPool',)
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Dict, Iterator, List, Optional, Tuple
+from threading import Lock
+from timeit import default_timer as timer
+import contextlib
+
+from darjeeling import ProgramContainer as DarjeelingContainer
+from loguru import logger
+import attr
+
+from .ardu import SITL
+from .router import Endpoint
+from .util import InstanceAllocator, PortAllocator, unix_socket_paths
+
+SITLKey = Tuple[str, str, Tuple[float, float, float, float], int]
+
+
+@attr.s(eq=False)
+class _WarmSITL:
+    """A SITL, and its MAVLink endpoints, that has been launched ahead of
+    time."""
+    container_id: str = attr.ib()
+    instance: int = attr.ib()
+    urls: Tuple[str, ...] = attr.ib()
+    stack: ExitStack = attr.ib(repr=False)
+    time_ready: float = attr.ib(factory=timer)
+
+    def close(self) -> None:
+        logger.debug(f"closing warm SITL: {self}")
+        try:
+            self.stack.close()
+        except Exception:
+            logger.exception(f"failed to cleanly close warm SITL: {self}")
+
+
+@attr.s
+class SITLPool:
+    """Maintains a pool of pre-launched SITLs for each container.
+
+    SITLs are keyed by their model, parameters file, home location, and
+    speedup. Each SITL is used by at most one test since its vehicle state is
+    modified by the mission that it flies.
+
+    Attributes
+    ----------
+    idle_timeout: float
+        The number of seconds that a ready SITL may remain unused before it is
+        evicted from the pool.
+    timeout_ready: float
+        The maximum number of seconds to wait for a SITL to become ready.
+    transport: str
+        The transport between each SITL and its MAVLink clients: either 'udp'
+        or 'unix'.
+    hits: int
+        The number of acquisitions that were served by a pre-launched SITL.
+    misses: int
+        The number of acquisitions that required a SITL to be launched.
+    """
+    _port_pool: PortAllocator = attr.ib()
+    _instances: InstanceAllocator = attr.ib(factory=InstanceAllocator)
+    idle_timeout: float = attr.ib(default=120.0)
+    timeout_ready: float = attr.ib(default=30.0)
+    transport: str = attr.ib(default='udp')
+    hits: int = attr.ib(init=False, default=0)
+    misses: int = attr.ib(init=False, default=0)
+    _lock: Lock = attr.ib(init=False, factory=Lock, repr=False)
+    _warm: Dict[Tuple[str, SITLKey], List['Future[_WarmSITL]']] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _executor: ThreadPoolExecutor = \
+        attr.ib(init=False, factory=ThreadPoolExecutor, repr=False)
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of acquisitions that were served by a warm SITL."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def num_warm(self) -> int:
+        """The number of pre-launched SITLs that are ready to be used."""
+        with self._lock:
+            return sum(1 for futures in self._warm.values()
+                       for future in futures
+                       if future.done() and not future.exception())
+
+    def _launch(self,
+                container: DarjeelingContainer,
+                key: SITLKey
+                ) -> _WarmSITL:
+        model, parameters_filename, home, speedup = key
+        container_id = container.id
+        instance = self._instances.allocate(container_id)
+        stack = ExitStack()
+        stack.callback(self._instances.release, container_id, instance)
+        try:
+            endpoints: Tuple[Endpoint, ...]
+            if self.transport == 'unix':
+                endpoints = stack.enter_context(unix_socket_paths(3))
+            else:
+                endpoints = stack.enter_context(self._port_pool.lease(3))
+            urls = stack.enter_context(
+                SITL.launch(container=container,
+                            model=model,
+                            parameters_filename=parameters_filename,
+                            home=home,
+                            endpoints=endpoints,
+                            speedup=speedup,
+                            timeout_ready=self.timeout_ready,
+                            instance=instance))
+        except BaseException:
+            stack.close()
+            raise
+        return _WarmSITL(container_id=container_id,
+                         instance=instance,
+                         urls=urls,
+                         stack=stack)
+
+    def _take(self,
+              container: DarjeelingContainer,
+              key: SITLKey
+              ) -> Optional[_WarmSITL]:
+        """Takes a pre-launched SITL from the pool, if there is one."""
+        while True:
+            with self._lock:
+                futures = self._warm.get((container.id, key))
+                if not futures:
+                    return None
+                future = futures.pop(0)
+            try:
+                return future.result()
+            except Exception:
+                logger.exception("failed to pre-launch SITL")
+
+    def prelaunch(self,
+                  container: DarjeelingContainer,
+                  model: str,
+                  parameters_filename: str,
+                  home: Tuple[float, float, float, float],
+                  speedup: int
+                  ) -> None:
+        """Launches a SITL in the background so that it is ready for a future
+        call to :meth:`acquire` with the same configuration."""
+        key: SITLKey = (model, parameters_filename, home, speedup)
+        logger.debug(f"pre-launching SITL for container [{container.id}]: "
+                     f"{key}")
+        future = self._executor.submit(self._launch, container, key)
+        with self._lock:
+            self._warm.setdefault((container.id, key), []).append(future)
+
+    @contextlib.contextmanager
+    def acquire(self,
+                container: DarjeelingContainer,
+                model: str,
+                parameters_filename: str,
+                home: Tuple[float, float, float, float],
+                speedup: int
+                ) -> Iterator[Tuple[str, ...]]:
+        """Provides the MAVLink URLs of a ready SITL with a given
+        configuration, launching one if none has been pre-launched. The SITL
+        is destroyed upon leaving the context."""
+        self.evict_idle()
+        key: SITLKey = (model, parameters_filename, home, speedup)
+        warm = self._take(container, key)
+        if warm:
+            with self._lock:
+                self.hits += 1
+            logger.debug(f"using pre-launched SITL: {warm}")
+        else:
+            with self._lock:
+                self.misses += 1
+            logger.debug(f"no pre-launched SITL available for key: {key}")
+            warm = self._launch(container, key)
+        logger.debug(f"SITL pool hit rate: {self.hit_rate:.2f} "
+                     f"[hits: {self.hits}, misses: {self.misses}]")
+        try:
+            yield warm.urls
+        finally:
+            warm.close()
+
+    def evict_idle(self) -> None:
+        """Destroys all ready SITLs that have exceeded the idle timeout."""
+        evicted: List[_WarmSITL] = []
+        time_now = timer()
+        with self._lock:
+            for futures in self._warm.values():
+                for future in list(futures):
+                    if not future.done():
+                        continue
+                    if future.exception():
+                        futures.remove(future)
+                        continue
+                    warm = future.result()
+                    if time_now - warm.time_ready > self.idle_timeout:
+                        futures.remove(future)
+                        evicted.append(warm)
+            self._warm = {k: v for k, v in self._warm.items() if v}
+        for warm in evicted:
+            logger.debug(f"evicting idle SITL: {warm}")
+            warm.close()
+
+    def discard(self, container: DarjeelingContainer) -> None:
+        """Destroys all pre-launched SITLs for a given container."""
+        with self._lock:
+            keys = [k for k in self._warm if k[0] == container.id]
+            futures = [f for k in keys for f in self._warm.pop(k)]
+        for future in futures:
+            try:
+                future.result().close()
+            except Exception:
+                logger.exception("failed to pre-launch SITL")
+
+    def close(self) -> None:
+        """Destroys all SITLs within the pool."""
+        with self._lock:
+            futures = [f for fs in self._warm.values() for f in fs]
+            self._warm = {}
+        for future in futures:
+            try:
+                future.result().close()
+            except Exception:
+                logger.exception("failed to pre-launch SITL")
+        self._executor.shutdown()
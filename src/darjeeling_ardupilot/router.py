@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a lightweight, in-process MAVLink router that forwards
+raw MAVLink frames between a SITL and several local clients.
+
+Clients are reached over either UDP or Unix domain stream sockets. Unix
+domain sockets avoid the kernel UDP stack and do not consume local ports,
+which allows many more SITLs to run concurrently on the same host.
+"""
+__all__ = ('Endpoint', 'MAVLinkRouter', 'endpoint_url')
+
+from typing import List, Optional, Set, Tuple, Union
+from timeit import default_timer as timer
+import asyncio
+import contextlib
+import os
+import threading
+
+from loguru import logger
+import attr
+
+MAGIC_V1 = 0xFE
+MAGIC_V2 = 0xFD
+MAVLINK_IFLAG_SIGNED = 0x01
+
+# frames are dropped for stream clients that fall this far behind, just as
+# they would be for UDP clients
+STREAM_BUFFER_LIMIT = 1 << 20
+
+# a local UDP port, or the path of a Unix domain socket
+Endpoint = Union[int, str]
+
+
+def endpoint_url(endpoint: Endpoint) -> str:
+    """Returns the MAVLink URL that a client should use to connect to a given
+    router endpoint."""
+    if isinstance(endpoint, str):
+        return f'uds:{endpoint}'
+    return f'udp:127.0.0.1:{endpoint}'
+
+
+def frame_length(buffer: bytearray) -> Optional[int]:
+    """Computes the length of the MAVLink frame at the start of a buffer.
+
+    Returns
+    -------
+    Optional[int]
+        The length of the frame in bytes, or :code:`None` if the buffer does
+        not yet contain enough bytes to determine the length of the frame.
+
+    Raises
+    ------
+    ValueError
+        If the buffer does not start with a MAVLink frame.
+    """
+    if len(buffer) < 3:
+        return None
+    magic = buffer[0]
+    length_payload = buffer[1]
+    if magic == MAGIC_V1:
+        return 8 + length_payload
+    if magic == MAGIC_V2:
+        length = 12 + length_payload
+        if buffer[2] & MAVLINK_IFLAG_SIGNED:
+            length += 13
+        return length
+    raise ValueError(f"buffer does not start with a MAVLink frame: {magic}")
+
+
+def split_frames(buffer: bytearray) -> List[bytes]:
+    """Removes and returns all complete MAVLink frames from a given buffer.
+
+    Any bytes that do not belong to a frame are discarded. Incomplete frames
+    are left at the start of the buffer.
+    """
+    frames: List[bytes] = []
+    while buffer:
+        try:
+            length = frame_length(buffer)
+        except ValueError:
+            # discard bytes until the start of the next frame
+            index_v1 = buffer.find(MAGIC_V1, 1)
+            index_v2 = buffer.find(MAGIC_V2, 1)
+            indices = [i for i in (index_v1, index_v2) if i != -1]
+            del buffer[:min(indices) if indices else len(buffer)]
+            continue
+        if length is None or length > len(buffer):
+            break
+        frames.append(bytes(buffer[:length]))
+        del buffer[:length]
+    return frames
+
+
+class _EndpointProtocol(asyncio.DatagramProtocol):
+    """Forwards datagrams sent by a local client to the SITL."""
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self._writer = writer
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self._writer.write(data)
+
+    def error_received(self, exc: Exception) -> None:
+        # the client may not have bound to its port yet
+        pass
+
+
+class _StreamEndpoint:
+    """Accepts clients on a Unix domain socket, forwards frames sent by
+    those clients to the SITL, and sends frames from the SITL to those
+    clients."""
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self._writer = writer
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def handle_client(self,
+                            reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter
+                            ) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._tasks.add(task)
+        self._clients.add(writer)
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                buffer += data
+                # only whole frames are forwarded so that the frames of
+                # different clients are not interleaved
+                for frame in split_frames(buffer):
+                    self._writer.write(frame)
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            if task is not None:
+                self._tasks.discard(task)
+            writer.close()
+
+    def send(self, frame: bytes) -> None:
+        for client in self._clients:
+            if client.transport.get_write_buffer_size() < STREAM_BUFFER_LIMIT:
+                client.write(frame)
+
+    async def close(self) -> None:
+        """Disconnects all clients and waits for their handlers to finish."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for client in list(self._clients):
+            client.close()
+
+
+@attr.s
+class MAVLinkRouter:
+    """Forwards raw MAVLink frames between the TCP endpoint of a SITL and a
+    number of local UDP endpoints.
+
+    Frames are forwarded without being decoded or re-encoded. Frames from
+    the SITL are sent to every endpoint, and frames from each endpoint are
+    sent to the SITL.
+
+    Attributes
+    ----------
+    host: str
+        The host (e.g., container IP address) of the SITL.
+    port: int
+        The MAVLink TCP port of the SITL.
+    endpoints: Tuple[Endpoint, ...]
+        The local endpoints to which frames should be forwarded. Each is
+        either a UDP port, to which clients should bind, or the path of a
+        Unix domain socket, which the router creates and to which clients
+        should connect.
+    timeout_connect: float
+        The maximum number of seconds to wait when connecting to the SITL.
+    """
+    host: str = attr.ib()
+    port: int = attr.ib()
+    endpoints: Tuple[Endpoint, ...] = attr.ib()
+    timeout_connect: float = attr.ib(default=10.0)
+    _thread: Optional[threading.Thread] = \
+        attr.ib(init=False, default=None, repr=False)
+    _loop: Optional[asyncio.AbstractEventLoop] = \
+        attr.ib(init=False, default=None, repr=False)
+    _task: Optional['asyncio.Task[None]'] = \
+        attr.ib(init=False, default=None, repr=False)
+    _ready: threading.Event = \
+        attr.ib(init=False, factory=threading.Event, repr=False)
+    _error: Optional[Exception] = attr.ib(init=False, default=None, repr=False)
+
+    @property
+    def urls(self) -> Tuple[str, ...]:
+        """The MAVLink URLs that clients should use to connect to the SITL."""
+        return tuple(endpoint_url(e) for e in self.endpoints)
+
+    async def _connect(self
+                       ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        time_stop = timer() + self.timeout_connect
+        while True:
+            time_left = max(0.1, time_stop - timer())
+            try:
+                return await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), time_left)
+            except (ConnectionRefusedError, asyncio.TimeoutError):
+                if timer() > time_stop:
+                    m = (f"unable to connect to [{self.host}:{self.port}] "
+                         f"after {self.timeout_connect} seconds")
+                    raise TimeoutError(m)
+                await asyncio.sleep(0.05)
+
+    async def _main(self) -> None:
+        loop = asyncio.get_event_loop()
+        reader, writer = await self._connect()
+        transports: List[asyncio.DatagramTransport] = []
+        streams: List[_StreamEndpoint] = []
+        servers: List[asyncio.AbstractServer] = []
+        try:
+            for endpoint in self.endpoints:
+                if isinstance(endpoint, str):
+                    stream = _StreamEndpoint(writer)
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(endpoint)
+                    servers.append(await asyncio.start_unix_server(
+                        stream.handle_client, path=endpoint))
+                    streams.append(stream)
+                    continue
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _EndpointProtocol(writer),
+                    remote_addr=('127.0.0.1', endpoint))
+                transports.append(transport)  # type: ignore
+            self._ready.set()
+
+            buffer = bytearray()
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    logger.debug("SITL closed MAVLink connection")
+                    return
+                buffer += data
+                for frame in split_frames(buffer):
+                    for transport in transports:
+                        transport.sendto(frame)
+                    for stream in streams:
+                        stream.send(frame)
+        finally:
+            for transport in transports:
+                transport.close()
+            for server in servers:
+                server.close()
+            for stream in streams:
+                await stream.close()
+            for endpoint in self.endpoints:
+                if isinstance(endpoint, str):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(endpoint)
+            writer.close()
+
+    def _run(self) -> None:
+        assert self._loop
+        asyncio.set_event_loop(self._loop)
+        self._task = self._loop.create_task(self._main())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        except Exception as err:
+            logger.exception("MAVLink router failed")
+            self._error = err
+        finally:
+            self._ready.set()
+            self._loop.close()
+
+    def start(self) -> None:
+        """Connects to the SITL and begins forwarding frames.
+
+        Raises
+        ------
+        TimeoutError
+            If the router was unable to connect to the SITL.
+        """
+        logger.debug(f"starting MAVLink router: {self}")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error:
+            self._thread.join()
+            raise self._error
+        logger.debug(f"started MAVLink router: {self}")
+
+    def stop(self) -> None:
+        """Stops forwarding frames and closes all connections."""
+        assert self._loop and self._thread
+        if self._task:
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:
+                # the loop has already been closed
+                pass
+        self._thread.join()
+        logger.debug(f"stopped MAVLink router: {self}")
+
+    def __enter__(self) -> 'MAVLinkRouter':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb) -> None:
+        self.stop()
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides an oracle that judges a flight by comparing its
+trajectory against a reference trajectory for the same mission.
+
+Positions are projected onto a local plane, in metres, around the first
+position of the reference trajectory. Trajectories are aligned at takeoff,
+which is the first sample at which the vehicle is more than
+:code:`TAKEOFF_ALTITUDE` metres above home, so that differences in the time
+taken to boot and arm the vehicle do not affect the comparison.
+"""
+__all__ = ('SimilarityMonitor', 'SimilarityMonitorStatus', 'dtw_distance',
+           'fitness', 'local_positions', 'time_aligned_distance')
+
+from typing import Optional, Tuple
+import os
+
+from loguru import logger
+import attr
+import numpy as np
+
+from .core import MonitorStatus
+from .trajectory import Trajectory, TrajectoryMonitor
+
+EARTH_RADIUS = 6378137.0
+TAKEOFF_ALTITUDE = 1.0
+
+
+def local_positions(trajectory: Trajectory,
+                    origin: Optional[Tuple[float, float]] = None
+                    ) -> Tuple[np.ndarray, np.ndarray]:
+    """Computes the local position of each position sample of a trajectory.
+
+    Parameters
+    ----------
+    trajectory: Trajectory
+        The trajectory.
+    origin: Tuple[float, float], optional
+        The latitude and longitude, in degrees, of the origin of the local
+        plane. Defaults to the first position of the trajectory.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The number of simulated seconds since takeoff at which each sample
+        was taken, and an (N, 3) array of the north, east, and up offsets of
+        each sample, in metres.
+    """
+    positions = trajectory.positions
+    if len(positions) == 0:
+        return np.empty(0), np.empty((0, 3))
+    times = np.frombuffer(positions.column('time_boot_ms'), dtype=np.uint32)
+    lat = np.frombuffer(positions.column('lat'), dtype=np.int32) * 1e-7
+    lon = np.frombuffer(positions.column('lon'), dtype=np.int32) * 1e-7
+    alt = np.frombuffer(positions.column('relative_alt'),
+                        dtype=np.int32) * 1e-3
+    if origin is None:
+        origin = (lat[0], lon[0])
+    lat_origin, lon_origin = np.radians(origin)
+
+    north = (np.radians(lat) - lat_origin) * EARTH_RADIUS
+    east = (np.radians(lon) - lon_origin) * EARTH_RADIUS * np.cos(lat_origin)
+    xyz = np.column_stack((north, east, alt))
+
+    airborne = np.flatnonzero(alt > TAKEOFF_ALTITUDE)
+    index_takeoff = int(airborne[0]) if len(airborne) else 0
+    seconds = (times.astype(np.float64) - times[index_takeoff]) * 1e-3
+    return seconds[index_takeoff:], xyz[index_takeoff:]
+
+
+def time_aligned_distance(times_reference: np.ndarray,
+                          xyz_reference: np.ndarray,
+                          times_candidate: np.ndarray,
+                          xyz_candidate: np.ndarray
+                          ) -> float:
+    """Computes the root-mean-square distance, in metres, between a candidate
+    and reference trajectory at each time of the reference trajectory.
+
+    The candidate trajectory is linearly interpolated at each time of the
+    reference trajectory. If the candidate trajectory ends before the
+    reference trajectory, its final position is used for the remaining
+    times.
+    """
+    if len(times_reference) == 0 or len(times_candidate) == 0:
+        return float('inf')
+    interpolated = np.column_stack(
+        [np.interp(times_reference, times_candidate, xyz_candidate[:, axis])
+         for axis in range(3)])
+    distances = np.linalg.norm(interpolated - xyz_reference, axis=1)
+    return float(np.sqrt(np.mean(distances ** 2)))
+
+
+def _resample(times: np.ndarray,
+              xyz: np.ndarray,
+              interval: float
+              ) -> np.ndarray:
+    """Resamples a trajectory at a fixed interval of simulated seconds."""
+    times_resampled = np.arange(times[0], times[-1] + interval, interval)
+    return np.column_stack([np.interp(times_resampled, times, xyz[:, axis])
+                            for axis in range(3)])
+
+
+def dtw_distance(times_reference: np.ndarray,
+                 xyz_reference: np.ndarray,
+                 times_candidate: np.ndarray,
+                 xyz_candidate: np.ndarray,
+                 *,
+                 interval: float = 1.0
+                 ) -> float:
+    """Computes the dynamic time warping distance, in metres, between a
+    candidate and reference trajectory.
+
+    Unlike :func:`time_aligned_distance`, this distance does not penalise a
+    candidate that follows the same path as the reference at a different
+    pace. Both trajectories are resampled at a fixed interval before they
+    are compared, and the total cost of the optimal warping path is
+    normalised by the length of the longer resampled trajectory.
+
+    The cost matrix is computed by broadcasting, and the accumulated cost
+    matrix is filled one anti-diagonal at a time, since each cell depends
+    only on cells on the two preceding anti-diagonals.
+    """
+    if len(times_reference) == 0 or len(times_candidate) == 0:
+        return float('inf')
+    a = _resample(times_reference, xyz_reference, interval)
+    b = _resample(times_candidate, xyz_candidate, interval)
+    n, m = len(a), len(b)
+    cost = np.linalg.norm(a[:, np.newaxis, :] - b[np.newaxis, :, :], axis=2)
+
+    accumulated = np.full((n + 1, m + 1), np.inf)
+    accumulated[0, 0] = 0.0
+    for k in range(2, n + m + 1):
+        i = np.arange(max(1, k - m), min(n, k - 1) + 1)
+        j = k - i
+        best = np.minimum(np.minimum(accumulated[i - 1, j - 1],
+                                     accumulated[i - 1, j]),
+                          accumulated[i, j - 1])
+        accumulated[i, j] = cost[i - 1, j - 1] + best
+    return float(accumulated[n, m] / max(n, m))
+
+
+def fitness(distance: float, scale: float) -> float:
+    """Converts a distance, in metres, into a fitness score between zero and
+    one, where one indicates that the trajectories are identical and a
+    distance of :code:`scale` metres yields a score of one half."""
+    return scale / (scale + distance)
+
+
+@attr.s
+class SimilarityMonitorStatus(MonitorStatus):
+    """Describes the outcome of a comparison against a reference trajectory.
+
+    Attributes
+    ----------
+    status: MonitorStatus
+        The status of the monitor that judges the flight on its own terms.
+    distance: float, optional
+        The distance, in metres, between the flight and the reference
+        trajectory, or :code:`None` if it has not been computed.
+    threshold: float
+        The maximum distance, in metres, at which the flight is considered
+        to be acceptable.
+    """
+    status: MonitorStatus = attr.ib()
+    threshold: float = attr.ib()
+    distance: Optional[float] = attr.ib(default=None)
+
+    @property
+    def fitness(self) -> Optional[float]:
+        if self.distance is None:
+            return None
+        return fitness(self.distance, self.threshold)
+
+    def is_ok(self) -> bool:
+        if not self.status.is_ok():
+            return False
+        return self.distance is None or self.distance <= self.threshold
+
+
+@attr.s
+class SimilarityMonitor(TrajectoryMonitor):
+    """Records the trajectory of the vehicle and, once the mission has
+    finished, compares it against a reference trajectory.
+
+    If the mission does not finish (e.g., because it was aborted or timed
+    out), the partial trajectory is compared against the reference when the
+    monitor is closed, so that the fitness of the flight is still graded.
+    A flight only passes if it passes the underlying monitor and its
+    distance to the reference trajectory is within the given threshold. If
+    the reference trajectory does not exist, the flight is judged by the
+    underlying monitor alone.
+
+    Attributes
+    ----------
+    reference_filename: str
+        The trajectory file that contains the reference flight.
+    threshold: float
+        The maximum distance, in metres, between the flight and the reference
+        trajectory.
+    method: str
+        The method that should be used to compare trajectories: either
+        'time', for the time-aligned distance, or 'dtw', for the dynamic time
+        warping distance.
+    """
+    reference_filename: str = attr.ib(default='', kw_only=True)
+    threshold: float = attr.ib(default=10.0, kw_only=True)
+    method: str = attr.ib(default='time',
+                          kw_only=True,
+                          validator=attr.validators.in_(('time', 'dtw')))
+    _status: Optional[SimilarityMonitorStatus] = \
+        attr.ib(init=False, default=None, repr=False)
+    _compared: bool = attr.ib(init=False, default=False, repr=False)
+
+    @property
+    def status(self) -> MonitorStatus:
+        if self._status is None:
+            self._status = SimilarityMonitorStatus(self._monitor.status,
+                                                   self.threshold)
+        return self._status
+
+    def distance(self, reference: Trajectory) -> float:
+        """Computes the distance between the recorded trajectory and a given
+        reference trajectory."""
+        times_reference, xyz_reference = local_positions(reference)
+        origin = (reference.positions.column('lat')[0] * 1e-7,
+                  reference.positions.column('lon')[0] * 1e-7)
+        times_candidate, xyz_candidate = \
+            local_positions(self.trajectory, origin)
+        compare = dtw_distance if self.method == 'dtw' \
+            else time_aligned_distance
+        return compare(times_reference, xyz_reference,
+                       times_candidate, xyz_candidate)
+
+    def notify_mission_end(self) -> None:
+        super().notify_mission_end()
+        self._compare_to_reference()
+
+    def close(self) -> None:
+        super().close()
+        if not self._compared:
+            self._compare_to_reference()
+
+    def _compare_to_reference(self) -> None:
+        """Computes the distance between the trajectory that has been
+        recorded so far and the reference trajectory, if it exists."""
+        self._compared = True
+        if not os.path.exists(self.reference_filename):
+            logger.warning("reference trajectory does not exist: "
+                           f"{self.reference_filename}")
+            return
+        reference = Trajectory.load(self.reference_filename)
+        if len(reference.positions) == 0:
+            logger.warning("reference trajectory has no positions: "
+                           f"{self.reference_filename}")
+            return
+
+        status = self.status
+        assert isinstance(status, SimilarityMonitorStatus)
+        status.distance = self.distance(reference)
+        logger.debug(f"distance to reference trajectory [{self.method}]: "
+                     f"{status.distance:.3f} metres "
+                     f"[fitness: {status.fitness:.3f}]")
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 __all__ = ('SimpleMonitor', 'SimpleMonitorStatus')
 
-from typing import Optional, MutableSet
+from typing import Callable, Optional, MutableSet
 import time
 import logging
 
@@ -10,6 +10,7 @@ import attr
 import dronekit
 
 from .core import Monitor, MonitorStatus
+from .hub import MAVLinkHub
 from .ardu import Mission, distance_metres
 
 DIST_APPROX_SAME = 3.0
@@ -28,9 +29,12 @@ class SimpleMonitorStatus(MonitorStatus):
 class SimpleMonitor(Monitor):
     _mission: Mission = attr.ib()
     _status: SimpleMonitorStatus = attr.ib(factory=SimpleMonitorStatus)
-    _url_mavlink: Optional[str] = attr.ib(init=False, default=None)
+    _hub: Optional[MAVLinkHub] = attr.ib(init=False, default=None)
+    _owns_hub: bool = attr.ib(init=False, default=False, repr=False)
     _connection: Optional[dronekit.Vehicle] = \
         attr.ib(init=False, default=None, repr=False)
+    _unsubscribe: Optional[Callable[[], None]] = \
+        attr.ib(init=False, default=None, repr=False)
     _visited_wps: MutableSet[int] = \
         attr.ib(init=False, factory=set, repr=False)
 
@@ -40,18 +44,25 @@ class SimpleMonitor(Monitor):
 
     def attach_to(self, url_mavlink: str) -> None:
         logger.debug(f"attaching [{self}] to MAVLink [{url_mavlink}]")
-        self._url_mavlink = url_mavlink
+        self._hub = MAVLinkHub(url_mavlink, heartbeat_timeout=15)
+        self._owns_hub = True
+
+    def attach_to_hub(self, hub: MAVLinkHub) -> None:
+        logger.debug(f"attaching [{self}] to shared hub [{hub}]")
+        self._hub = hub
+        self._owns_hub = False
 
     def open(self) -> None:
-        assert self._url_mavlink
-        self._connection = dronekit.connect(self._url_mavlink,
-                                            heartbeat_timeout=15)
+        assert self._hub
+        if self._owns_hub:
+            self._hub.open()
+        self._connection = self._hub.vehicle
 
-        def listener_waypoint(conn, name, message):
+        def listener_waypoint(message):
             self._visited_wps.add(message.seq)
 
-        self._connection.add_message_listener('MISSION_CURRENT',
-                                              listener_waypoint)
+        self._unsubscribe = self._hub.subscribe('MISSION_CURRENT',
+                                                listener_waypoint)
 
     def notify_mission_end(self) -> None:
         # TODO for the demo, just check that end location is home location?
@@ -80,5 +91,9 @@ class SimpleMonitor(Monitor):
             self._status._reached_home = True
 
     def close(self) -> None:
-        if self._connection:
-            self._connection.close()
+        if self._unsubscribe:
+            self._unsubscribe()
+            self._unsubscribe = None
+        if self._hub and self._owns_hub:
+            self._hub.close()
+        self._connection = None
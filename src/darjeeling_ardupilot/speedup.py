@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a controller that learns the highest speedup that the
+simulator can sustain for each test, and backs off when the host is busy.
+"""
+__all__ = ('SpeedupController',)
+
+from typing import Dict, Optional
+import json
+import math
+import os
+import threading
+
+from loguru import logger
+import attr
+
+from .util import atomic_write
+
+
+@attr.s
+class SpeedupController:
+    """Chooses the speedup at which each test should be executed.
+
+    The controller compares the speedup that was requested for each run
+    against the ratio of simulated time to wall-clock time that was actually
+    achieved. If the achieved speedup falls short of the requested speedup,
+    the speedup for that test is reduced to the achieved speedup. After
+    several consecutive runs that reach their requested speedup, the
+    controller tries a higher speedup.
+
+    Attributes
+    ----------
+    filename: str, optional
+        The file that learned speedups should be persisted to. If unspecified,
+        learned speedups are kept in memory only.
+    minimum: int
+        The lowest speedup that may be chosen.
+    maximum: int
+        The highest speedup that may be chosen.
+    tolerance: float
+        The fraction of the requested speedup that must be achieved for a run
+        to be considered stable.
+    increase_after: int
+        The number of consecutive stable runs after which a higher speedup
+        should be tried.
+    increase_factor: float
+        The factor by which the speedup is increased when a higher speedup is
+        tried.
+    """
+    filename: Optional[str] = attr.ib(default=None)
+    minimum: int = attr.ib(default=1)
+    maximum: int = attr.ib(default=50)
+    tolerance: float = attr.ib(default=0.9)
+    increase_after: int = attr.ib(default=3)
+    increase_factor: float = attr.ib(default=1.25)
+    _speedups: Dict[str, int] = attr.ib(init=False, factory=dict, repr=False)
+    _streaks: Dict[str, int] = attr.ib(init=False, factory=dict, repr=False)
+    _lock: threading.Lock = \
+        attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    def __attrs_post_init__(self) -> None:
+        if self.filename and os.path.exists(self.filename):
+            self.load()
+
+    def _clamp(self, speedup: int) -> int:
+        return max(self.minimum, min(self.maximum, speedup))
+
+    def speedup(self, key: str, default: int) -> int:
+        """Returns the speedup that should be used for a given test.
+
+        Parameters
+        ----------
+        key: str
+            Identifies the test.
+        default: int
+            The speedup that should be used if none has been learned yet.
+        """
+        with self._lock:
+            return self._speedups.get(key, self._clamp(default))
+
+    def update(self,
+               key: str,
+               requested: int,
+               achieved: Optional[float]
+               ) -> int:
+        """Updates the speedup for a given test based on the speedup that was
+        achieved by one of its runs, and persists the learned speedup.
+
+        Parameters
+        ----------
+        key: str
+            Identifies the test.
+        requested: int
+            The speedup that was requested for the run.
+        achieved: float, optional
+            The speedup that was achieved by the run, or :code:`None` if it
+            could not be measured, in which case nothing is learned.
+
+        Returns
+        -------
+        int
+            The speedup that should be used for the next run of the test.
+        """
+        if achieved is None:
+            return self.speedup(key, requested)
+
+        with self._lock:
+            current = self._speedups.get(key, self._clamp(requested))
+            if achieved < requested * self.tolerance:
+                updated = self._clamp(min(current, math.floor(achieved)))
+                self._streaks[key] = 0
+            else:
+                streak = self._streaks.get(key, 0) + 1
+                updated = current
+                if streak >= self.increase_after:
+                    updated = self._clamp(max(
+                        current + 1,
+                        math.floor(current * self.increase_factor)))
+                    streak = 0
+                self._streaks[key] = streak
+            changed = updated != self._speedups.get(key)
+            self._speedups[key] = updated
+
+        if updated != current:
+            logger.debug(f"changed speedup for test [{key}] from {current} "
+                         f"to {updated} [achieved: {achieved:.2f}]")
+        if changed and self.filename:
+            self.save()
+        return updated
+
+    def load(self) -> None:
+        """Loads learned speedups from disk."""
+        assert self.filename
+        logger.debug(f"loading learned speedups: {self.filename}")
+        try:
+            with open(self.filename, 'r') as f:
+                speedups = json.load(f)
+        except (OSError, ValueError):
+            logger.exception(f"failed to load learned speedups: "
+                             f"{self.filename}")
+            return
+        with self._lock:
+            self._speedups = {k: self._clamp(int(v))
+                              for k, v in speedups.items()}
+
+    def save(self) -> None:
+        """Atomically writes the learned speedups to disk."""
+        assert self.filename
+        with self._lock:
+            contents = json.dumps(self._speedups)
+        with atomic_write(self.filename) as f:
+            f.write(contents)
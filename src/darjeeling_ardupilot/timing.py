@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides timers that break the execution of a test down into
+phases, and statistics that summarise those phases across many executions.
+"""
+__all__ = ('PHASES', 'PhaseStatistics', 'PhaseTimer')
+
+from collections import deque
+from timeit import default_timer as timer
+from typing import Deque, Dict, Iterator, Mapping, Optional, Sequence
+import contextlib
+
+import attr
+import numpy as np
+
+# the phases of a test execution, in the order in which they occur
+PHASES = ('boot', 'connect', 'armable', 'home', 'arm', 'upload', 'flight',
+          'verdict', 'teardown')
+
+
+@attr.s
+class PhaseTimer:
+    """Measures the wall-clock time spent in each phase of an execution.
+
+    Time may be attributed to a phase either by wrapping that phase in
+    :meth:`measure`, or by calling :meth:`lap` at the end of that phase,
+    which attributes the time since the previous lap, or since
+    :meth:`mark` was last called, to that phase. Time that is attributed to
+    the same phase more than once is accumulated.
+    """
+    _durations: Dict[str, float] = attr.ib(factory=dict)
+    _time_mark: float = attr.ib(init=False, factory=timer, repr=False)
+
+    @property
+    def durations(self) -> Mapping[str, float]:
+        """The number of seconds spent in each phase, in the order in which
+        the phases occurred."""
+        return dict(self._durations)
+
+    def record(self, phase: str, duration: float) -> None:
+        """Attributes a number of seconds to a given phase."""
+        self._durations[phase] = self._durations.get(phase, 0.0) + duration
+
+    def update(self, durations: Mapping[str, float]) -> None:
+        """Attributes the durations of a number of phases to this timer."""
+        for phase, duration in durations.items():
+            self.record(phase, duration)
+
+    def mark(self) -> None:
+        """Marks the start of the next lap."""
+        self._time_mark = timer()
+
+    def lap(self, phase: str) -> float:
+        """Attributes the time since the start of this lap to a given phase,
+        and starts the next lap.
+
+        Returns
+        -------
+        float
+            The number of seconds that were attributed to the phase.
+        """
+        time_now = timer()
+        duration = time_now - self._time_mark
+        self._time_mark = time_now
+        self.record(phase, duration)
+        return duration
+
+    @contextlib.contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        """Attributes the time spent within the context to a given phase."""
+        time_start = timer()
+        try:
+            yield
+        finally:
+            self.record(phase, timer() - time_start)
+
+
+@attr.s
+class PhaseStatistics:
+    """Summarises the phase durations of the most recent executions of a
+    test.
+
+    Attributes
+    ----------
+    size: int
+        The greatest number of executions that are summarised.
+    """
+    size: int = attr.ib(default=1000)
+    _samples: Dict[str, Deque[float]] = \
+        attr.ib(init=False, factory=dict, repr=False)
+
+    def __len__(self) -> int:
+        """Returns the greatest number of samples of any phase."""
+        return max((len(s) for s in self._samples.values()), default=0)
+
+    def add(self, durations: Mapping[str, float]) -> None:
+        """Adds the phase durations of an execution."""
+        for phase, duration in durations.items():
+            samples = self._samples.get(phase)
+            if samples is None:
+                samples = self._samples[phase] = deque(maxlen=self.size)
+            samples.append(duration)
+
+    def percentiles(self,
+                    percentiles: Sequence[float] = (50, 90, 99),
+                    phases: Optional[Sequence[str]] = None
+                    ) -> Dict[str, Dict[float, float]]:
+        """Computes percentiles of the duration of each phase.
+
+        Parameters
+        ----------
+        percentiles: Sequence[float]
+            The percentiles, between 0 and 100, that should be computed.
+        phases: Sequence[str], optional
+            The phases whose percentiles should be computed. By default, all
+            phases that were recorded are included.
+
+        Returns
+        -------
+        Dict[str, Dict[float, float]]
+            The number of seconds at each percentile, indexed by phase and
+            then by percentile.
+        """
+        if phases is None:
+            phases = [p for p in PHASES if p in self._samples]
+            phases += [p for p in self._samples if p not in PHASES]
+        result: Dict[str, Dict[float, float]] = {}
+        for phase in phases:
+            samples = self._samples.get(phase)
+            if not samples:
+                continue
+            values = np.percentile(np.fromiter(samples, dtype=float),
+                                   percentiles)
+            result[phase] = {p: float(v) for p, v in zip(percentiles, values)}
+        return result
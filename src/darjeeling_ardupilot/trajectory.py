@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a compact recording of the trajectory that a vehicle
+flew during a test, and a monitor that records it.
+
+Samples are written straight into preallocated, fixed-width column arrays,
+so recording a sample allocates no Python objects beyond the decoded MAVLink
+message itself. Each GLOBAL_POSITION_INT sample occupies 28 bytes:
+
+    time_boot_ms (uint32), lat, lon, alt, relative_alt (int32),
+    vx, vy, vz (int16), hdg (uint16)
+
+and each ATTITUDE sample also occupies 28 bytes:
+
+    time_boot_ms (uint32), roll, pitch, yaw, rollspeed, pitchspeed,
+    yawspeed (float32)
+
+At the default SITL stream rates (roughly 10 Hz for both messages), a
+five-minute mission therefore requires around 170 KB in memory and on disk,
+and recording adds a handful of array stores to the handling of each
+message. Speedup affects only how quickly samples arrive, not their number.
+Tables are preallocated with room for 4096 samples and double in size if
+they run out of space.
+
+Trajectory files use the following little-endian layout:
+
+    magic (6 bytes, b'DATRAJ'), version (uint16),
+    then, for the position table followed by the attitude table:
+    number of samples (uint32), followed by each column in turn
+"""
+__all__ = ('SampleTable', 'Trajectory', 'TrajectoryMonitor')
+
+from array import array
+from typing import IO, Any, Iterator, List, Optional, Tuple
+import contextlib
+import struct
+import sys
+
+from loguru import logger
+import attr
+
+from .core import MonitorWrapper
+from .hub import MAVLinkHub
+from .util import atomic_write
+
+POSITION_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ('time_boot_ms', 'I'),
+    ('lat', 'i'),
+    ('lon', 'i'),
+    ('alt', 'i'),
+    ('relative_alt', 'i'),
+    ('vx', 'h'),
+    ('vy', 'h'),
+    ('vz', 'h'),
+    ('hdg', 'H'))
+
+ATTITUDE_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ('time_boot_ms', 'I'),
+    ('roll', 'f'),
+    ('pitch', 'f'),
+    ('yaw', 'f'),
+    ('rollspeed', 'f'),
+    ('pitchspeed', 'f'),
+    ('yawspeed', 'f'))
+
+_MAGIC = b'DATRAJ'
+_VERSION = 1
+_HEADER = struct.Struct('<6sH')
+_COUNT = struct.Struct('<I')
+
+
+@attr.s
+class SampleTable:
+    """A table of samples, each of which consists of a fixed set of numeric
+    fields that are stored column-wise in preallocated arrays.
+
+    Attributes
+    ----------
+    fields: Tuple[Tuple[str, str], ...]
+        The name and array type code of each field.
+    capacity: int
+        The number of samples that the table can hold before it must grow.
+    """
+    fields: Tuple[Tuple[str, str], ...] = attr.ib()
+    capacity: int = attr.ib(default=4096)
+    _columns: List[array] = attr.ib(init=False, repr=False)
+    _size: int = attr.ib(init=False, default=0, repr=False)
+
+    def __attrs_post_init__(self) -> None:
+        self._columns = [array(code, bytes(array(code).itemsize
+                                           * self.capacity))
+                         for _, code in self.fields]
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def bytes_per_sample(self) -> int:
+        """The number of bytes that are used to store each sample."""
+        return sum(column.itemsize for column in self._columns)
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes that are used by the samples in this table."""
+        return self._size * self.bytes_per_sample
+
+    def _grow(self) -> None:
+        for column in self._columns:
+            column.frombytes(bytes(column.itemsize * self.capacity))
+        self.capacity *= 2
+
+    def append(self, message: Any) -> None:
+        """Appends the fields of a given MAVLink message to this table."""
+        if self._size == self.capacity:
+            self._grow()
+        index = self._size
+        for column, (name, _) in zip(self._columns, self.fields):
+            column[index] = getattr(message, name)
+        self._size = index + 1
+
+    def column(self, name: str) -> array:
+        """Returns a copy of the values of a given field.
+
+        The returned array supports the buffer protocol and can be wrapped by
+        :code:`numpy.frombuffer` without a further copy.
+        """
+        for column, (name_, _) in zip(self._columns, self.fields):
+            if name_ == name:
+                return column[:self._size]
+        raise KeyError(f"unknown field: {name}")
+
+    def write(self, f: IO[bytes]) -> None:
+        """Writes the contents of this table to a given binary file."""
+        f.write(_COUNT.pack(self._size))
+        for column in self._columns:
+            values = column[:self._size]
+            if sys.byteorder == 'big':
+                values.byteswap()
+            values.tofile(f)
+
+    @classmethod
+    def read(cls,
+             f: IO[bytes],
+             fields: Tuple[Tuple[str, str], ...]
+             ) -> 'SampleTable':
+        """Reads a table with the given fields from a binary file."""
+        size, = _COUNT.unpack(f.read(_COUNT.size))
+        table = cls(fields, capacity=max(size, 1))
+        for index, (_, code) in enumerate(fields):
+            column = array(code)
+            column.fromfile(f, size)
+            if sys.byteorder == 'big':
+                column.byteswap()
+            if size < table.capacity:
+                column.frombytes(bytes(column.itemsize
+                                       * (table.capacity - size)))
+            table._columns[index] = column
+        table._size = size
+        return table
+
+
+@attr.s
+class Trajectory:
+    """Records the position and attitude of a vehicle over time.
+
+    Attributes
+    ----------
+    positions: SampleTable
+        The GLOBAL_POSITION_INT samples that were received from the vehicle.
+    attitudes: SampleTable
+        The ATTITUDE samples that were received from the vehicle.
+    """
+    positions: SampleTable = \
+        attr.ib(factory=lambda: SampleTable(POSITION_FIELDS))
+    attitudes: SampleTable = \
+        attr.ib(factory=lambda: SampleTable(ATTITUDE_FIELDS))
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes that are used by the samples in this
+        trajectory."""
+        return self.positions.nbytes + self.attitudes.nbytes
+
+    @contextlib.contextmanager
+    def record(self, hub: MAVLinkHub) -> Iterator['Trajectory']:
+        """Records the trajectory of the vehicle connected to a given hub for
+        the duration of the context."""
+        unsubscribers = [
+            hub.subscribe('GLOBAL_POSITION_INT', self.positions.append),
+            hub.subscribe('ATTITUDE', self.attitudes.append)]
+        try:
+            yield self
+        finally:
+            for unsubscribe in unsubscribers:
+                unsubscribe()
+            logger.debug(f"recorded trajectory with {len(self.positions)} "
+                         f"position and {len(self.attitudes)} attitude "
+                         f"samples [{self.nbytes} bytes]")
+
+    def save(self, filename: str) -> None:
+        """Atomically writes this trajectory to a given file."""
+        with atomic_write(filename, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION))
+            self.positions.write(f)
+            self.attitudes.write(f)
+
+    @staticmethod
+    def load(filename: str) -> 'Trajectory':
+        """Loads a trajectory from a given file.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a trajectory file.
+        """
+        with open(filename, 'rb') as f:
+            magic, version = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"not a trajectory file: {filename}")
+            positions = SampleTable.read(f, POSITION_FIELDS)
+            attitudes = SampleTable.read(f, ATTITUDE_FIELDS)
+        return Trajectory(positions, attitudes)
+
+
+@attr.s
+class TrajectoryMonitor(MonitorWrapper):
+    """Records the trajectory of the vehicle while delegating the outcome of
+    the test to another monitor.
+
+    Attributes
+    ----------
+    monitor: Monitor
+        The monitor that determines the outcome of the test.
+    filename: str, optional
+        The file that the trajectory should be written to when this monitor
+        is closed. If unspecified, the trajectory is kept in memory only.
+    trajectory: Trajectory
+        The trajectory that has been recorded.
+    """
+    filename: Optional[str] = attr.ib(default=None)
+    trajectory: Trajectory = attr.ib(factory=Trajectory, repr=False)
+
+    def _open(self, hub: MAVLinkHub, exit_stack: contextlib.ExitStack) -> None:
+        exit_stack.enter_context(self.trajectory.record(hub))
+
+    def close(self) -> None:
+        super().close()
+        if self.filename:
+            logger.debug(f"writing trajectory to file: {self.filename}")
+            self.trajectory.save(self.filename)
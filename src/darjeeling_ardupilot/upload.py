@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a fast uploader and downloader that speak the MAVLink
+mission protocol directly, rather than through DroneKit's command sequence.
+
+The MAVLink mission protocol is driven by the vehicle, which requests each
+item in turn. Rather than waiting for each request before sending the next
+item, the uploader keeps a window of items in flight ahead of the most
+recent request. ArduPilot accepts items in order as they arrive and ignores
+items that arrive out of sequence, so items only need to be sent again
+when the vehicle repeats a request, in which case the uploader goes back to
+the requested item.
+
+Downloads are pipelined in the same way: the downloader keeps a window of
+item requests in flight, and only repeats requests for items that have not
+arrived once the vehicle has gone quiet.
+"""
+__all__ = ('DownloadedMission', 'MissionDownloader', 'MissionUploader',
+           'UploadReport', 'to_int_coordinate')
+
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+import threading
+
+from darjeeling.util import Stopwatch
+from loguru import logger
+import attr
+import dronekit
+
+MAV_MISSION_ACCEPTED = 0
+MAV_MISSION_INVALID_SEQUENCE = 13
+
+# frames whose x and y fields are a latitude and longitude
+GLOBAL_FRAMES = frozenset({0, 3, 5, 6, 10, 11})
+
+
+def to_int_coordinate(degrees: float) -> int:
+    """Encodes a latitude or longitude as an integer in units of 1e-7
+    degrees, as used by MISSION_ITEM_INT messages."""
+    return int(round(degrees * 1e7))
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class UploadReport:
+    """Describes the upload of a mission.
+
+    Attributes
+    ----------
+    items: int
+        The number of items in the mission.
+    duration: float
+        The number of seconds that the upload took.
+    requests: int
+        The number of item requests that were received from the vehicle.
+    retransmissions: int
+        The number of items that had to be sent more than once.
+    opaque_id: int
+        The checksum of the stored mission that was reported by the vehicle
+        when it accepted the mission, or zero if the vehicle does not report
+        one.
+    """
+    items: int
+    duration: float
+    requests: int
+    retransmissions: int
+    opaque_id: int = 0
+
+
+@attr.s
+class MissionUploader:
+    """Uploads missions to a vehicle using MISSION_ITEM_INT messages.
+
+    Attributes
+    ----------
+    connection: dronekit.Vehicle
+        A connection to the vehicle.
+    window: int
+        The greatest number of items that may be sent ahead of the most
+        recent request from the vehicle.
+    timeout_retry: float
+        The number of seconds without a response from the vehicle after which
+        the most recent step of the protocol is repeated.
+    """
+    connection: dronekit.Vehicle = attr.ib()
+    window: int = attr.ib(default=16)
+    timeout_retry: float = attr.ib(default=1.0)
+
+    def _encode(self, seq: int, command: dronekit.Command) -> Any:
+        factory = self.connection.message_factory
+        if command.frame in GLOBAL_FRAMES:
+            return factory.mission_item_int_encode(
+                0, 0, seq, command.frame, command.command, command.current,
+                command.autocontinue, command.param1, command.param2,
+                command.param3, command.param4, to_int_coordinate(command.x),
+                to_int_coordinate(command.y), command.z)
+        # the x and y fields of other frames are not scaled consistently
+        return factory.mission_item_encode(
+            0, 0, seq, command.frame, command.command, command.current,
+            command.autocontinue, command.param1, command.param2,
+            command.param3, command.param4, command.x, command.y, command.z)
+
+    def upload(self,
+               commands: Sequence[dronekit.Command],
+               *,
+               timeout: float = 30.0
+               ) -> UploadReport:
+        """Uploads a given sequence of commands, including the home location
+        at index zero, to the vehicle.
+
+        Raises
+        ------
+        TimeoutError
+            If the vehicle did not accept the mission before the timeout.
+        ValueError
+            If the vehicle rejected the mission.
+        """
+        connection = self.connection
+        messages = [self._encode(seq, c) for seq, c in enumerate(commands)]
+        count = len(messages)
+        condition = threading.Condition()
+        state: Dict[str, Any] = {'sent': 0,
+                                 'requested': -1,
+                                 'requests': 0,
+                                 'retransmissions': 0,
+                                 'result': None,
+                                 'opaque_id': 0,
+                                 'activity': 0}
+        times_sent = [0] * count
+
+        def send_upto(seq_end: int) -> None:
+            for seq in range(state['sent'], min(seq_end, count)):
+                if times_sent[seq]:
+                    state['retransmissions'] += 1
+                times_sent[seq] += 1
+                connection.send_mavlink(messages[seq])
+            state['sent'] = max(state['sent'], min(seq_end, count))
+
+        def listener_request(other, name, message) -> None:
+            seq = message.seq
+            if not 0 <= seq < count:
+                return
+            with condition:
+                state['requests'] += 1
+                state['activity'] += 1
+                # ignore stale requests for items that were since accepted
+                if seq < state['requested']:
+                    return
+                # a repeated request indicates that the item was lost
+                if seq == state['requested'] or seq >= state['sent']:
+                    state['sent'] = seq
+                state['requested'] = seq
+                send_upto(seq + self.window)
+                condition.notify_all()
+
+        def listener_ack(other, name, message) -> None:
+            if message.type == MAV_MISSION_INVALID_SEQUENCE:
+                return
+            with condition:
+                state['result'] = message.type
+                # only reported by vehicles with newer MAVLink dialects
+                state['opaque_id'] = getattr(message, 'opaque_id', 0)
+                condition.notify_all()
+
+        listeners = [('MISSION_REQUEST_INT', listener_request),
+                     ('MISSION_REQUEST', listener_request),
+                     ('MISSION_ACK', listener_ack)]
+        for message_type, listener in listeners:
+            connection.add_message_listener(message_type, listener)
+
+        timer = Stopwatch()
+        timer.start()
+        factory = connection.message_factory
+        try:
+            with condition:
+                connection.send_mavlink(factory.mission_count_encode(0, 0,
+                                                                     count))
+                while state['result'] is None:
+                    time_left = timeout - timer.duration
+                    if time_left <= 0:
+                        raise TimeoutError("mission upload timed out")
+                    activity = state['activity']
+                    condition.wait(min(self.timeout_retry, time_left))
+                    if state['result'] is not None \
+                            or state['activity'] != activity:
+                        continue
+                    # repeat the last step of the protocol
+                    if state['requested'] < 0:
+                        logger.debug("resending mission count")
+                        connection.send_mavlink(
+                            factory.mission_count_encode(0, 0, count))
+                    else:
+                        logger.debug("resending mission items from "
+                                     f"{state['requested']}")
+                        state['sent'] = state['requested']
+                        send_upto(state['requested'] + self.window)
+        finally:
+            for message_type, listener in listeners:
+                connection.remove_message_listener(message_type, listener)
+        timer.stop()
+
+        if state['result'] != MAV_MISSION_ACCEPTED:
+            raise ValueError("vehicle rejected mission "
+                             f"[MAV_MISSION_RESULT: {state['result']}]")
+        report = UploadReport(items=count,
+                              duration=timer.duration,
+                              requests=state['requests'],
+                              retransmissions=state['retransmissions'],
+                              opaque_id=state['opaque_id'])
+        logger.debug(f"uploaded mission: {report}")
+        return report
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class DownloadedMission:
+    """Describes a mission that was downloaded from a vehicle.
+
+    Attributes
+    ----------
+    count: int
+        The number of items in the mission, including the home location.
+    items: Tuple[Any, ...]
+        The MISSION_ITEM_INT messages that describe the items of the mission,
+        including the home location at index zero, in order. This is empty
+        if the items were not downloaded.
+    opaque_id: int
+        The checksum of the stored mission that was reported by the vehicle,
+        or zero if the vehicle does not report one.
+    duration: float
+        The number of seconds that the download took.
+    """
+    count: int
+    items: Tuple[Any, ...]
+    opaque_id: int
+    duration: float
+
+
+@attr.s
+class MissionDownloader:
+    """Downloads missions from a vehicle using MISSION_REQUEST_INT messages.
+
+    Attributes
+    ----------
+    connection: dronekit.Vehicle
+        A connection to the vehicle.
+    window: int
+        The greatest number of item requests that may be outstanding.
+    timeout_retry: float
+        The number of seconds without a response from the vehicle after which
+        the outstanding requests are repeated.
+    """
+    connection: dronekit.Vehicle = attr.ib()
+    window: int = attr.ib(default=16)
+    timeout_retry: float = attr.ib(default=1.0)
+
+    def download(self,
+                 *,
+                 timeout: float = 30.0,
+                 fetch_items: Optional[Callable[[int, int], bool]] = None
+                 ) -> DownloadedMission:
+        """Downloads the mission that is stored on the vehicle.
+
+        Parameters
+        ----------
+        timeout: float
+            The maximum number of seconds that the download may take.
+        fetch_items: Callable[[int, int], bool], optional
+            Decides, given the number of items and the checksum that are
+            reported by the vehicle, whether the items themselves should be
+            downloaded. By default, the items are always downloaded.
+
+        Raises
+        ------
+        TimeoutError
+            If the mission was not downloaded before the timeout.
+        """
+        connection = self.connection
+        factory = connection.message_factory
+        condition = threading.Condition()
+        state: Dict[str, Any] = {'count': None,
+                                 'fetch': True,
+                                 'opaque_id': 0,
+                                 'requested': 0,
+                                 'activity': 0}
+        items: Dict[int, Any] = {}
+
+        def request(seq: int) -> None:
+            connection.send_mavlink(
+                factory.mission_request_int_encode(0, 0, seq))
+
+        def request_upto(seq_end: int) -> None:
+            seq_end = min(seq_end, state['count'])
+            for seq in range(state['requested'], seq_end):
+                request(seq)
+            state['requested'] = max(state['requested'], seq_end)
+
+        def listener_count(other, name, message) -> None:
+            with condition:
+                state['activity'] += 1
+                # ignore responses to repeated requests for the count
+                if state['count'] is not None:
+                    return
+                state['count'] = message.count
+                # only reported by vehicles with newer MAVLink dialects
+                state['opaque_id'] = getattr(message, 'opaque_id', 0)
+                if fetch_items is not None \
+                        and not fetch_items(message.count,
+                                            state['opaque_id']):
+                    state['fetch'] = False
+                else:
+                    request_upto(self.window)
+                condition.notify_all()
+
+        def listener_item(other, name, message) -> None:
+            with condition:
+                count = state['count']
+                if count is None or not 0 <= message.seq < count \
+                        or message.seq in items:
+                    return
+                state['activity'] += 1
+                items[message.seq] = message
+                request_upto(len(items) + self.window)
+                condition.notify_all()
+
+        def finished() -> bool:
+            return state['count'] is not None \
+                and (not state['fetch'] or len(items) == state['count'])
+
+        listeners = [('MISSION_COUNT', listener_count),
+                     ('MISSION_ITEM_INT', listener_item)]
+        for message_type, listener in listeners:
+            connection.add_message_listener(message_type, listener)
+
+        timer = Stopwatch()
+        timer.start()
+        try:
+            with condition:
+                connection.send_mavlink(
+                    factory.mission_request_list_encode(0, 0))
+                while not finished():
+                    time_left = timeout - timer.duration
+                    if time_left <= 0:
+                        raise TimeoutError("mission download timed out")
+                    activity = state['activity']
+                    condition.wait(min(self.timeout_retry, time_left))
+                    if finished() or state['activity'] != activity:
+                        continue
+                    # repeat the outstanding requests
+                    if state['count'] is None:
+                        logger.debug("resending mission request list")
+                        connection.send_mavlink(
+                            factory.mission_request_list_encode(0, 0))
+                    else:
+                        missing = [seq for seq in range(state['requested'])
+                                   if seq not in items]
+                        logger.debug("resending requests for "
+                                     f"{len(missing)} mission items")
+                        for seq in missing:
+                            request(seq)
+        finally:
+            for message_type, listener in listeners:
+                connection.remove_message_listener(message_type, listener)
+        timer.stop()
+
+        if items:
+            connection.send_mavlink(
+                factory.mission_ack_encode(0, 0, MAV_MISSION_ACCEPTED))
+        mission = DownloadedMission(
+            count=state['count'],
+            items=tuple(items[seq] for seq in range(len(items))),
+            opaque_id=state['opaque_id'],
+            duration=timer.duration)
+        logger.debug(f"downloaded {len(mission.items)} of {mission.count} "
+                     f"mission items after {mission.duration:.3f}s")
+        return mission
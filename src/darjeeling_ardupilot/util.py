@@ -1,53 +1,324 @@
 # -*- coding: utf-8 -*-
-__all__ = ('CircleIntBuffer', 'wait_till_open')
+__all__ = ('atomic_write', 'InstanceAllocator', 'PortAllocator',
+           'unix_socket_paths', 'wait_till_open', 'wait_for_heartbeat')
 
+from collections import deque
 from contextlib import closing
-from typing import Tuple
-from threading import Lock
+from typing import (IO, Deque, Dict, Hashable, Iterator, List, MutableSet,
+                    Optional, Set, Tuple)
+import contextlib
+from threading import Condition, Lock
 from timeit import default_timer as timer
+import os
+import shutil
 import socket
+import tempfile
 import time
 
+from loguru import logger
+from pymavlink import mavutil
 import attr
 
 
 def wait_till_open(port: int,
-                   timeout_seconds: int,
+                   timeout_seconds: float,
                    *,
+                   host: str = 'localhost',
                    interval: float = 0.5
                    ) -> None:
-    """Blocks until either a given local port is open or a timeout expires."""
-    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
-        time_start = timer()
-        time_stop = time_start + timeout_seconds
-        while timer() < time_stop:
-            if s.connect_ex(('localhost', port)) == 0:
+    """Blocks until either a given port is open or a timeout expires.
+
+    Parameters
+    ----------
+    port: int
+        The TCP port that should be probed.
+    timeout_seconds: float
+        The maximum number of seconds to wait for the port to open.
+    host: str
+        The host (e.g., the IP address of a container) that should be probed.
+    interval: float
+        The number of seconds to wait between consecutive probes.
+
+    Raises
+    ------
+    TimeoutError
+        If the port is not open before the timeout expires.
+    """
+    time_start = timer()
+    time_stop = time_start + timeout_seconds
+    while timer() < time_stop:
+        # a fresh socket is required for each attempt since the state of a
+        # socket is unspecified after a failed connect
+        with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+            s.settimeout(max(interval, 0.1))
+            if s.connect_ex((host, port)) == 0:
                 return
-            time.sleep(interval)
-    m = f"unable to reach port [{port}] after {timeout_seconds} seconds"
+        time.sleep(interval)
+    m = (f"unable to reach port [{port}] on host [{host}] "
+         f"after {timeout_seconds} seconds")
     raise TimeoutError(m)
 
 
-@attr.s(auto_attribs=True)
-class CircleIntBuffer:
-    """An end-inclusive ring buffer."""
+def wait_for_heartbeat(url: str, timeout_seconds: float) -> None:
+    """Blocks until a HEARTBEAT is received from a given MAVLink endpoint.
+
+    Raises
+    ------
+    TimeoutError
+        If no HEARTBEAT is received before the timeout expires.
+    """
+    connection = mavutil.mavlink_connection(url, autoreconnect=False)
+    with closing(connection):
+        message = connection.wait_heartbeat(timeout=timeout_seconds)
+    if message is None:
+        m = (f"failed to receive HEARTBEAT from [{url}] "
+             f"after {timeout_seconds} seconds")
+        raise TimeoutError(m)
+
+
+def is_port_free(port: int, host: str = '127.0.0.1') -> bool:
+    """Determines whether a given local UDP port can be bound."""
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_DGRAM)) as s:
+        try:
+            s.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+@attr.s
+class PortAllocator:
+    """Leases local UDP ports from an end-inclusive range.
+
+    Leased ports are not handed out again until they are released. Before a
+    port is leased, a bind probe is used to check that it is not held by
+    another process (e.g., a client that is yet to close its socket); ports
+    that fail the probe are skipped. Released ports are leased again only
+    after every other free port, which gives lingering sockets as much time
+    as possible to close.
+
+    Attributes
+    ----------
     start: int
+        The first port in the range.
     stop: int
-    _next: int = attr.ib(init=False)
-    _lock: Lock = attr.ib(init=False, factory=Lock)
+        The last port in the range.
+    timeout: float
+        The maximum number of seconds to wait for enough ports to become
+        free.
+    leases: int
+        The number of leases that have been granted.
+    contention: int
+        The number of leases that had to wait for ports to be released.
+    wait_time: float
+        The total number of seconds that leases spent waiting for ports to
+        be released.
+    probe_failures: int
+        The number of times that a free port was skipped since it could not
+        be bound.
+    """
+    start: int = attr.ib(default=13000)
+    stop: int = attr.ib(default=13500)
+    timeout: float = attr.ib(default=60.0)
+    leases: int = attr.ib(init=False, default=0)
+    contention: int = attr.ib(init=False, default=0)
+    wait_time: float = attr.ib(init=False, default=0.0)
+    probe_failures: int = attr.ib(init=False, default=0)
+    _free: Deque[int] = attr.ib(init=False, repr=False)
+    _leased: Set[int] = attr.ib(init=False, factory=set, repr=False)
+    _condition: Condition = \
+        attr.ib(init=False, factory=Condition, repr=False)
+
+    @stop.validator
+    def validate_stop(self, attribute, value) -> None:
+        if value < self.start:
+            raise ValueError("port range must not be empty")
 
     def __attrs_post_init__(self) -> None:
-        self._size = self.stop - self.start + 1
-        self._next = self.start
+        self._free = deque(range(self.start, self.stop + 1))
+
+    @property
+    def size(self) -> int:
+        """The number of ports in the range."""
+        return self.stop - self.start + 1
+
+    @property
+    def in_use(self) -> int:
+        """The number of ports that are currently leased."""
+        with self._condition:
+            return len(self._leased)
+
+    def _take(self, n: int) -> Optional[Tuple[int, ...]]:
+        """Takes a given number of free ports that pass a bind probe, or
+        returns :code:`None`, without taking any ports, if there are not
+        enough such ports. Must be called while holding the lock."""
+        taken: List[int] = []
+        skipped: List[int] = []
+        while len(taken) < n and self._free:
+            port = self._free.popleft()
+            if is_port_free(port):
+                taken.append(port)
+            else:
+                self.probe_failures += 1
+                skipped.append(port)
+        # ports that are held by other processes are probed again later
+        self._free.extend(skipped)
+        if len(taken) < n:
+            self._free.extendleft(reversed(taken))
+            return None
+        self._leased.update(taken)
+        return tuple(taken)
+
+    def acquire(self,
+                n: int,
+                *,
+                timeout: Optional[float] = None
+                ) -> Tuple[int, ...]:
+        """Leases a given number of ports, waiting for ports to be released
+        if necessary.
 
-    def __next__(self) -> int:
+        Raises
+        ------
+        ValueError
+            If more ports are requested than the range contains.
+        TimeoutError
+            If not enough ports became free before the timeout expired.
+        """
+        if n > self.size:
+            raise ValueError(f"cannot lease {n} ports from a range of "
+                             f"{self.size} ports")
+        timeout = self.timeout if timeout is None else timeout
+        time_start = timer()
+        time_stop = time_start + timeout
+        waited = False
+        with self._condition:
+            while True:
+                ports = self._take(n)
+                if ports:
+                    break
+                time_left = time_stop - timer()
+                if time_left <= 0:
+                    self.wait_time += timer() - time_start
+                    raise TimeoutError(f"failed to lease {n} ports "
+                                       f"after {timeout} seconds")
+                if not waited:
+                    waited = True
+                    self.contention += 1
+                # ports that fail their bind probe are not released, so
+                # they must be probed again periodically
+                self._condition.wait(min(time_left, 0.5))
+            self.leases += 1
+            if waited:
+                self.wait_time += timer() - time_start
+                logger.debug(f"waited {timer() - time_start:.3f}s to lease "
+                             f"ports: {ports}")
+        return ports
+
+    def release(self, ports: Tuple[int, ...]) -> None:
+        """Returns a number of leased ports to the pool."""
+        with self._condition:
+            for port in ports:
+                if port in self._leased:
+                    self._leased.remove(port)
+                    self._free.append(port)
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def lease(self,
+              n: int,
+              *,
+              timeout: Optional[float] = None
+              ) -> Iterator[Tuple[int, ...]]:
+        """Leases a given number of ports for the duration of the
+        context."""
+        ports = self.acquire(n, timeout=timeout)
+        try:
+            yield ports
+        finally:
+            self.release(ports)
+
+
+@attr.s
+class InstanceAllocator:
+    """Allocates the lowest free instance number within each of a number of
+    namespaces (e.g., containers)."""
+    _allocated: Dict[Hashable, MutableSet[int]] = \
+        attr.ib(init=False, factory=dict, repr=False)
+    _lock: Lock = attr.ib(init=False, factory=Lock, repr=False)
+
+    def allocate(self, namespace: Hashable) -> int:
+        with self._lock:
+            allocated = self._allocated.setdefault(namespace, set())
+            instance = 0
+            while instance in allocated:
+                instance += 1
+            allocated.add(instance)
+            return instance
+
+    def release(self, namespace: Hashable, instance: int) -> None:
         with self._lock:
-            n = self._next
-            self._next += 1
-            if self._next == self.stop + 1:
-                self._next = self.start
-            return n
-
-    def take(self, n: int) -> Tuple[int, ...]:
-        assert n <= self._size
-        return tuple(self.__next__() for i in range(n))
+            allocated = self._allocated.get(namespace)
+            if allocated is None:
+                return
+            allocated.discard(instance)
+            if not allocated:
+                del self._allocated[namespace]
+
+    @contextlib.contextmanager
+    def lease(self, namespace: Hashable) -> Iterator[int]:
+        """Allocates an instance number for the duration of the context."""
+        instance = self.allocate(namespace)
+        try:
+            yield instance
+        finally:
+            self.release(namespace, instance)
+
+
+@contextlib.contextmanager
+def unix_socket_paths(n: int) -> Iterator[Tuple[str, ...]]:
+    """Provides the paths of a given number of Unix domain sockets within a
+    fresh temporary directory, which is destroyed upon leaving the
+    context."""
+    directory = tempfile.mkdtemp(prefix='darjeeling-ardupilot.')
+    try:
+        yield tuple(os.path.join(directory, f'{i}.sock') for i in range(n))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def atomic_write(filename: str,
+                 mode: str = 'w',
+                 *,
+                 permissions: Optional[int] = None
+                 ) -> Iterator[IO]:
+    """Provides a temporary file that atomically replaces a given file once
+    the context is left, such that readers never observe a partially written
+    file. If the context is left due to an exception, the temporary file is
+    removed and the given file is left untouched.
+
+    Parameters
+    ----------
+    filename: str
+        The path to the file that should be written. Its parent directory is
+        created if it does not exist.
+    mode: str
+        The mode in which the temporary file should be opened: either 'w' or
+        'wb'.
+    permissions: int, optional
+        The permissions of the written file. By default, the file is only
+        accessible to its owner.
+    """
+    dir_ = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(dir_, exist_ok=True)
+    fd, fn_temp = tempfile.mkstemp(dir=dir_, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        if permissions is not None:
+            os.chmod(fn_temp, permissions)
+        os.replace(fn_temp, filename)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(fn_temp)
+        raise
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a fast reader for WPL mission files.
+
+Parsed missions are cached in a binary sidecar file that sits next to the
+mission file. The sidecar is keyed by the modification time and size of the
+mission file, and by a SHA-256 digest of its contents, which is used to
+revalidate the sidecar when the modification time has changed (e.g., after a
+fresh checkout).
+
+Sidecar files use the following little-endian layout:
+
+    magic (5 bytes, b'DAWPL'), version (uint8),
+    mtime_ns (int64), size (int64), sha256 (32 bytes), count (uint32),
+    then, for each command: frame (uint8), command (uint16),
+    param1, param2, param3, param4, x, y, z (float64)
+"""
+__all__ = ('WPLItem', 'parse_wpl', 'read_wpl', 'sidecar_filename')
+
+from typing import List, Optional, Tuple
+import hashlib
+import os
+import struct
+
+from loguru import logger
+
+from .util import atomic_write
+
+# frame, command, param1, param2, param3, param4, x, y, z
+WPLItem = Tuple[int, int, float, float, float, float, float, float, float]
+
+_MAGIC = b'DAWPL'
+_VERSION = 1
+_HEADER = struct.Struct('<5sBqq32sI')
+_ITEM = struct.Struct('<BH7d')
+
+
+def sidecar_filename(filename: str) -> str:
+    """Returns the name of the sidecar file for a given mission file."""
+    dir_, base = os.path.split(os.path.abspath(filename))
+    return os.path.join(dir_, f'.{base}.wplc')
+
+
+def parse_wpl(contents: bytes) -> List[WPLItem]:
+    """Parses the contents of a WPL file.
+
+    The header line is skipped, as are blank lines. The index, current, and
+    autocontinue fields of each item are ignored.
+
+    Raises
+    ------
+    ValueError
+        If an item is malformed.
+    """
+    items: List[WPLItem] = []
+    append = items.append
+    lines = contents.split(b'\n')
+    for number, line in enumerate(lines[1:], 2):
+        fields = line.split()
+        if not fields:
+            continue
+        try:
+            p1, p2, p3, p4, x, y, z = map(float, fields[4:11])
+            append((int(fields[2]), int(fields[3]), p1, p2, p3, p4, x, y, z))
+        except ValueError as exc:
+            raise ValueError(f"bad WPL item on line {number}: {exc}")
+    return items
+
+
+def _read_sidecar(filename: str,
+                  stat: os.stat_result,
+                  digest: Optional[bytes]
+                  ) -> Optional[List[WPLItem]]:
+    """Reads the items from a sidecar file if it matches the given mission
+    file statistics or, if given, contents digest."""
+    try:
+        with open(filename, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, mtime_ns, size, sidecar_digest, count = \
+        _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        return None
+    if len(data) != _HEADER.size + count * _ITEM.size:
+        return None
+    if digest is None:
+        if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size):
+            return None
+    elif digest != sidecar_digest:
+        return None
+    return list(_ITEM.iter_unpack(memoryview(data)[_HEADER.size:]))
+
+
+def _write_sidecar(filename: str,
+                   stat: os.stat_result,
+                   digest: bytes,
+                   items: List[WPLItem]
+                   ) -> None:
+    """Atomically writes a sidecar file, or logs a warning if the file can't
+    be written (e.g., because the directory is read-only)."""
+    header = _HEADER.pack(_MAGIC, _VERSION, stat.st_mtime_ns, stat.st_size,
+                          digest, len(items))
+    body = b''.join(_ITEM.pack(*item) for item in items)
+    try:
+        with atomic_write(filename, 'wb') as f:
+            f.write(header)
+            f.write(body)
+    except OSError:
+        logger.warning(f"failed to write mission sidecar: {filename}")
+
+
+def read_wpl(filename: str, *, sidecar: bool = True) -> Tuple[WPLItem, ...]:
+    """Reads the items of a given WPL file.
+
+    Parameters
+    ----------
+    filename: str
+        The path to the WPL file.
+    sidecar: bool
+        If :code:`True`, a binary sidecar file is used to avoid parsing the
+        mission file each time that it is loaded by a new process.
+    """
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    fn_sidecar = sidecar_filename(filename)
+    if sidecar:
+        items = _read_sidecar(fn_sidecar, stat, None)
+        if items is not None:
+            logger.debug(f"loaded mission from sidecar: {fn_sidecar}")
+            return tuple(items)
+
+    with open(filename, 'rb') as f:
+        contents = f.read()
+    if sidecar:
+        digest = hashlib.sha256(contents).digest()
+        items = _read_sidecar(fn_sidecar, stat, digest)
+        if items is None:
+            items = parse_wpl(contents)
+        _write_sidecar(fn_sidecar, stat, digest, items)
+    else:
+        items = parse_wpl(contents)
+    logger.debug(f"parsed mission file: {filename} [{len(items)} items]")
+    return tuple(items)
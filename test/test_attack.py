@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import pickle
+import time
+
+from darjeeling.core import TestOutcome as Outcome
+import attr
+import pytest
+
+from darjeeling_ardupilot.attack import (AttackPhase, AttackSchedule,
+                                         AttackTrigger, TimeTrigger,
+                                         WaypointTrigger)
+from darjeeling_ardupilot.executor import ExecutionReport
+
+
+@attr.s
+class FakeParameters:
+    written = attr.ib(factory=list)
+
+    def set(self, name, value, retries=0):
+        self.written.append((name, value))
+
+
+@attr.s
+class FakeVehicle:
+    parameters = attr.ib(factory=FakeParameters)
+
+
+@attr.s
+class FakeHub:
+    vehicle = attr.ib(factory=FakeVehicle)
+    listeners = attr.ib(factory=dict)
+
+    def subscribe(self, message_type, callback):
+        self.listeners.setdefault(message_type, []).append(callback)
+        return lambda: self.listeners[message_type].remove(callback)
+
+    def receive(self, message_type, **fields):
+        message = Message(message_type, fields)
+        for callback in list(self.listeners.get(message_type, [])):
+            callback(message)
+
+
+class Message:
+    def __init__(self, message_type, fields):
+        self._type = message_type
+        self._timestamp = time.time()
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def get_type(self):
+        return self._type
+
+
+def test_time_trigger_measures_from_attach():
+    hub = FakeHub()
+    schedule = AttackSchedule((
+        AttackPhase(TimeTrigger(10.0), parameters=(('A', 1),)),))
+    with schedule.wait_and_send(hub) as records:
+        # the SITL has already been running for twenty minutes
+        hub.receive('SYSTEM_TIME', time_boot_ms=1200000)
+        hub.receive('ATTITUDE', time_boot_ms=1209000)
+        assert not records[0].triggered
+        hub.receive('ATTITUDE', time_boot_ms=1210000)
+        assert records[0].triggered
+    assert hub.vehicle.parameters.written == [('A', 1)]
+
+
+def test_phases_are_launched_in_order():
+    hub = FakeHub()
+    schedule = AttackSchedule((
+        AttackPhase(WaypointTrigger(2), parameters=(('A', 1),)),
+        AttackPhase(TimeTrigger(0.0), parameters=(('B', 2),))))
+    with schedule.wait_and_send(hub) as records:
+        hub.receive('ATTITUDE', time_boot_ms=5000)
+        hub.receive('MISSION_CURRENT', seq=1)
+        assert not any(r.triggered for r in records)
+        hub.receive('MISSION_CURRENT', seq=2)
+        hub.receive('ATTITUDE', time_boot_ms=6000)
+    assert [r.waypoint for r in records] == [2, 2]
+    assert hub.vehicle.parameters.written == [('A', 1), ('B', 2)]
+    assert not any(hub.listeners.values())
+
+
+def test_records_trigger_latency():
+    hub = FakeHub()
+    schedule = AttackSchedule((
+        AttackPhase(WaypointTrigger(1), parameters=(('A', 1),)),))
+    with schedule.wait_and_send(hub) as records:
+        message = Message('MISSION_CURRENT', {'seq': 1})
+        # the message was received a quarter of a second ago
+        message._timestamp -= 0.25
+        hub.listeners['MISSION_CURRENT'][0](message)
+    record = records[0]
+    assert record.waypoint == 1
+    assert 0.25 <= record.latency < 1.0
+
+    # records are returned by workers as part of their execution report
+    report = ExecutionReport(Outcome(False, 1.0),
+                             attack_records=tuple(records))
+    report = pickle.loads(pickle.dumps(report))
+    assert report.attack_records[0].latency == record.latency
+
+
+def test_phase_messages_are_validated_on_load():
+    trigger = {'waypoint': 1}
+    phase = AttackPhase.from_dict({
+        'trigger': trigger,
+        'mavlink': [{'type': 'PARAM_SET',
+                     'fields': {'target_system': 1,
+                                'target_component': 1,
+                                'param_id': b'A',
+                                'param_value': 1.0,
+                                'param_type': 9}}]})
+    assert phase.messages[0][0] == 'PARAM_SET'
+    with pytest.raises(ValueError):
+        AttackPhase.from_dict({'trigger': trigger,
+                               'mavlink': [{'type': 'PARAM_SETT'}]})
+    # fields that are missing or unknown
+    with pytest.raises(ValueError):
+        AttackPhase.from_dict({'trigger': trigger,
+                               'mavlink': [{'type': 'PARAM_SET',
+                                            'fields': {'param_value': 1.0}}]})
+    with pytest.raises(ValueError):
+        AttackTrigger.from_dict({'message': 'ATTITUDE',
+                                 'field': 'rol',
+                                 'above': 0.5})
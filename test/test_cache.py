@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from darjeeling.core import TestOutcome as Outcome
+
+from darjeeling_ardupilot.cache import OutcomeCache
+
+
+def test_least_recently_used_outcome_is_evicted():
+    cache = OutcomeCache(capacity=2)
+    cache.put('a', Outcome(True, 1.0))
+    cache.put('b', Outcome(False, 2.0))
+    assert cache.get('a') == Outcome(True, 1.0)
+    cache.put('c', Outcome(True, 3.0))
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == Outcome(True, 1.0)
+    assert cache.get('c') == Outcome(True, 3.0)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_outcomes_persist_in_recency_order(tmp_path):
+    filename = str(tmp_path / 'outcomes.json')
+    cache = OutcomeCache(filename, capacity=3)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, Outcome(True, 1.0))
+    cache.get('a')
+    cache.put('d', Outcome(False, 1.0))
+
+    reloaded = OutcomeCache(filename, capacity=2)
+    assert len(reloaded) == 2
+    assert reloaded.get('a') == Outcome(True, 1.0)
+    assert reloaded.get('b') is None
+    assert reloaded.get('c') is None
+    assert reloaded.get('d') == Outcome(False, 1.0)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import pytest
+
+from darjeeling_ardupilot import clock as clock_module
+from darjeeling_ardupilot.clock import SimClock
+
+
+class FakeHub:
+    def __init__(self):
+        self.listeners = {}
+
+    def subscribe(self, message_type, callback):
+        self.listeners.setdefault(message_type, []).append(callback)
+        return lambda: self.listeners[message_type].remove(callback)
+
+    def receive(self, message_type, time_boot_ms):
+        message = SimpleNamespace(time_boot_ms=time_boot_ms)
+        for callback in list(self.listeners.get(message_type, [])):
+            callback(message)
+
+
+@pytest.fixture
+def wall(monkeypatch):
+    """Replaces the wall clock of the module with one that is set by hand."""
+    now = SimpleNamespace(seconds=100.0)
+    monkeypatch.setattr(clock_module, 'timer', lambda: now.seconds)
+    return now
+
+
+def test_clock_has_no_time_until_reported(wall):
+    clock = SimClock()
+    assert not clock.started
+    assert clock.achieved_speedup is None
+    with pytest.raises(ValueError):
+        clock.time
+
+
+def test_speedup_is_measured_from_time_boot_ms(wall):
+    clock = SimClock()
+    hub = FakeHub()
+    with clock.track(hub):
+        # the vehicle booted long before it was first observed
+        hub.receive('SYSTEM_TIME', 600000)
+        assert clock.achieved_speedup is None
+        wall.seconds += 2.0
+        hub.receive('ATTITUDE', 620000)
+        assert clock.time == 620.0
+        assert clock.achieved_speedup == pytest.approx(10.0)
+    assert not any(hub.listeners.values())
+
+
+def test_stale_times_are_ignored(wall):
+    clock = SimClock()
+    clock.observe(5000)
+    wall.seconds += 1.0
+    clock.observe(9000)
+    # a message that arrives late does not move the clock backwards, nor
+    # does it change the wall-clock time of the latest report
+    wall.seconds += 1.0
+    clock.observe(8000)
+    assert clock.time == 9.0
+    assert clock.achieved_speedup == pytest.approx(4.0)
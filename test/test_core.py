@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from darjeeling_ardupilot.core import Monitor, MonitorStatus, Verdict
+from darjeeling_ardupilot.simple import SimpleMonitor
+from darjeeling_ardupilot.online import OnlineMonitor
+
+
+class LegacyMonitor(Monitor):
+    """A monitor that predates shared connections."""
+    def attach_to(self, url_mavlink: str) -> None:
+        self.url = url_mavlink
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def status(self) -> MonitorStatus:
+        raise NotImplementedError
+
+    def notify_mission_end(self) -> None:
+        pass
+
+
+def test_legacy_monitor_does_not_support_shared_connection():
+    monitor = LegacyMonitor()
+    assert not monitor.supports_shared_connection
+    with pytest.raises(TypeError):
+        monitor.attach_to_hub(None)
+
+
+def test_builtin_monitors_support_shared_connection():
+    simple = SimpleMonitor(mission=None)
+    assert simple.supports_shared_connection
+    assert OnlineMonitor(simple, mission=None).supports_shared_connection
+
+
+def test_verdict_is_issued_once():
+    verdict = Verdict()
+    reasons = []
+    verdict.subscribe(reasons.append)
+    verdict.issue('crashed')
+    verdict.issue('strayed')
+    assert verdict.reason == 'crashed'
+    assert reasons == ['crashed']
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+
+import dronekit
+
+from darjeeling_ardupilot.ardu import Mission
+from darjeeling_ardupilot.corridor import (Corridor, MAV_CMD_NAV_LAND,
+                                           MAV_CMD_NAV_RETURN_TO_LAUNCH,
+                                           MAV_CMD_NAV_TAKEOFF,
+                                           MAV_CMD_NAV_WAYPOINT,
+                                           _distance_to_segment)
+
+
+def random_walk(num_points, step, seed):
+    rng = random.Random(seed)
+    points = [(0.0, 0.0)]
+    for _ in range(num_points):
+        north, east = points[-1]
+        heading = rng.uniform(0, 2 * math.pi)
+        points.append((north + step * math.cos(heading),
+                       east + step * math.sin(heading)))
+    return tuple(zip(points, points[1:]))
+
+
+def brute_force_distance(corridor, p):
+    distance = min(_distance_to_segment(p, leg) for leg in corridor.legs)
+    return distance if distance <= corridor.width else None
+
+
+def test_grid_matches_brute_force():
+    rng = random.Random(0)
+    corridor = Corridor(random_walk(200, 50.0, seed=1), 5.0, (0.0, 0.0))
+    for _ in range(5000):
+        leg = rng.choice(corridor.legs)
+        (ax, ay), (bx, by) = leg
+        t = rng.random()
+        p = (ax + t * (bx - ax) + rng.uniform(-15, 15),
+             ay + t * (by - ay) + rng.uniform(-15, 15))
+        expected = brute_force_distance(corridor, p)
+        actual = corridor.distance_local(p)
+        if expected is None:
+            assert actual is None
+        else:
+            assert actual is not None
+            assert math.isclose(actual, expected, abs_tol=1e-9)
+
+
+def test_grid_handles_axis_aligned_and_degenerate_legs():
+    legs = (((0.0, 0.0), (0.0, 100.0)),
+            ((0.0, 100.0), (100.0, 100.0)),
+            ((100.0, 100.0), (100.0, 100.0)))
+    corridor = Corridor(legs, 2.0, (0.0, 0.0))
+    assert corridor.distance_local((1.5, 50.0)) == 1.5
+    assert corridor.distance_local((50.0, 98.5)) == 1.5
+    assert corridor.distance_local((101.0, 101.0)) == math.sqrt(2)
+    assert corridor.distance_local((2.5, 50.0)) is None
+    assert corridor.distance_local((50.0, 50.0)) is None
+
+
+def test_corridor_for_mission():
+    def command(cmd, x=0.0, y=0.0, z=0.0):
+        return dronekit.Command(0, 0, 0, 3, cmd, 0, 0, 0, 0, 0, 0, x, y, z)
+
+    home = (-35.3632621, 149.1652374)
+    mission = Mission(filename='mission.txt', commands=[
+        command(MAV_CMD_NAV_WAYPOINT, *home),
+        command(MAV_CMD_NAV_TAKEOFF, z=20.0),
+        command(MAV_CMD_NAV_WAYPOINT, -35.3632621, 149.1663374, 20.0),
+        command(MAV_CMD_NAV_RETURN_TO_LAUNCH),
+        command(MAV_CMD_NAV_LAND)])
+    corridor = Corridor.for_mission(mission, 5.0)
+    assert len(corridor.legs) == 2
+    (start, end), (back, finish) = corridor.legs
+    assert start == finish == (0.0, 0.0)
+    assert end == back
+    assert math.isclose(end[1], 99.8, abs_tol=0.1)
+    # halfway along the first leg, and a little to the north
+    assert math.isclose(corridor.distance(-35.3632421, 149.1657874),
+                        2.2, abs_tol=0.1)
+    assert corridor.distance(-35.3633621, 149.1657874) is None
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from darjeeling_ardupilot.executor import WorkerPool
+
+
+def succeed() -> bool:
+    return True
+
+
+def sleep_forever() -> None:
+    time.sleep(60)
+
+
+def test_worker_pool_reuses_workers():
+    pool = WorkerPool(size=1)
+    try:
+        assert pool.run(succeed, 10.0)
+        pid = pool._idle[0].process.pid
+        assert pool.run(succeed, 10.0)
+        assert pool._idle[0].process.pid == pid
+    finally:
+        pool.close()
+
+
+def test_worker_pool_replaces_killed_worker_for_waiting_caller():
+    pool = WorkerPool(size=1)
+    results = {}
+
+    def run(name, fn, timeout):
+        results[name] = pool.run(fn, timeout)
+
+    try:
+        busy = threading.Thread(target=run,
+                                args=('busy', sleep_forever, 0.5))
+        busy.start()
+        time.sleep(0.1)
+        # this caller must wait for the only worker, which is then killed
+        waiting = threading.Thread(target=run,
+                                   args=('waiting', succeed, 10.0))
+        waiting.start()
+        busy.join(10.0)
+        waiting.join(10.0)
+        assert not waiting.is_alive()
+        assert results == {'busy': None, 'waiting': True}
+        assert pool._num_workers == 1
+    finally:
+        pool.close()
+    assert pool._num_workers == 0
+
+
+def test_failed_execution_is_reported_as_error():
+    pool = WorkerPool(size=1)
+    try:
+        # the worker fails to execute the job since no SITL is given
+        report = pool.run_with_monitor(10.0)
+    finally:
+        pool.close()
+    assert report.error
+    assert not report.timed_out
+    assert not report.outcome.successful
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from contextlib import closing
+from urllib.request import urlopen
+import socket
+
+from darjeeling_ardupilot.metrics import MetricsRegistry
+
+
+def free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_serve_is_idempotent_and_stops_on_close():
+    registry = MetricsRegistry()
+    registry.counter('tests', 'The number of tests.').inc()
+    port = free_port()
+    registry.serve(port)
+    try:
+        registry.serve(port)
+        url = f'http://127.0.0.1:{port}/metrics'
+        with urlopen(url, timeout=5) as response:
+            body = response.read().decode('utf-8')
+        assert 'darjeeling_ardupilot_tests 1' in body
+    finally:
+        registry.close()
+    # the port is released once the registry has been closed
+    other = MetricsRegistry()
+    other.serve(port)
+    assert other._server is not None
+    other.close()
+
+
+def test_serve_does_not_raise_if_address_in_use():
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(('127.0.0.1', 0))
+        s.listen(1)
+        registry = MetricsRegistry()
+        registry.serve(s.getsockname()[1])
+        assert registry._server is None
+        registry.close()
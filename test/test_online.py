@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+from pymavlink import mavutil
+import dronekit
+
+from darjeeling_ardupilot.ardu import Mission
+from darjeeling_ardupilot.core import Verdict
+from darjeeling_ardupilot.online import OnlineMonitor, OnlineOracle
+from darjeeling_ardupilot.simple import SimpleMonitor
+
+mavlink = mavutil.mavlink
+
+
+def command(cmd, param1=0.0, x=0.0, y=0.0, z=0.0):
+    return dronekit.Command(0, 0, 0, mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                            cmd, 0, 0, param1, 0, 0, 0, x, y, z)
+
+
+MISSION = Mission(filename='loiter.txt', commands=[
+    command(mavlink.MAV_CMD_NAV_WAYPOINT, x=-35.36, y=149.16),
+    command(mavlink.MAV_CMD_NAV_TAKEOFF, z=20.0),
+    command(mavlink.MAV_CMD_NAV_LOITER_TIME, param1=120.0,
+            x=-35.36, y=149.16, z=20.0),
+    command(mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH)])
+
+
+def monitor_for(oracle):
+    verdict = Verdict()
+    monitor = OnlineMonitor(SimpleMonitor(mission=MISSION),
+                            mission=MISSION,
+                            oracle=oracle)
+    monitor.bind_verdict(verdict)
+    monitor._check_heartbeat(SimpleNamespace(
+        type=mavlink.MAV_TYPE_QUADROTOR,
+        base_mode=mavlink.MAV_MODE_FLAG_SAFETY_ARMED))
+    return monitor, verdict
+
+
+def position(seconds):
+    return SimpleNamespace(time_boot_ms=int(seconds * 1000),
+                           relative_alt=20000,
+                           lat=-353600000,
+                           lon=1491600000)
+
+
+def test_progress_is_not_checked_by_default():
+    monitor, verdict = monitor_for(OnlineOracle())
+    for seconds in range(0, 600, 10):
+        monitor._check_position(position(seconds))
+    assert not verdict.issued
+
+
+def test_vehicle_may_hold_position_for_loiter_time():
+    monitor, verdict = monitor_for(OnlineOracle(no_progress_seconds=10.0))
+    monitor._check_mission_current(SimpleNamespace(seq=2))
+    for seconds in range(0, 130):
+        monitor._check_position(position(seconds))
+    assert not verdict.issued
+    monitor._check_position(position(131))
+    assert verdict.issued
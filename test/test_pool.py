@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+import contextlib
+import threading
+
+import pytest
+
+from darjeeling_ardupilot import pool as pool_module
+from darjeeling_ardupilot.pool import SITLPool
+from darjeeling_ardupilot.util import PortAllocator
+
+HOME = (-35.36, 149.16, 584.0, 353.0)
+
+
+@pytest.fixture
+def launches(monkeypatch):
+    """Replaces SITL launches with fakes, and records the arguments of each
+    launched SITL and whether it is still running."""
+    running = {}
+    lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def launch(*, instance, speedup, **kwargs):
+        with lock:
+            name = f'sitl-{len(running)}'
+            running[name] = True
+        try:
+            yield (f'udp:{name}:{instance}:{speedup}',)
+        finally:
+            running[name] = False
+
+    monkeypatch.setattr(pool_module.SITL, 'launch', launch)
+    return running
+
+
+@pytest.fixture
+def pool():
+    sitl_pool = SITLPool(PortAllocator(43100, 43199), transport='unix')
+    yield sitl_pool
+    sitl_pool.close()
+
+
+def acquire(pool, container, speedup=10):
+    with pool.acquire(container=container,
+                      model='copter',
+                      parameters_filename='copter.parm',
+                      home=HOME,
+                      speedup=speedup) as urls:
+        return urls
+
+
+def prelaunch(pool, container, speedup=10):
+    pool.prelaunch(container=container,
+                   model='copter',
+                   parameters_filename='copter.parm',
+                   home=HOME,
+                   speedup=speedup)
+
+
+def wait_until_ready(pool):
+    for futures in list(pool._warm.values()):
+        for future in list(futures):
+            future.result()
+
+
+def test_acquire_uses_matching_prelaunched_sitl(pool, launches):
+    container = SimpleNamespace(id='a')
+    prelaunch(pool, container)
+    urls = acquire(pool, container)
+    assert (pool.hits, pool.misses) == (1, 0)
+    assert urls == ('udp:sitl-0:0:10',)
+    # the SITL is destroyed after its test, rather than being returned
+    assert launches == {'sitl-0': False}
+    assert pool.num_warm == 0
+
+
+def test_acquire_launches_sitl_if_none_matches(pool, launches):
+    container = SimpleNamespace(id='a')
+    other = SimpleNamespace(id='b')
+    prelaunch(pool, container, speedup=5)
+    prelaunch(pool, other)
+    acquire(pool, container)
+    assert (pool.hits, pool.misses) == (0, 1)
+    assert pool.hit_rate == 0.0
+    wait_until_ready(pool)
+    # the pre-launched SITLs remain available for later tests
+    assert pool.num_warm == 2
+    acquire(pool, other)
+    assert (pool.hits, pool.misses) == (1, 1)
+    assert pool.hit_rate == 0.5
+
+
+def test_idle_sitls_are_evicted(pool, launches):
+    container = SimpleNamespace(id='a')
+    pool.idle_timeout = 0.0
+    prelaunch(pool, container)
+    wait_until_ready(pool)
+    assert pool.num_warm == 1
+    pool.evict_idle()
+    assert pool.num_warm == 0
+    assert launches == {'sitl-0': False}
+    acquire(pool, container)
+    assert (pool.hits, pool.misses) == (0, 1)
+
+
+def test_discard_only_destroys_sitls_of_container(pool, launches):
+    container = SimpleNamespace(id='a')
+    other = SimpleNamespace(id='b')
+    prelaunch(pool, container)
+    prelaunch(pool, other)
+    wait_until_ready(pool)
+    pool.discard(container)
+    assert pool.num_warm == 1
+    assert sorted(launches.values()) == [False, True]
+    pool.close()
+    assert not any(launches.values())
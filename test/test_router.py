@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import tempfile
+
+from darjeeling_ardupilot.router import _StreamEndpoint, split_frames
+
+FRAME_V1 = bytes([0xFE, 2, 0, 1, 1, 0, 0xAA, 0xBB, 0, 0])
+
+
+def test_split_frames_keeps_partial_frame():
+    buffer = bytearray(b'\x00' + FRAME_V1 + FRAME_V1[:4])
+    assert split_frames(buffer) == [FRAME_V1]
+    assert buffer == bytearray(FRAME_V1[:4])
+
+
+def test_stream_close_cancels_client_handlers():
+    async def main(path):
+        sitl = []
+
+        class _Writer:
+            def write(self, data):
+                sitl.append(data)
+
+        stream = _StreamEndpoint(_Writer())  # type: ignore
+        server = await asyncio.start_unix_server(stream.handle_client,
+                                                 path=path)
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(FRAME_V1)
+        await writer.drain()
+        for _ in range(100):
+            if sitl:
+                break
+            await asyncio.sleep(0.01)
+        tasks = list(stream._tasks)
+        assert sitl == [FRAME_V1]
+        assert len(tasks) == 1
+
+        server.close()
+        await stream.close()
+        assert all(task.done() for task in tasks)
+        assert not stream._tasks
+        assert await reader.read() == b''
+        writer.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(main(os.path.join(directory, 'router')))
+        finally:
+            loop.close()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+import functools
+import math
+
+import numpy as np
+import pytest
+
+from darjeeling_ardupilot.similarity import (SimilarityMonitor, dtw_distance,
+                                             fitness, local_positions,
+                                             time_aligned_distance)
+from darjeeling_ardupilot.simple import SimpleMonitor
+from darjeeling_ardupilot.trajectory import Trajectory
+
+
+def brute_force_dtw(a, b):
+    """Computes the normalised DTW distance by plain recursion."""
+    @functools.lru_cache(maxsize=None)
+    def cost(i, j):
+        if i == 0 and j == 0:
+            return 0.0
+        if i == 0 or j == 0:
+            return math.inf
+        step = float(np.linalg.norm(a[i - 1] - b[j - 1]))
+        return step + min(cost(i - 1, j - 1), cost(i - 1, j), cost(i, j - 1))
+    return cost(len(a), len(b)) / max(len(a), len(b))
+
+
+def straight_line(times, speed=1.0):
+    """A trajectory that heads north at a given speed."""
+    times = np.asarray(times, dtype=float)
+    return times, np.column_stack((times * speed,
+                                   np.zeros(len(times)),
+                                   np.full(len(times), 10.0)))
+
+
+def test_identical_traces_have_no_distance():
+    times, xyz = straight_line(np.arange(20))
+    assert time_aligned_distance(times, xyz, times, xyz) == 0.0
+    assert dtw_distance(times, xyz, times, xyz) == 0.0
+    assert fitness(0.0, 10.0) == 1.0
+    assert fitness(10.0, 10.0) == 0.5
+
+
+def test_dtw_matches_brute_force():
+    rng = np.random.RandomState(3)
+    for n, m in ((1, 1), (4, 7), (12, 9)):
+        a = rng.uniform(-5, 5, (n, 3))
+        b = rng.uniform(-5, 5, (m, 3))
+        # samples that are one second apart are not changed by resampling
+        distance = dtw_distance(np.arange(n), a, np.arange(m), b)
+        assert distance == pytest.approx(brute_force_dtw(a, b))
+
+
+def test_time_aligned_distance_interpolates_other_sampling():
+    times_reference, xyz_reference = straight_line(np.arange(0, 30, 1.0))
+    times_candidate, xyz_candidate = straight_line(np.arange(0, 30, 0.3))
+    distance = time_aligned_distance(times_reference, xyz_reference,
+                                     times_candidate, xyz_candidate)
+    assert distance == pytest.approx(0.0, abs=1e-9)
+
+
+def test_time_aligned_distance_holds_final_position_of_short_trace():
+    times_reference, xyz_reference = straight_line(np.arange(10))
+    times_candidate, xyz_candidate = straight_line(np.arange(5))
+    distance = time_aligned_distance(times_reference, xyz_reference,
+                                     times_candidate, xyz_candidate)
+    # the candidate stops at 4 metres, while the reference reaches 9 metres
+    expected = math.sqrt(sum(d ** 2 for d in range(1, 6)) / 10)
+    assert distance == pytest.approx(expected)
+
+
+def test_dtw_tolerates_a_different_pace():
+    times_reference, xyz_reference = straight_line(np.arange(21))
+    times_slow, xyz_slow = straight_line(np.arange(41), speed=0.5)
+    dtw = dtw_distance(times_reference, xyz_reference, times_slow, xyz_slow)
+    aligned = time_aligned_distance(times_reference, xyz_reference,
+                                    times_slow, xyz_slow)
+    assert dtw < aligned / 4
+
+
+def test_empty_traces_are_infinitely_far_apart():
+    times, xyz = straight_line(np.arange(5))
+    empty = np.empty(0), np.empty((0, 3))
+    assert time_aligned_distance(times, xyz, *empty) == math.inf
+    assert dtw_distance(*empty, times, xyz) == math.inf
+
+
+def make_trajectory(num_samples):
+    """A trajectory that climbs to 20 metres and then heads north."""
+    trajectory = Trajectory()
+    for index in range(num_samples):
+        trajectory.positions.append(SimpleNamespace(
+            time_boot_ms=60000 + index * 1000,
+            lat=-353632620 + index * 90,
+            lon=1491652370,
+            alt=604000,
+            relative_alt=20000 if index else 0,
+            vx=100, vy=0, vz=0, hdg=0))
+    return trajectory
+
+
+def test_local_positions_start_at_takeoff():
+    times, xyz = local_positions(make_trajectory(5))
+    assert list(times) == [0.0, 1.0, 2.0, 3.0]
+    assert xyz[0, 2] == 20.0
+    assert np.all(np.diff(xyz[:, 0]) > 0)
+
+
+def test_partial_trajectory_is_graded_on_close(tmp_path):
+    filename = str(tmp_path / 'reference.traj')
+    make_trajectory(60).save(filename)
+    monitor = SimilarityMonitor(SimpleMonitor(mission=None),
+                                reference_filename=filename,
+                                threshold=10.0)
+    # the mission was aborted, so the monitor is closed without being
+    # notified of the end of the mission
+    monitor.trajectory = make_trajectory(30)
+    monitor.close()
+    status = monitor.status
+    assert status.distance > 0
+    assert 0 < status.fitness < 1
+
+    complete = SimilarityMonitor(SimpleMonitor(mission=None),
+                                 reference_filename=filename)
+    complete.trajectory = make_trajectory(60)
+    complete.close()
+    assert complete.status.distance == pytest.approx(0.0, abs=1e-9)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from darjeeling_ardupilot.speedup import SpeedupController
+
+
+def test_speedup_backs_off_to_achieved_speedup():
+    controller = SpeedupController(maximum=50)
+    assert controller.speedup('t', 20) == 20
+    assert controller.update('t', 20, 12.7) == 12
+    assert controller.speedup('t', 20) == 12
+
+
+def test_speedup_increases_after_stable_runs():
+    controller = SpeedupController(increase_after=3, increase_factor=1.25)
+    assert controller.update('t', 10, 9.5) == 10
+    assert controller.update('t', 10, 9.5) == 10
+    assert controller.update('t', 10, 9.5) == 12
+    # the streak starts over after each increase
+    assert controller.update('t', 12, 12.0) == 12
+
+
+def test_speedup_is_clamped():
+    controller = SpeedupController(minimum=2, maximum=10)
+    assert controller.speedup('t', 20) == 10
+    assert controller.update('t', 10, 0.5) == 2
+
+
+def test_unmeasured_speedup_is_ignored():
+    controller = SpeedupController()
+    assert controller.update('t', 10, None) == 10
+    assert controller.update('t', 10, 2.0) == 2
+    assert controller.update('t', 10, None) == 2
+
+
+def test_learned_speedups_persist(tmp_path):
+    filename = str(tmp_path / 'speedups.json')
+    SpeedupController(filename).update('t', 20, 7.2)
+    assert SpeedupController(filename).speedup('t', 20) == 7
+    assert SpeedupController(filename, maximum=5).speedup('t', 20) == 5
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from darjeeling_ardupilot.timing import PhaseStatistics, PhaseTimer
+
+
+def test_timer_accumulates_phases_in_order():
+    timer = PhaseTimer()
+    timer.record('connect', 1.0)
+    timer.record('boot', 2.0)
+    timer.record('connect', 0.5)
+    with timer.measure('flight'):
+        time.sleep(0.01)
+    timer.mark()
+    assert timer.lap('verdict') >= 0.0
+    durations = timer.durations
+    assert list(durations) == ['connect', 'boot', 'flight', 'verdict']
+    assert durations['connect'] == 1.5
+    assert durations['flight'] >= 0.01
+
+
+def test_percentiles_are_ordered_by_phase():
+    statistics = PhaseStatistics()
+    for index in range(1, 101):
+        statistics.add({'flight': float(index),
+                        'custom': 1.0,
+                        'boot': 2.0 * index})
+    percentiles = statistics.percentiles((50, 90, 99))
+    # known phases come first, in the order in which they occur
+    assert list(percentiles) == ['boot', 'flight', 'custom']
+    flight = percentiles['flight']
+    assert flight[50] < flight[90] < flight[99] <= 100.0
+    assert flight[50] == pytest.approx(50.5)
+    assert percentiles['custom'] == {50: 1.0, 90: 1.0, 99: 1.0}
+    assert statistics.percentiles((50,), phases=['boot', 'arm']) == \
+        {'boot': {50: pytest.approx(101.0)}}
+
+
+def test_statistics_only_keep_most_recent_executions():
+    statistics = PhaseStatistics(size=10)
+    assert len(statistics) == 0
+    for index in range(100):
+        statistics.add({'flight': float(index)})
+    assert len(statistics) == 10
+    flight = statistics.percentiles((0, 100))['flight']
+    assert flight == {0: 90.0, 100: 99.0}
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import pytest
+
+from darjeeling_ardupilot.trajectory import (ATTITUDE_FIELDS, SampleTable,
+                                             Trajectory)
+
+
+def position(index):
+    return SimpleNamespace(time_boot_ms=1000 * index,
+                           lat=-353632620 + index,
+                           lon=1491652370 - index,
+                           alt=584000 + index,
+                           relative_alt=index,
+                           vx=-index, vy=index, vz=0,
+                           hdg=(index * 100) % 36000)
+
+
+def attitude(index):
+    return SimpleNamespace(time_boot_ms=1000 * index,
+                           roll=0.5, pitch=-0.25, yaw=index / 8,
+                           rollspeed=0.0, pitchspeed=0.0, yawspeed=1.0)
+
+
+def test_table_grows_beyond_capacity():
+    table = SampleTable(ATTITUDE_FIELDS, capacity=4)
+    for index in range(10):
+        table.append(attitude(index))
+    assert len(table) == 10
+    assert table.capacity == 16
+    assert table.bytes_per_sample == 28
+    assert table.nbytes == 280
+    assert list(table.column('time_boot_ms')) == \
+        [1000 * i for i in range(10)]
+    with pytest.raises(KeyError):
+        table.column('altitude')
+
+
+def test_trajectory_round_trip(tmp_path):
+    trajectory = Trajectory()
+    for index in range(5000):
+        trajectory.positions.append(position(index))
+    for index in range(3):
+        trajectory.attitudes.append(attitude(index))
+    filename = str(tmp_path / 'flight.traj')
+    trajectory.save(filename)
+
+    loaded = Trajectory.load(filename)
+    assert len(loaded.positions) == 5000
+    assert len(loaded.attitudes) == 3
+    for table, original in ((loaded.positions, trajectory.positions),
+                            (loaded.attitudes, trajectory.attitudes)):
+        for name, _ in table.fields:
+            assert table.column(name) == original.column(name)
+    # a loaded trajectory can continue to record samples
+    loaded.attitudes.append(attitude(3))
+    assert list(loaded.attitudes.column('yaw')) == [0.0, 0.125, 0.25, 0.375]
+
+
+def test_empty_trajectory_round_trip(tmp_path):
+    filename = str(tmp_path / 'empty.traj')
+    Trajectory().save(filename)
+    loaded = Trajectory.load(filename)
+    assert len(loaded.positions) == 0
+    assert loaded.nbytes == 0
+
+
+def test_load_rejects_other_files(tmp_path):
+    filename = tmp_path / 'mission.txt'
+    filename.write_bytes(b'QGC WPL 110\n')
+    with pytest.raises(ValueError):
+        Trajectory.load(str(filename))
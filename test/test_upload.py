@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from pymavlink import mavutil
+import dronekit
+import pytest
+
+from darjeeling_ardupilot.ardu import Mission
+from darjeeling_ardupilot.upload import MissionDownloader, MissionUploader
+
+mavlink = mavutil.mavlink
+
+
+class SimulatedVehicle:
+    """Follows the rules by which ArduPilot accepts mission items: items
+    are requested one at a time and are only accepted in sequence. Messages
+    in either direction are delayed by a fixed latency and may be lost."""
+    def __init__(self, latency=0.001, loss=0.0, seed=0, result=0,
+                 silent=False, timeout_request=0.02):
+        self.message_factory = mavlink.MAVLink(None)
+        self.latency = latency
+        self.loss = loss
+        self.result = result
+        self.silent = silent
+        self.timeout_request = timeout_request
+        self.items = []
+        self.sent_types = []
+        self.acks = []
+        self._rng = random.Random(seed)
+        self._listeners = {}
+        self._events = []
+        self._order = itertools.count()
+        self._lock = threading.Condition()
+        self._expected = None
+        self._time_request = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add_message_listener(self, name, listener):
+        with self._lock:
+            self._listeners.setdefault(name, []).append(listener)
+
+    def remove_message_listener(self, name, listener):
+        with self._lock:
+            self._listeners[name].remove(listener)
+
+    def send_mavlink(self, message):
+        self.sent_types.append(message.get_type())
+        self._schedule(self._receive, message)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        self._thread.join()
+
+    def _schedule(self, handler, message):
+        # acknowledgements are never lost, as in the real protocol the
+        # vehicle repeats them in response to repeated items
+        if message.get_type() != 'MISSION_ACK' \
+                and self._rng.random() < self.loss:
+            return
+        with self._lock:
+            event = (time.time() + self.latency, next(self._order),
+                     handler, message)
+            heapq.heappush(self._events, event)
+            self._lock.notify_all()
+
+    def _reply(self, message):
+        self._schedule(self._deliver, message)
+
+    def _deliver(self, message):
+        with self._lock:
+            listeners = list(self._listeners.get(message.get_type(), []))
+        for listener in listeners:
+            listener(self, message.get_type(), message)
+
+    def _request(self, seq):
+        self._time_request = time.time()
+        self._reply(self.message_factory.mission_request_int_encode(0, 0,
+                                                                    seq))
+
+    def _item_int(self, item):
+        if item.get_type() == 'MISSION_ITEM_INT':
+            return item
+        # local positions are scaled by 1e4
+        return self.message_factory.mission_item_int_encode(
+            0, 0, item.seq, item.frame, item.command, item.current,
+            item.autocontinue, item.param1, item.param2, item.param3,
+            item.param4, int(item.x * 1e4), int(item.y * 1e4), item.z)
+
+    def _receive(self, message):
+        if self.silent:
+            return
+        message_type = message.get_type()
+        if message_type == 'MISSION_REQUEST_LIST':
+            self._reply(self.message_factory.mission_count_encode(
+                0, 0, len(self.items)))
+        elif message_type == 'MISSION_REQUEST_INT':
+            if 0 <= message.seq < len(self.items):
+                self._reply(self._item_int(self.items[message.seq]))
+        elif message_type == 'MISSION_ACK':
+            self.acks.append(message.type)
+        elif message_type == 'MISSION_COUNT':
+            self.items = [None] * message.count
+            self._expected = 0
+            self._request(0)
+        elif message_type in ('MISSION_ITEM_INT', 'MISSION_ITEM'):
+            if self._expected is None:
+                return
+            if message.seq != self._expected:
+                self._reply(self.message_factory.mission_ack_encode(
+                    0, 0, mavlink.MAV_MISSION_INVALID_SEQUENCE))
+                return
+            self.items[message.seq] = message
+            self._expected += 1
+            if self._expected == len(self.items):
+                self._expected = None
+                self._reply(self.message_factory.mission_ack_encode(
+                    0, 0, self.result))
+            else:
+                self._request(self._expected)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                now = time.time()
+                if self._events and self._events[0][0] <= now:
+                    _, _, handler, message = heapq.heappop(self._events)
+                else:
+                    # repeat the request for the expected item
+                    if self._expected is not None and not self.silent \
+                            and now - self._time_request \
+                            > self.timeout_request:
+                        self._request(self._expected)
+                    timeout = self._events[0][0] - now if self._events \
+                        else self.timeout_request
+                    self._lock.wait(timeout)
+                    continue
+            handler(message)
+
+
+def make_mission(num_items):
+    commands = [dronekit.Command(0, 0, 0, 0, 16, 0, 1, 0, 0, 0, 0,
+                                 -35.3632621, 149.1652374, 584.0)]
+    for i in range(1, num_items):
+        commands.append(dronekit.Command(
+            0, 0, 0, 3, 16, 0, 1, 0, 0, 0, 0,
+            -35.3632621 + i * 1e-5, 149.1652374 - i * 1e-5, 20.0 + i))
+    return commands
+
+
+def assert_stored(vehicle, commands):
+    assert len(vehicle.items) == len(commands)
+    for item, command in zip(vehicle.items, commands):
+        assert item.get_type() == 'MISSION_ITEM_INT'
+        assert (item.frame, item.command) == (command.frame, command.command)
+        assert item.x == int(round(command.x * 1e7))
+        assert item.y == int(round(command.y * 1e7))
+        assert item.z == pytest.approx(command.z)
+
+
+@pytest.fixture
+def vehicles():
+    created = []
+
+    def create(**kwargs):
+        vehicle = SimulatedVehicle(**kwargs)
+        created.append(vehicle)
+        return vehicle
+
+    yield create
+    for vehicle in created:
+        vehicle.close()
+
+
+def test_lossless_upload_needs_no_retransmissions(vehicles):
+    vehicle = vehicles()
+    commands = make_mission(300)
+    report = MissionUploader(vehicle, window=16).upload(commands)
+    assert_stored(vehicle, commands)
+    assert report.items == 300
+    assert report.requests == 300
+    assert report.retransmissions == 0
+
+
+def test_pipelined_upload_is_faster_than_sequential(vehicles):
+    commands = make_mission(100)
+    vehicle = vehicles(latency=0.002, timeout_request=1.0)
+    sequential = MissionUploader(vehicle, window=1).upload(commands)
+    vehicle = vehicles(latency=0.002, timeout_request=1.0)
+    pipelined = MissionUploader(vehicle, window=16).upload(commands)
+    assert_stored(vehicle, commands)
+    assert pipelined.duration < sequential.duration / 2
+
+
+def test_lossy_upload_resends_missing_items(vehicles):
+    vehicle = vehicles(loss=0.03, seed=3)
+    commands = make_mission(300)
+    uploader = MissionUploader(vehicle, window=16, timeout_retry=0.05)
+    report = uploader.upload(commands, timeout=10.0)
+    assert_stored(vehicle, commands)
+    assert report.retransmissions > 0
+
+
+def test_local_frames_use_float_items(vehicles):
+    vehicle = vehicles()
+    commands = make_mission(2)
+    commands.append(dronekit.Command(0, 0, 0, 1, 16, 0, 1, 0, 0, 0, 0,
+                                     10.0, -5.0, 2.0))
+    MissionUploader(vehicle).upload(commands)
+    assert vehicle.items[2].get_type() == 'MISSION_ITEM'
+    assert (vehicle.items[2].x, vehicle.items[2].y) == (10.0, -5.0)
+
+
+def test_rejected_upload_raises_value_error(vehicles):
+    vehicle = vehicles(result=mavlink.MAV_MISSION_NO_SPACE)
+    with pytest.raises(ValueError):
+        MissionUploader(vehicle).upload(make_mission(5))
+
+
+def test_silent_vehicle_times_out(vehicles):
+    vehicle = vehicles(silent=True)
+    uploader = MissionUploader(vehicle, timeout_retry=0.05)
+    with pytest.raises(TimeoutError):
+        uploader.upload(make_mission(5), timeout=0.3)
+    # the mission count was repeated while waiting for a response
+    assert vehicle.sent_types.count('MISSION_COUNT') > 1
+
+
+def test_download_returns_stored_items(vehicles):
+    vehicle = vehicles(loss=0.03, seed=5)
+    commands = make_mission(200)
+    uploader = MissionUploader(vehicle, timeout_retry=0.05)
+    uploader.upload(commands, timeout=10.0)
+    downloader = MissionDownloader(vehicle, timeout_retry=0.05)
+    downloaded = downloader.download(timeout=10.0)
+    assert [item.seq for item in downloaded.items] == list(range(200))
+    assert downloaded.items == tuple(vehicle.items)
+    # the download is acknowledged once all items have arrived
+    time.sleep(0.05)
+    assert vehicle.acks == [mavlink.MAV_MISSION_ACCEPTED]
+
+
+def test_download_can_stop_after_count(vehicles):
+    vehicle = vehicles()
+    MissionUploader(vehicle).upload(make_mission(20))
+    counts = []
+
+    def fetch_items(count, opaque_id):
+        counts.append(count)
+        return False
+
+    downloader = MissionDownloader(vehicle, timeout_retry=0.05)
+    downloaded = downloader.download(timeout=5.0, fetch_items=fetch_items)
+    assert counts == [20]
+    assert downloaded.count == 20
+    assert downloaded.items == ()
+    assert 'MISSION_REQUEST_INT' not in vehicle.sent_types
+
+
+def test_mission_with_different_count_is_not_fetched(vehicles):
+    vehicle = vehicles()
+    MissionUploader(vehicle).upload(make_mission(8))
+    mission = Mission(filename='mission.txt', commands=make_mission(10))
+    assert not mission.is_loaded_on(vehicle)
+    assert 'MISSION_REQUEST_INT' not in vehicle.sent_types
+
+
+def test_download_of_empty_mission(vehicles):
+    vehicle = vehicles()
+    assert MissionDownloader(vehicle).download().items == ()
+
+
+def test_silent_vehicle_download_times_out(vehicles):
+    vehicle = vehicles(silent=True)
+    downloader = MissionDownloader(vehicle, timeout_retry=0.05)
+    with pytest.raises(TimeoutError):
+        downloader.download(timeout=0.3)
+    assert vehicle.sent_types.count('MISSION_REQUEST_LIST') > 1
+
+
+def test_mission_is_loaded_only_if_stored_exactly(vehicles):
+    vehicle = vehicles()
+    commands = make_mission(10)
+    mission = Mission(filename='mission.txt', commands=commands)
+    assert not mission.is_loaded_on(vehicle)
+    MissionUploader(vehicle).upload(commands)
+    assert mission.is_loaded_on(vehicle)
+
+    # a waypoint that differs by 1e-7 degrees (about 1 cm) is a new mission
+    moved = list(commands)
+    c = moved[5]
+    moved[5] = dronekit.Command(0, 0, 0, c.frame, c.command, 0, 1,
+                                c.param1, c.param2, c.param3, c.param4,
+                                c.x + 1e-7, c.y, c.z)
+    assert not Mission(filename='moved.txt', commands=moved) \
+        .is_loaded_on(vehicle)
+
+    # missions with items in local frames are always uploaded
+    local = commands + [dronekit.Command(0, 0, 0, 1, 16, 0, 1, 0, 0, 0, 0,
+                                         10.0, -5.0, 2.0)]
+    MissionUploader(vehicle).upload(local)
+    assert not Mission(filename='local.txt', commands=local) \
+        .is_loaded_on(vehicle)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from contextlib import closing
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from darjeeling_ardupilot.util import PortAllocator, atomic_write
+
+
+@pytest.fixture
+def ports():
+    """Provides an allocator for a range of ten ports that are free."""
+    for start in range(42000, 43000, 10):
+        allocator = PortAllocator(start, start + 9, timeout=5.0)
+        try:
+            allocator.acquire(10, timeout=0)
+        except TimeoutError:
+            continue
+        allocator.release(tuple(range(start, start + 10)))
+        return PortAllocator(start, start + 9, timeout=5.0)
+    pytest.skip("no free range of ports")
+
+
+def test_atomic_write_replaces_file(tmp_path):
+    filename = str(tmp_path / 'nested' / 'file.txt')
+    with atomic_write(filename) as f:
+        f.write('first')
+    with atomic_write(filename, 'wb', permissions=0o644) as f:
+        f.write(b'second')
+    with open(filename) as f:
+        assert f.read() == 'second'
+    assert os.stat(filename).st_mode & 0o777 == 0o644
+    assert os.listdir(os.path.dirname(filename)) == ['file.txt']
+
+
+def test_atomic_write_removes_temporary_file_on_failure(tmp_path):
+    filename = str(tmp_path / 'file.txt')
+    with atomic_write(filename) as f:
+        f.write('original')
+    with pytest.raises(RuntimeError):
+        with atomic_write(filename) as f:
+            f.write('partial')
+            raise RuntimeError
+    with open(filename) as f:
+        assert f.read() == 'original'
+    assert os.listdir(str(tmp_path)) == ['file.txt']
+
+
+def test_leased_ports_are_not_reused_until_released(ports):
+    first = ports.acquire(4)
+    second = ports.acquire(4)
+    assert not set(first) & set(second)
+    assert ports.in_use == 8
+    ports.release(first)
+    # released ports are leased again only after all other free ports
+    third = ports.acquire(4)
+    assert third[:2] == (ports.start + 8, ports.start + 9)
+    assert set(third[2:]) <= set(first)
+    assert (ports.leases, ports.contention) == (3, 0)
+
+
+def test_ports_held_by_other_processes_are_skipped(ports):
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_DGRAM)) as s:
+        s.bind(('127.0.0.1', ports.start))
+        with ports.lease(3) as leased:
+            assert ports.start not in leased
+        assert ports.probe_failures == 1
+
+
+def test_lease_waits_for_released_ports(ports):
+    held = ports.acquire(9)
+    leased = []
+    thread = threading.Thread(target=lambda: leased.extend(ports.acquire(2)))
+    thread.start()
+    time.sleep(0.2)
+    assert not leased
+    ports.release(held[:1])
+    thread.join(5.0)
+    assert set(leased) == {held[0], ports.stop}
+    assert ports.contention == 1
+    assert ports.wait_time >= 0.2
+
+
+def test_lease_times_out(ports):
+    ports.acquire(9)
+    with pytest.raises(TimeoutError):
+        ports.acquire(2, timeout=0.1)
+    with pytest.raises(ValueError):
+        ports.acquire(11)
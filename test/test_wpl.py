@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import glob
+import os
+
+import pytest
+
+from darjeeling_ardupilot.wpl import parse_wpl, read_wpl, sidecar_filename
+
+DIR_SCENARIOS = os.path.join(os.path.dirname(__file__), '..', 'scenarios')
+MISSION_FILENAMES = \
+    sorted(glob.glob(os.path.join(DIR_SCENARIOS, '*', '*.txt')))
+
+CONTENTS = (b'QGC WPL 110\n'
+            b'0\t1\t0\t16\t0\t0\t0\t0\t-35.36\t149.16\t584.0\t1\n'
+            b'1\t0\t3\t22\t0\t0\t0\t0\t0\t0\t20\t1\n'
+            b'\n'
+            b'2\t0\t3\t16\t2.5\t0\t0\t0\t-35.37\t149.17\t20\t1\n')
+
+
+def test_parse_skips_header_and_blank_lines():
+    assert parse_wpl(CONTENTS) == [
+        (0, 16, 0.0, 0.0, 0.0, 0.0, -35.36, 149.16, 584.0),
+        (3, 22, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 20.0),
+        (3, 16, 2.5, 0.0, 0.0, 0.0, -35.37, 149.17, 20.0)]
+
+
+def test_parse_rejects_malformed_items():
+    with pytest.raises(ValueError, match='line 3'):
+        parse_wpl(b'QGC WPL 110\n0 1 0 16 0 0 0 0 1 2 3 1\n1 0 3 x\n')
+
+
+def parse_line(line):
+    """Parses a single WPL line by splitting it on whitespace."""
+    args = line.split()
+    return (int(args[2]), int(args[3])) \
+        + tuple(float(arg) for arg in args[4:11])
+
+
+@pytest.mark.parametrize('filename', MISSION_FILENAMES)
+def test_parse_matches_line_parser(filename):
+    with open(filename, 'rb') as f:
+        items = parse_wpl(f.read())
+    with open(filename) as f:
+        lines = [line for line in f.readlines()[1:] if line.strip()]
+    assert items == [parse_line(line) for line in lines]
+
+
+def test_sidecar_is_written_and_reused(tmp_path):
+    filename = str(tmp_path / 'mission.txt')
+    with open(filename, 'wb') as f:
+        f.write(CONTENTS)
+    expected = tuple(parse_wpl(CONTENTS))
+    assert read_wpl(filename) == expected
+    assert os.path.exists(sidecar_filename(filename))
+
+    # the sidecar is trusted while the size and mtime of the file match
+    stat = os.stat(filename)
+    with open(filename, 'wb') as f:
+        f.write(CONTENTS.replace(b'2.5', b'7.5'))
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert read_wpl(filename) == expected
+    assert read_wpl(filename, sidecar=False) != expected
+
+
+def test_sidecar_survives_touch_but_not_edit(tmp_path):
+    filename = str(tmp_path / 'mission.txt')
+    with open(filename, 'wb') as f:
+        f.write(CONTENTS)
+    read_wpl(filename)
+
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert read_wpl(filename) == tuple(parse_wpl(CONTENTS))
+
+    edited = CONTENTS.replace(b'2.5', b'7.5')
+    with open(filename, 'wb') as f:
+        f.write(edited)
+    assert read_wpl(filename) == tuple(parse_wpl(edited))
+
+
+def test_corrupt_sidecar_is_ignored(tmp_path):
+    filename = str(tmp_path / 'mission.txt')
+    with open(filename, 'wb') as f:
+        f.write(CONTENTS)
+    read_wpl(filename)
+    fn_sidecar = sidecar_filename(filename)
+    with open(fn_sidecar, 'r+b') as f:
+        f.truncate(os.path.getsize(fn_sidecar) - 1)
+    assert read_wpl(filename) == tuple(parse_wpl(CONTENTS))